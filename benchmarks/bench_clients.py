@@ -0,0 +1,73 @@
+"""
+Benchmark du surcoût par requête lié aux clients Gemini
+
+Compare l'ancien comportement (load_dotenv() + genai.Client(...) à chaque
+transcription / synthèse) au registre partagé de core/clients.py.
+Avec --live, mesure aussi la latence réelle d'un appel léger (models.get)
+avec un client neuf à chaque fois vs un client réutilisé (keep-alive TLS).
+
+Usage :
+    python benchmarks/bench_clients.py [-n 50] [--live]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "core"))
+
+from dotenv import load_dotenv
+from google import genai
+
+import clients
+from config import Config
+
+
+def _measure(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def _report(label, samples):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1] if len(samples) > 1 else samples[0]
+    print(f"{label:<32} mean={statistics.mean(samples):8.3f} ms  p50={statistics.median(samples):8.3f} ms  p95={p95:8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--iterations", type=int, default=50)
+    parser.add_argument("--live", action="store_true", help="Inclure des appels réels à l'API Gemini")
+    args = parser.parse_args()
+
+    api_key = Config.GENAI_API_KEY or "benchmark-placeholder-key"
+
+    def per_request_client():
+        load_dotenv()
+        return genai.Client(api_key=api_key)
+
+    def shared_client():
+        return clients.get_genai_client(api_key)
+
+    print(f"Surcoût de préparation du client ({args.iterations} itérations)")
+    _report("avant: load_dotenv + Client()", _measure(per_request_client, args.iterations))
+    shared_client()  # création initiale, faite dans lifespan en production
+    _report("après: registre partagé", _measure(shared_client, args.iterations))
+
+    if args.live:
+        if not Config.GENAI_API_KEY:
+            print("--live ignoré : GENAI_API_KEY n'est pas défini")
+            return
+        model = "models/gemini-2.0-flash-exp"
+        print(f"\nLatence d'un appel models.get ({args.iterations} itérations)")
+        _report("avant: client neuf par appel", _measure(lambda: per_request_client().models.get(model=model), args.iterations))
+        _report("après: client réutilisé", _measure(lambda: shared_client().models.get(model=model), args.iterations))
+
+
+if __name__ == "__main__":
+    main()
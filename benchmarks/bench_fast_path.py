@@ -0,0 +1,88 @@
+"""
+Couverture, précision et latence du chemin rapide (core/fast_path.py)
+
+Le corpus étiqueté fast_path_corpus.jsonl contient une commande par ligne :
+    {"text": ..., "intent": "set", "changes": {...}}
+    {"text": ..., "intent": "query", "fields": [...]}
+    {"text": ..., "intent": null}      -> doit être laissée au LLM
+
+- couverture : part des commandes simples (set/query) prises en charge localement
+- précision  : part des prises en charge dont l'intention et les champs sont exacts
+- faux accepts : commandes à laisser au LLM mais interceptées (à garder à 0)
+
+Usage :
+    python benchmarks/bench_fast_path.py [--min-confidence 0.9] [-v]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "core"))
+
+from fast_path import parse_intent, try_fast_path
+from config import Config
+
+STATE = {
+    "salon": False, "cuisine": True, "chambre": False, "exterieur": False, "garage": False,
+    "smoke": False, "presence": True, "auth": True, "door1": "off", "door2": "on",
+    "time": "12:00:00---17Octobre2026",
+}
+
+
+def _matches(case, intent):
+    if intent["intent"] != case["intent"]:
+        return False
+    if case["intent"] == "set":
+        return intent["changes"] == case["changes"]
+    return intent["fields"] == case["fields"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=os.path.join(HERE, "fast_path_corpus.jsonl"))
+    parser.add_argument("--min-confidence", type=float, default=Config.FAST_PATH_MIN_CONFIDENCE)
+    parser.add_argument("-v", "--verbose", action="store_true", help="Afficher les erreurs")
+    args = parser.parse_args()
+
+    with open(args.corpus, encoding="utf-8") as f:
+        corpus = [json.loads(line) for line in f if line.strip()]
+
+    simple = handled = correct = false_accepts = 0
+    for case in corpus:
+        intent = parse_intent(case["text"])
+        accepted = try_fast_path(case["text"], STATE, args.min_confidence) is not None
+        if case["intent"] is None:
+            if accepted:
+                false_accepts += 1
+                if args.verbose:
+                    print(f"FAUX ACCEPT  {case['text']!r} -> {intent}")
+            continue
+        simple += 1
+        if accepted:
+            handled += 1
+            if _matches(case, intent):
+                correct += 1
+            elif args.verbose:
+                print(f"ERREUR       {case['text']!r} -> {intent}")
+        elif args.verbose:
+            print(f"NON COUVERT  {case['text']!r} -> {intent}")
+
+    iterations = 200
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for case in corpus:
+            try_fast_path(case["text"], STATE, args.min_confidence)
+    per_call_us = (time.perf_counter() - start) / (iterations * len(corpus)) * 1e6
+
+    print(f"Corpus              : {len(corpus)} commandes ({simple} simples, {len(corpus) - simple} pour le LLM)")
+    print(f"Couverture          : {handled}/{simple} ({handled / simple:.1%})")
+    print(f"Précision           : {correct}/{handled} ({correct / handled if handled else 0:.1%})")
+    print(f"Faux accepts        : {false_accepts}")
+    print(f"Latence par commande: {per_call_us:.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,572 @@
+"""
+Suite de mesures de charge et de latence, reproductible, sans appel à l'API réelle
+
+Lance le faux serveur Gemini (latence et pannes réglables) puis l'application
+(socket_app) dans un processus séparé, et pour chaque scénario envoie des
+requêtes à concurrence fixe pendant une durée fixe :
+  - transcribe : POST /transcribe avec un enregistrement WAV synthétique
+  - process : POST /process (commande texte, LLM puis synthèse en arrière-plan)
+  - audio : GET /audio de la dernière réponse de la session
+  - socketio : stt_start / stt_audio / stt_stop jusqu'à l'événement process_result
+  - state : state_update (mise à jour incrémentale) jusqu'à l'accusé de réception
+Pour chaque scénario : débit, latences p50/p95/p99, erreurs par code et retard de
+la boucle d'événements du serveur (échantillonné dans son processus).
+
+Les caches (réponses, chemin rapide, synthèse) sont désactivés et chaque requête
+est différente : chaque mesure passe par le faux Gemini.
+Les résultats sont enregistrés en JSON (commit, paramètres, mesures) ; --baseline
+compare à un résultat précédent et signale les régressions (code de sortie 1).
+
+Usage :
+    python benchmarks/bench_suite.py [--scenarios transcribe,process,audio,socketio,state]
+        [--concurrency 16] [--duration 10] [--latency-ms 300] [--error-rate 0.05]
+        [--env LLM_STREAMING_ENABLED=false] [--output resultats.json] [--baseline precedent.json]
+"""
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import platform
+import shutil
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+from datetime import datetime, timezone
+
+import httpx
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+CORE = os.path.join(ROOT, "core")
+FAKE_GEMINI = os.path.join(ROOT, "benchmarks", "fake_gemini.py")
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+SCENARIOS = ("transcribe", "process", "audio", "socketio", "state")
+QUESTIONS = [
+    "quelle est la différence entre une ampoule led et une ampoule halogène question {}",
+    "raconte moi une courte histoire sur une maison connectée numéro {}",
+    "comment économiser de l'énergie dans une grande maison cas {}",
+]
+LAG_PATH = "/__bench/lag"
+SAMPLE_RATE = 16000
+
+
+# --- Processus serveur : application + échantillonnage du retard de la boucle ---
+
+class LoopLagSampler:
+    """Retard de réveil d'une tâche qui dort à intervalle fixe (ms) : temps pendant lequel la boucle était bloquée"""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - start - self.interval) * 1000)
+
+    def collect(self):
+        """Retourne les échantillons depuis le dernier appel (démarre l'échantillonnage au premier)"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        samples, self.samples = self.samples, []
+        return samples
+
+
+def serve(port):
+    """Point d'entrée du processus serveur (lancé par la suite avec --serve)"""
+    sys.path.insert(0, CORE)
+    os.chdir(CORE)
+    import uvicorn
+    from main import socket_app
+
+    sampler = LoopLagSampler()
+
+    async def app(scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == LAG_PATH:
+            body = json.dumps(sampler.collect()).encode("utf-8")
+            await send({"type": "http.response.start", "status": 200,
+                        "headers": [(b"content-type", b"application/json")]})
+            await send({"type": "http.response.body", "body": body})
+            return
+        await socket_app(scope, receive, send)
+
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+# --- Client Socket.IO minimal ---
+
+class SocketIOClient:
+    """
+    Client Socket.IO minimal (Engine.IO v4 sur WebSocket, espace de noms "/") :
+    le client de python-socketio demande aiohttp, absent des dépendances du projet
+    """
+
+    def __init__(self, base_url):
+        self.url = base_url.replace("http://", "ws://", 1) + "/socket.io/?EIO=4&transport=websocket"
+        self.events = asyncio.Queue()
+        self._acks = {}
+        self._next_id = 0
+        self._connected = None
+        self._reader = None
+        self._ws = None
+
+    async def connect(self, timeout=10):
+        import websockets
+        self._ws = await websockets.connect(self.url, max_size=None)
+        await self._ws.recv()  # paquet "open" d'Engine.IO
+        self._connected = asyncio.get_running_loop().create_future()
+        self._reader = asyncio.create_task(self._read())
+        await self._ws.send("40")
+        await asyncio.wait_for(self._connected, timeout)
+
+    async def close(self):
+        if self._reader:
+            self._reader.cancel()
+        if self._ws:
+            await self._ws.close()
+
+    async def _read(self):
+        async for message in self._ws:
+            # Pièces jointes binaires des événements du serveur (audio) : ignorées
+            if isinstance(message, bytes):
+                continue
+            if message == "2":
+                await self._ws.send("3")
+            elif message.startswith("4") and len(message) > 1:
+                self._packet(message[1], message[2:])
+
+    def _packet(self, kind, data):
+        if kind == "0":
+            if not self._connected.done():
+                self._connected.set_result(True)
+            return
+        start = data.find("[")
+        if start < 0:
+            return
+        # Préfixe : "<pièces jointes>-" pour les paquets binaires, puis l'identifiant d'accusé
+        ack_id = data[:start].split("-")[-1]
+        payload = json.loads(data[start:])
+        if kind in ("3", "6"):
+            future = self._acks.pop(int(ack_id), None)
+            if future and not future.done():
+                future.set_result(payload[0] if payload else None)
+        elif kind in ("2", "5"):
+            self.events.put_nowait((payload[0], payload[1:]))
+
+    async def emit(self, event, data=None, binary=None):
+        """Émet un événement ; binary (bytes) est envoyé en pièce jointe"""
+        if binary is not None:
+            await self._ws.send("451-" + json.dumps([event, {"_placeholder": True, "num": 0}]))
+            await self._ws.send(binary)
+        else:
+            await self._ws.send("42" + json.dumps([event, data]))
+
+    async def call(self, event, data=None, timeout=30):
+        """Émet un événement et attend l'accusé de réception du serveur"""
+        ack_id, self._next_id = self._next_id, self._next_id + 1
+        future = asyncio.get_running_loop().create_future()
+        self._acks[ack_id] = future
+        await self._ws.send(f"42{ack_id}" + json.dumps([event, data]))
+        return await asyncio.wait_for(future, timeout)
+
+    async def wait_for(self, names, timeout=30):
+        """Attend le premier événement parmi names ; retourne (nom, arguments)"""
+        async def next_match():
+            while True:
+                name, args = await self.events.get()
+                if name in names:
+                    return name, args
+        return await asyncio.wait_for(next_match(), timeout)
+
+
+# --- Scénarios ---
+
+def _speech_wav(seconds=1.5):
+    """Enregistrement synthétique assez fort pour ne pas être écarté comme silence"""
+    frames = bytearray()
+    for i in range(int(seconds * SAMPLE_RATE)):
+        t = i / SAMPLE_RATE
+        envelope = 0.5 + 0.5 * math.sin(2 * math.pi * 3 * t)
+        frames += struct.pack("<h", int(12000 * envelope * math.sin(2 * math.pi * 220 * t)))
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as output:
+        output.setnchannels(1)
+        output.setsampwidth(2)
+        output.setframerate(SAMPLE_RATE)
+        output.writeframes(bytes(frames))
+    return buffer.getvalue()
+
+
+def _unique(wav, counter):
+    """Copie de l'enregistrement dont un échantillon dépend de counter (pas de requêtes identiques regroupées)"""
+    middle = len(wav) // 2 & ~1
+    return wav[:middle] + struct.pack("<H", counter % 65536) + wav[middle + 2:]
+
+
+class Scenario:
+    """Clients en boucle fermée : setup une fois par client, puis run jusqu'à l'échéance"""
+
+    def __init__(self, base_url, wav):
+        self.base_url = base_url
+        self.wav = wav
+        self.counter = 0
+        self.homes = {}
+
+    def next_id(self):
+        self.counter += 1
+        return self.counter
+
+    async def home_id(self, client_id):
+        """Maison du client (créée par POST /home au premier appel)"""
+        if client_id not in self.homes:
+            async with httpx.AsyncClient(base_url=self.base_url, timeout=30) as http:
+                self.homes[client_id] = (await http.post("/home")).json()["home_id"]
+        return self.homes[client_id]
+
+    async def setup(self, client_id):
+        return httpx.AsyncClient(base_url=self.base_url, timeout=30)
+
+    async def teardown(self, client):
+        await client.aclose()
+
+    async def run(self, client, client_id):
+        """Une requête ; retourne None si elle a réussi, le code d'erreur sinon"""
+        raise NotImplementedError
+
+
+class TranscribeScenario(Scenario):
+    async def run(self, client, client_id):
+        audio = _unique(self.wav, self.next_id())
+        response = await client.post("/transcribe", files={"audio": ("bench.wav", audio, "audio/wav")})
+        return None if response.status_code == 200 else response.status_code
+
+
+class ProcessScenario(Scenario):
+    async def run(self, client, client_id):
+        counter = self.next_id()
+        text = QUESTIONS[counter % len(QUESTIONS)].format(counter)
+        response = await client.post("/process", json={"text": text, "home_id": await self.home_id(client_id)})
+        return None if response.status_code == 200 else response.status_code
+
+
+class AudioScenario(Scenario):
+    async def setup(self, client_id):
+        # Une réponse par session (cookie du client), puis attente de sa synthèse
+        client = await super().setup(client_id)
+        await client.post("/process", json={"text": QUESTIONS[0].format(client_id), "home_id": await self.home_id(client_id)})
+        deadline = time.monotonic() + 30
+        while (await client.get("/audio")).status_code != 200:
+            if time.monotonic() > deadline:
+                raise RuntimeError("audio de la session jamais disponible")
+            await asyncio.sleep(0.1)
+        return client
+
+    async def run(self, client, client_id):
+        response = await client.get("/audio")
+        return None if response.status_code == 200 and response.content else response.status_code
+
+
+class SocketIOScenario(Scenario):
+    async def setup(self, client_id):
+        client = SocketIOClient(self.base_url)
+        await client.connect()
+        return client
+
+    async def teardown(self, client):
+        await client.close()
+
+    async def run(self, client, client_id):
+        counter = self.next_id()
+        # Événements restés d'une requête précédente (expirée) : ne pas les compter pour celle-ci
+        while not client.events.empty():
+            client.events.get_nowait()
+        # Session attribuée à la connexion
+        started = await client.call("stt_start", {"format": "wav", "home_id": await self.home_id(client_id)})
+        if not started.get("ok"):
+            return "stt_start"
+        await client.emit("stt_audio", binary=_unique(self.wav, counter))
+        await client.emit("stt_stop")
+        name, _ = await client.wait_for(("process_result", "process_error", "stt_error"))
+        return None if name == "process_result" else name
+
+
+class StateScenario(SocketIOScenario):
+    async def setup(self, client_id):
+        client = await super().setup(client_id)
+        client.version = (await client.call("get_state", {"home_id": await self.home_id(client_id)}))["version"]
+        return client
+
+    async def run(self, client, client_id):
+        result = await client.call("state_update", {
+            "home_id": await self.home_id(client_id), "version": client.version, "state": {"salon": self.next_id() % 2 == 0}
+        })
+        client.version = result.get("version", client.version)
+        return None if result.get("ok") else "rejected"
+
+
+SCENARIO_CLASSES = {
+    "transcribe": TranscribeScenario,
+    "process": ProcessScenario,
+    "audio": AudioScenario,
+    "socketio": SocketIOScenario,
+    "state": StateScenario,
+}
+
+
+async def _drive(scenario, concurrency, duration):
+    """Clients en boucle fermée pendant duration secondes ; retourne (latences en ms, erreurs par code)"""
+    latencies, errors = [], {}
+    deadline = time.monotonic() + duration
+
+    async def worker(client_id):
+        client = await scenario.setup(client_id)
+        try:
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                try:
+                    error = await scenario.run(client, client_id)
+                except (httpx.HTTPError, asyncio.TimeoutError, OSError) as e:
+                    error = type(e).__name__
+                if error is None:
+                    latencies.append((time.perf_counter() - start) * 1000)
+                else:
+                    errors[str(error)] = errors.get(str(error), 0) + 1
+        finally:
+            await scenario.teardown(client)
+
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    return latencies, errors
+
+
+def _percentile(samples, percentile):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percentile))]
+
+
+def _summary(samples):
+    if not samples:
+        return None
+    return {
+        "p50": round(statistics.median(samples), 2),
+        "p95": round(_percentile(samples, 0.95), 2),
+        "p99": round(_percentile(samples, 0.99), 2),
+        "mean": round(statistics.fmean(samples), 2),
+        "max": round(max(samples), 2),
+    }
+
+
+async def run_scenario(name, base_url, wav, args):
+    scenario = SCENARIO_CLASSES[name](base_url, wav)
+    async with httpx.AsyncClient(base_url=base_url, timeout=10) as http:
+        if args.warmup > 0:
+            await _drive(scenario, args.concurrency, args.warmup)
+        await http.get(LAG_PATH)
+        start = time.monotonic()
+        latencies, errors = await _drive(scenario, args.concurrency, args.duration)
+        elapsed = time.monotonic() - start
+        loop_lag = (await http.get(LAG_PATH)).json()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput": round(len(latencies) / elapsed, 2),
+        "latency_ms": _summary(latencies),
+        "loop_lag_ms": _summary(loop_lag),
+    }
+
+
+# --- Comparaison avec un résultat précédent ---
+
+# (mesure, sens de l'amélioration) : +1 plus grand est mieux, -1 plus petit est mieux
+COMPARED = (
+    (("throughput",), 1),
+    (("latency_ms", "p50"), -1),
+    (("latency_ms", "p95"), -1),
+    (("latency_ms", "p99"), -1),
+    (("loop_lag_ms", "p99"), -1),
+)
+
+
+def _lookup(result, path):
+    for key in path:
+        result = (result or {}).get(key)
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """Affiche l'écart avec baseline ; retourne les régressions au-delà de tolerance (fraction)"""
+    regressions = []
+    print(f"\nComparaison avec {baseline.get('commit') or '?'} ({baseline.get('date', '?')})")
+    if baseline.get("settings") != results["settings"]:
+        print("  Attention : paramètres différents, les écarts ne sont pas comparables")
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        for path, direction in COMPARED:
+            before, after = _lookup(previous, path), _lookup(current, path)
+            # Valeurs trop petites (retard de boucle < 1 ms) : écart relatif sans signification
+            if not before or after is None or before < 1:
+                continue
+            change = (after - before) / before
+            worse = -change * direction
+            flag = "  RÉGRESSION" if worse > tolerance else ""
+            if flag:
+                regressions.append(f"{name} {'.'.join(path)}")
+            print(f"  {name:<11} {'.'.join(path):<16} {before:>10.1f} -> {after:>10.1f} {change:>+8.1%}{flag}")
+    return regressions
+
+
+# --- Orchestration ---
+
+def _wait_ready(url, timeout=30):
+    start = time.monotonic()
+    while time.monotonic() - start < timeout:
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} ne répond pas")
+
+
+def _git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("-dirty" if dirty else "")
+
+
+def _app_env(args, fake_url, data_dir):
+    env = dict(
+        os.environ,
+        GEMINI_BASE_URL=fake_url,
+        GEMINI_API_KEY="bench",
+        GENAI_API_KEY="bench",
+        SESSION_SECRET_KEY="bench-secret",
+        TTS_CACHE_DIR=os.path.join(data_dir, "tts_cache"),
+        AUDIO_OUTPUT_DIR=os.path.join(data_dir, "audio"),
+        RESPONSE_CACHE_ENABLED="false",
+        FAST_PATH_ENABLED="false",
+        TTS_CACHE_ENABLED="false",
+    )
+    env.update(args.env_overrides)
+    return env
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Scénarios à mesurer")
+    parser.add_argument("--concurrency", type=int, default=16, help="Clients simultanés")
+    parser.add_argument("--duration", type=float, default=10, help="Durée de chaque mesure (s)")
+    parser.add_argument("--warmup", type=float, default=2, help="Mise en route avant chaque mesure (s)")
+    parser.add_argument("--latency-ms", type=float, default=300, help="Latence du faux Gemini")
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Part des appels Gemini en 503")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Part des appels Gemini en 429")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Part des appels Gemini très lents")
+    parser.add_argument("--slow-ms", type=float, default=3000)
+    parser.add_argument("--audio-ms", type=int, default=1500, help="Durée de l'audio TTS généré")
+    parser.add_argument("--env", action="append", default=[], metavar="CLÉ=VALEUR",
+                        help="Variable d'environnement de l'application (répétable)")
+    parser.add_argument("--output", help="Fichier JSON des résultats (défaut : benchmarks/results/<date>-<commit>.json)")
+    parser.add_argument("--baseline", help="Résultats précédents à comparer")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Dégradation tolérée avant de signaler une régression")
+    parser.add_argument("--port", type=int, default=5200)
+    parser.add_argument("--fake-port", type=int, default=8092)
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve)
+        return
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIO_CLASSES]
+    if unknown:
+        parser.error(f"scénarios inconnus : {', '.join(unknown)}")
+    args.env_overrides = dict(item.split("=", 1) for item in args.env)
+
+    fake_settings = {
+        "latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms, "error_rate": args.error_rate,
+        "rate_limit_rate": args.rate_limit_rate, "slow_rate": args.slow_rate, "slow_ms": args.slow_ms,
+        "audio_ms": args.audio_ms,
+    }
+    fake_url = f"http://127.0.0.1:{args.fake_port}"
+    base_url = f"http://127.0.0.1:{args.port}"
+    fake_args = []
+    for key, value in fake_settings.items():
+        fake_args += [f"--{key.replace('_', '-')}", str(value)]
+    fake = subprocess.Popen([sys.executable, FAKE_GEMINI, "--port", str(args.fake_port)] + fake_args,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    data_dir = tempfile.mkdtemp(prefix="bench_suite_")
+    app = None
+    results = {
+        "commit": _git_commit(),
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "settings": {"concurrency": args.concurrency, "duration": args.duration, "warmup": args.warmup,
+                     "fake_gemini": fake_settings, "env": args.env_overrides},
+        "scenarios": {},
+    }
+    wav = _speech_wav()
+    print(f"{args.concurrency} clients, {args.duration:.0f} s par scénario, Gemini {args.latency_ms:.0f} ms "
+          f"(erreurs {args.error_rate:.0%}, 429 {args.rate_limit_rate:.0%}, lents {args.slow_rate:.0%})")
+    print(f"{'scénario':<11} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'erreurs':>8} {'boucle p99':>11} {'max':>7}")
+    try:
+        _wait_ready(f"{fake_url}/fake/stats")
+        app = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", str(args.port)],
+                               env=_app_env(args, fake_url, data_dir),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        _wait_ready(f"{base_url}/state")
+        for name in scenarios:
+            result = asyncio.run(run_scenario(name, base_url, wav, args))
+            results["scenarios"][name] = result
+            latency = result["latency_ms"] or {}
+            lag = result["loop_lag_ms"] or {}
+            print(
+                f"{name:<11} {result['throughput']:>8.1f} {latency.get('p50', 0):>8.1f} {latency.get('p95', 0):>8.1f} "
+                f"{latency.get('p99', 0):>8.1f} {sum(result['errors'].values()):>8} "
+                f"{lag.get('p99', 0):>11.1f} {lag.get('max', 0):>7.1f}"
+            )
+        results["fake_gemini_stats"] = httpx.get(f"{fake_url}/fake/stats", timeout=5).json()
+    finally:
+        if app is not None:
+            app.terminate()
+            app.wait(timeout=30)
+        fake.terminate()
+        fake.wait(timeout=10)
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"{stamp}-{results['commit'] or 'unknown'}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"\nRésultats : {output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} régression(s) au-delà de {args.tolerance:.0%} : {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
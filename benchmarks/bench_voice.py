@@ -0,0 +1,114 @@
+"""
+Benchmark du mode /voice : un appel multimodal vs transcription puis traitement
+
+Pour chaque enregistrement, mesure la latence de bout en bout et les tokens
+consommés (usageMetadata) des deux modes :
+  - deux étapes : modèle principal de transcription puis modèle de commande
+  - un seul appel : modèle de commande vocale avec l'audio joint au prompt
+(modèles de Config.MODEL_ROUTES)
+Le prétraitement audio (mono 16 kHz, silences retirés) est appliqué une fois,
+en amont, pour comparer uniquement les appels à l'API.
+
+Nécessite GENAI_API_KEY et GEMINI_API_KEY (appels réels).
+
+Usage :
+    python benchmarks/bench_voice.py commande1.wav commande2.webm [-n 5]
+        [--state '"salon": false, "cuisine": false']
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "core"))
+
+import clients
+from ai_response import generate_ai_response_async, generate_voice_response_async, token_stats
+from audio_processing import preprocess_audio, resolve_mime_type
+from config import Config
+from model_router import get_router
+from speech_to_text import _build_contents
+
+DEFAULT_STATE = '"salon": false, "cuisine": false, "chambre": false, "exterieur": false, "garage": false, ' \
+                '"smoke": false, "presence": true, "auth": true, "door1": "off", "door2": "off"'
+
+
+def _tokens_snapshot():
+    return token_stats["prompt_tokens"], token_stats["output_tokens"]
+
+
+async def two_step(audio_bytes, mime_type, state):
+    """Transcription (SDK) puis génération de la réponse (REST) ; retourne les tokens"""
+    start_prompt, start_output = _tokens_snapshot()
+    stt = await clients.get_stt_client().aio.models.generate_content(
+        model=get_router("stt").primary, contents=_build_contents(audio_bytes, mime_type)
+    )
+    usage = stt.usage_metadata
+    await generate_ai_response_async(stt.text.strip(), state)
+    prompt_tokens = (usage.prompt_token_count or 0) + token_stats["prompt_tokens"] - start_prompt
+    output_tokens = (usage.candidates_token_count or 0) + token_stats["output_tokens"] - start_output
+    return prompt_tokens, output_tokens
+
+
+async def single_call(audio_bytes, mime_type, state):
+    """Un seul appel multimodal ; retourne les tokens"""
+    start_prompt, start_output = _tokens_snapshot()
+    response = await generate_voice_response_async(audio_bytes, mime_type, state)
+    if "transcription" not in response:
+        print("  attention : réponse sans transcription (le mode /voice repasserait en deux étapes)")
+    return token_stats["prompt_tokens"] - start_prompt, token_stats["output_tokens"] - start_output
+
+
+def _report(label, latencies, prompt_tokens, output_tokens):
+    latencies = sorted(latencies)
+    p95 = latencies[round(0.95 * (len(latencies) - 1))]
+    print(f"{label:<16} mean={statistics.mean(latencies):8.1f} ms  p50={statistics.median(latencies):8.1f} ms  "
+          f"p95={p95:8.1f} ms  tokens in={statistics.mean(prompt_tokens):7.1f} out={statistics.mean(output_tokens):6.1f}")
+
+
+async def run(args):
+    clients.init_clients()
+    samples = []
+    for path in args.files:
+        with open(path, "rb") as f:
+            audio_bytes = f.read()
+        audio_bytes, mime_type = preprocess_audio(audio_bytes, resolve_mime_type(filename=path))
+        samples.append((path, audio_bytes, mime_type))
+
+    results = {"deux étapes": ([], [], []), "un seul appel": ([], [], [])}
+    modes = {"deux étapes": two_step, "un seul appel": single_call}
+    for iteration in range(args.iterations):
+        for path, audio_bytes, mime_type in samples:
+            # Ordre alterné pour ne pas avantager systématiquement le second mode (connexion chaude)
+            order = list(modes.items()) if iteration % 2 == 0 else list(modes.items())[::-1]
+            for label, fn in order:
+                start = time.perf_counter()
+                prompt_tokens, output_tokens = await fn(audio_bytes, mime_type, args.state)
+                latencies, prompts, outputs = results[label]
+                latencies.append((time.perf_counter() - start) * 1000)
+                prompts.append(prompt_tokens)
+                outputs.append(output_tokens)
+
+    print(f"Latence de bout en bout et tokens par commande ({len(samples)} fichiers x {args.iterations})")
+    for label, (latencies, prompts, outputs) in results.items():
+        _report(label, latencies, prompts, outputs)
+    await clients.close_clients()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="+", help="Enregistrements de commandes vocales")
+    parser.add_argument("-n", "--iterations", type=int, default=5)
+    parser.add_argument("--state", default=DEFAULT_STATE, help="Fragment JSON de l'état de la maison")
+    args = parser.parse_args()
+
+    if not (Config.GENAI_API_KEY and Config.GEMINI_API_KEY):
+        print("GENAI_API_KEY et GEMINI_API_KEY doivent être définis (appels réels à l'API)")
+        return
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
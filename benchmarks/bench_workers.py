@@ -0,0 +1,155 @@
+"""
+Débit du serveur selon le nombre de workers uvicorn (WEB_CONCURRENCY)
+
+Lance le faux serveur Gemini, puis pour chaque nombre de workers démarre
+l'application (file Socket.IO "local", registre et état partagés en SQLite)
+et envoie des commandes /process en parallèle pendant une durée fixe.
+Le cache des réponses et le chemin rapide sont désactivés : chaque requête
+passe par le LLM (faux) et la synthèse vocale en arrière-plan.
+
+Usage :
+    python benchmarks/bench_workers.py [--workers 1,2,4] [--concurrency 64] [--duration 15]
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+CORE = os.path.join(ROOT, "core")
+FAKE_GEMINI = os.path.join(ROOT, "benchmarks", "fake_gemini.py")
+
+QUESTIONS = [
+    "quelle est la différence entre une ampoule led et une ampoule halogène question {}",
+    "raconte moi une courte histoire sur une maison connectée numéro {}",
+    "comment économiser de l'énergie dans une grande maison cas {}",
+]
+
+
+def _wait_ready(url, timeout=30):
+    start = time.monotonic()
+    while time.monotonic() - start < timeout:
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} ne répond pas")
+
+
+def _start_app(workers, port, fake_url, data_dir):
+    env = dict(
+        os.environ,
+        WEB_CONCURRENCY=str(workers),
+        GEMINI_BASE_URL=fake_url,
+        GEMINI_API_KEY="bench",
+        GENAI_API_KEY="bench",
+        SESSION_SECRET_KEY="bench-secret",
+        SESSION_REGISTRY_BACKEND="sqlite",
+        SESSION_REGISTRY_PATH=os.path.join(data_dir, "sessions.db"),
+        STATE_STORE_PATH=os.path.join(data_dir, "state.db"),
+        SOCKETIO_LOCAL_DIR=os.path.join(data_dir, "socketio"),
+        TTS_CACHE_DIR=os.path.join(data_dir, "tts_cache"),
+        AUDIO_OUTPUT_DIR=os.path.join(data_dir, "audio"),
+        RESPONSE_CACHE_ENABLED="false",
+        FAST_PATH_ENABLED="false",
+    )
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:socket_app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=CORE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    _wait_ready(f"http://127.0.0.1:{port}/health")
+    return process
+
+
+async def _load(base_url, concurrency, duration):
+    """Clients en boucle fermée pendant duration secondes ; retourne (latences en ms, erreurs)"""
+    latencies, errors = [], 0
+    deadline = time.monotonic() + duration
+    counter = 0
+
+    async def client(client_id):
+        nonlocal errors, counter
+        async with httpx.AsyncClient(base_url=base_url, timeout=30) as http:
+            home_id = (await http.post("/home")).json()["home_id"]
+            while time.monotonic() < deadline:
+                counter += 1
+                text = QUESTIONS[counter % len(QUESTIONS)].format(counter)
+                start = time.perf_counter()
+                try:
+                    response = await http.post("/process", json={"text": text, "home_id": home_id})
+                    if response.status_code == 200:
+                        latencies.append((time.perf_counter() - start) * 1000)
+                    else:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+
+    await asyncio.gather(*(client(i) for i in range(concurrency)))
+    return latencies, errors
+
+
+def _percentile(samples, percentile):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percentile))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default=f"1,2,{os.cpu_count() or 1}", help="Nombres de workers à comparer")
+    parser.add_argument("--concurrency", type=int, default=64, help="Requêtes simultanées")
+    parser.add_argument("--duration", type=float, default=15, help="Durée de chaque mesure (s)")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Latence du faux Gemini")
+    parser.add_argument("--port", type=int, default=5100)
+    parser.add_argument("--fake-port", type=int, default=8091)
+    args = parser.parse_args()
+
+    worker_counts = sorted({int(n) for n in args.workers.split(",") if n.strip()})
+    fake_url = f"http://127.0.0.1:{args.fake_port}"
+    fake = subprocess.Popen(
+        [sys.executable, FAKE_GEMINI, "--port", str(args.fake_port),
+         "--latency-ms", str(args.latency_ms), "--jitter-ms", "0", "--audio-ms", "300"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    print(f"{os.cpu_count()} coeurs, {args.concurrency} requêtes simultanées, {args.duration:.0f} s par mesure")
+    print(f"{'workers':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'erreurs':>8} {'gain':>6}")
+    baseline = None
+    try:
+        _wait_ready(f"{fake_url}/fake/stats")
+        for workers in worker_counts:
+            data_dir = tempfile.mkdtemp(prefix="bench_workers_")
+            app = _start_app(workers, args.port, fake_url, data_dir)
+            try:
+                # Mise en route (connexions, imports paresseux) hors mesure
+                asyncio.run(_load(f"http://127.0.0.1:{args.port}", args.concurrency, 2))
+                latencies, errors = asyncio.run(_load(f"http://127.0.0.1:{args.port}", args.concurrency, args.duration))
+            finally:
+                app.terminate()
+                app.wait(timeout=30)
+                shutil.rmtree(data_dir, ignore_errors=True)
+            if not latencies:
+                print(f"{workers:>7} aucune requête réussie ({errors} erreurs)")
+                continue
+            throughput = len(latencies) / args.duration
+            baseline = baseline or throughput
+            print(
+                f"{workers:>7} {throughput:>8.1f} {statistics.median(latencies):>8.1f} "
+                f"{_percentile(latencies, 0.95):>8.1f} {_percentile(latencies, 0.99):>8.1f} "
+                f"{errors:>8} {throughput / baseline:>5.2f}x"
+            )
+    finally:
+        fake.terminate()
+        fake.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Faux serveur Gemini local, pour tester et mesurer sans appeler l'API réelle
+
+Répond aux mêmes routes que generativelanguage.googleapis.com
+(generateContent, streamGenerateContent?alt=sse) pour les trois usages :
+  - LLM : renvoie l'état reçu avec une assistant_response (JSON), ou le seul diff avec responseSchema
+  - transcription : renvoie un texte fixe quand la requête contient de l'audio
+  - TTS : renvoie du PCM 24 kHz quand responseModalities contient AUDIO
+Latence et pannes sont simulées (erreurs 503, 429 avec Retry-After, latence de queue,
+ou un modèle donné toujours lent / en panne) et modifiables à chaud via POST /fake/config.
+
+Usage :
+    python benchmarks/fake_gemini.py [--port 8090] [--latency-ms 300] [--error-rate 0.1]
+    GEMINI_BASE_URL=http://127.0.0.1:8090 python core/main.py
+"""
+import argparse
+import asyncio
+import base64
+import json
+import random
+import re
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+TRANSCRIPTION = "allume la lumière du salon"
+STATE_PATTERN = re.compile(r"État actuel de la maison : (\{.*?\})\n", re.S)
+
+settings = {
+    "latency_ms": 300.0,
+    "jitter_ms": 50.0,
+    "slow_rate": 0.0,        # part des requêtes très lentes (latence de queue)
+    "slow_ms": 3000.0,
+    "error_rate": 0.0,       # part des requêtes en 503
+    "rate_limit_rate": 0.0,  # part des requêtes en 429
+    "audio_ms": 1500,        # durée de l'audio TTS généré
+    "stream_chunks": 4,
+    "fail_model": "",        # modèle toujours en 503 (test du repli du routeur de modèles)
+    "slow_model": "",        # modèle toujours lent (slow_ms)
+}
+counters = {"requests": 0, "errors": 0, "rate_limited": 0, "slow": 0}
+
+app = FastAPI(title="Fake Gemini")
+
+
+async def _simulate_latency(model):
+    delay = settings["latency_ms"] + random.uniform(-1, 1) * settings["jitter_ms"]
+    if model == settings["slow_model"] or random.random() < settings["slow_rate"]:
+        counters["slow"] += 1
+        delay = settings["slow_ms"]
+    await asyncio.sleep(max(0.0, delay) / 1000)
+
+
+def _injected_failure(model):
+    roll = random.random()
+    if model == settings["fail_model"] or roll < settings["error_rate"]:
+        counters["errors"] += 1
+        return JSONResponse({"error": {"code": 503, "message": "The model is overloaded.", "status": "UNAVAILABLE"}}, status_code=503)
+    if roll < settings["error_rate"] + settings["rate_limit_rate"]:
+        counters["rate_limited"] += 1
+        return JSONResponse(
+            {"error": {"code": 429, "message": "Resource has been exhausted.", "status": "RESOURCE_EXHAUSTED"}},
+            status_code=429, headers={"Retry-After": "1"}
+        )
+    return None
+
+
+def _parts(body):
+    return [part for content in body.get("contents", []) for part in content.get("parts", [])]
+
+
+def _is_tts(body):
+    config = body.get("generationConfig") or body.get("generation_config") or {}
+    return "AUDIO" in (config.get("responseModalities") or config.get("response_modalities") or [])
+
+
+def _text_answer(body):
+    """Réponse textuelle selon la requête : transcription, ou JSON de l'état mis à jour"""
+    parts = _parts(body)
+    prompt = "\n".join(part.get("text", "") for part in parts)
+    has_audio = any("inlineData" in part or "inline_data" in part for part in parts)
+    match = STATE_PATTERN.search(prompt + "\n")
+    if match is None:
+        return TRANSCRIPTION if has_audio else "D'accord."
+
+    # Avec responseSchema (sortie compacte) : seulement les champs modifiés, sinon l'état complet
+    config = body.get("generationConfig") or {}
+    state = {} if "responseSchema" in config else json.loads(match.group(1))
+    state["salon"] = True
+    state["assistant_response"] = "C'est fait, la lumière du salon est allumée. Bonne soirée !"
+    if has_audio:
+        state["transcription"] = TRANSCRIPTION
+    return json.dumps(state, ensure_ascii=False)
+
+
+def _pcm(duration_ms):
+    return b"\0\0" * (24000 * duration_ms // 1000)
+
+
+def _candidate(part):
+    return {"candidates": [{"content": {"role": "model", "parts": [part]}, "finishReason": "STOP"}]}
+
+
+def _usage(body, output_tokens):
+    prompt_chars = sum(len(part.get("text", "")) for part in _parts(body))
+    return {"promptTokenCount": prompt_chars // 4 + 1, "candidatesTokenCount": output_tokens,
+            "totalTokenCount": prompt_chars // 4 + 1 + output_tokens}
+
+
+@app.post("/v1beta/models/{target}")
+async def generate(target: str, request: Request):
+    counters["requests"] += 1
+    model, _, method = target.partition(":")
+    body = await request.json()
+    await _simulate_latency(model)
+    failure = _injected_failure(model)
+    if failure is not None:
+        return failure
+
+    if method == "streamGenerateContent":
+        return StreamingResponse(_stream(body), media_type="text/event-stream")
+
+    if _is_tts(body):
+        audio = base64.b64encode(_pcm(settings["audio_ms"])).decode("ascii")
+        payload = _candidate({"inlineData": {"mimeType": "audio/L16;codec=pcm;rate=24000", "data": audio}})
+    else:
+        text = _text_answer(body)
+        payload = _candidate({"text": text})
+        payload["usageMetadata"] = _usage(body, len(text) // 4 + 1)
+    payload["modelVersion"] = model
+    return JSONResponse(payload)
+
+
+async def _stream(body):
+    """Événements SSE espacés régulièrement, comme une génération réelle"""
+    count = settings["stream_chunks"]
+    interval = settings["latency_ms"] / 1000 / count
+    if _is_tts(body):
+        chunk_ms = settings["audio_ms"] // count
+        pieces = [{"inlineData": {"mimeType": "audio/L16;codec=pcm;rate=24000",
+                                  "data": base64.b64encode(_pcm(chunk_ms)).decode("ascii")}} for _ in range(count)]
+    else:
+        text = _text_answer(body)
+        size = max(1, len(text) // count + 1)
+        pieces = [{"text": text[i:i + size]} for i in range(0, len(text), size)]
+
+    for index, piece in enumerate(pieces):
+        payload = _candidate(piece)
+        if index == len(pieces) - 1 and "text" in piece:
+            payload["usageMetadata"] = _usage(body, sum(len(p["text"]) for p in pieces) // 4 + 1)
+        yield f"data: {json.dumps(payload, ensure_ascii=False)}\r\n\r\n"
+        await asyncio.sleep(interval)
+
+
+@app.get("/v1beta/models/{model}")
+async def get_model(model: str):
+    """Métadonnées d'un modèle (utilisé par la sonde de /health)"""
+    return {"name": f"models/{model}", "displayName": model}
+
+
+@app.get("/fake/stats")
+async def fake_stats():
+    return {"settings": settings, "counters": counters}
+
+
+@app.post("/fake/config")
+async def fake_config(request: Request):
+    """Modifie la latence ou le taux de pannes pendant un test"""
+    updates = await request.json()
+    for key, value in updates.items():
+        if key in settings:
+            settings[key] = type(settings[key])(value)
+    return settings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    for key, value in settings.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=type(value), default=value)
+    args = parser.parse_args()
+    for key in settings:
+        settings[key] = getattr(args, key)
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,12 +5,34 @@ Utilise l'API Gemini de Google
 """
 import os
 import json
-import requests
+import base64
+import httpx
 from dotenv import load_dotenv
 
+from clients import get_http_client
+from home_state import parse_home_state, canonical_state, merge_state_diff
+from singleflight import content_key, get_flight
+from upstream import classify_error, describe_http_error
+from model_router import classify_request, get_router
+from config import Config
+from metrics import LLM_TOKENS, stage
+from prompts import (
+    SYSTEM_PROMPT, SYSTEM_PROMPT_TOKENS, RESPONSE_SCHEMA, VOICE_RESPONSE_SCHEMA,
+    build_user_prompt, build_voice_prompt, estimate_tokens
+)
+
 # Charger les variables d'environnement
 load_dotenv()
 
+# Consommation de tokens cumulée (exposée sur /stats)
+token_stats = {
+    "requests": 0,
+    "estimated_prompt_tokens": 0,
+    "prompt_tokens": 0,
+    "output_tokens": 0,
+    "last_prompt_tokens": 0,
+}
+
 class AIResponseGenerator:
     """Générateur de réponses IA pour l'assistant Homelinks"""
     
@@ -19,161 +41,222 @@ class AIResponseGenerator:
         if not self.api_key:
             raise ValueError("GEMINI_API_KEY is not set in environment variables")
         
-        self.model = "gemini-2.5-flash-lite"
-        self.api_url = f"https://generativelanguage.googleapis.com/v1beta/models/{self.model}:generateContent"
+        # Modèles choisis par requête (model_router, configurés dans Config.MODEL_ROUTES)
+        # La clé passe en en-tête : httpx journalise les URL de requête
+        self.headers = {
+            "Content-Type": "application/json",
+            "x-goog-api-key": self.api_key,
+        }
         
-    def generate_response(self, user_text, home_state=""):
+    async def generate_response_async(self, user_text, home_state="", http_client=None):
         """
         Génère une réponse IA basée sur le texte utilisateur et l'état de la maison
+        (httpx, via la couche upstream : disjoncteur, nouvelles tentatives, échéance)
         
         Args:
             user_text (str): Le texte de commande de l'utilisateur
-            home_state (str): L'état actuel de la maison en JSON
+            home_state (dict | str): L'état actuel de la maison (dict, ou fragment JSON)
+            http_client (httpx.AsyncClient): Client HTTP à utiliser.
+                Par défaut, le client partagé du registre (pool de connexions).
             
         Returns:
             dict: Réponse JSON avec les commandes et assistant_response
         """
+        if isinstance(home_state, str):
+            home_state = parse_home_state(home_state)
+        route = classify_request(user_text)
+        data = self._build_request_data(user_text, home_state, route)
         
-        # Construction du prompt système
-        system_prompt = self._build_system_prompt(home_state)
-        
-        # Configuration de la requête API pour Gemini
-        headers = {
-            "Content-Type": "application/json",
-        }
+        client = http_client or get_http_client()
+        return complete_response(home_state, await self._post_async(client, route, data))
+
+    async def generate_voice_response_async(self, audio_bytes, mime_type, home_state="", http_client=None):
+        """
+        Transcrit et traite une commande vocale en un seul appel multimodal
         
-        # Format de données pour Gemini
-        data = {
-            "contents": [
-                {
-                    "parts": [
-                        {
-                            "text": f"{system_prompt}\n\nUtilisateur: {user_text}"
-                        }
-                    ]
-                }
-            ],
-            "generationConfig": {
-                "temperature": 0.1,
-                "topP": 0.9,
-                "maxOutputTokens": 8192,
-                "responseMimeType": "application/json"
-            }
-        }
+        Args:
+            audio_bytes (bytes): Enregistrement de l'utilisateur
+            mime_type (str): Type MIME de l'enregistrement
+            home_state (dict | str): L'état actuel de la maison
+            http_client (httpx.AsyncClient): Client HTTP à utiliser (partagé par défaut)
+            
+        Returns:
+            dict: Réponse JSON avec les commandes, assistant_response et transcription
+        """
+        if isinstance(home_state, str):
+            home_state = parse_home_state(home_state)
+        data = self._build_voice_request_data(audio_bytes, mime_type, home_state)
         
-        # Ajouter la clé API à l'URL
-        url_with_key = f"{self.api_url}?key={self.api_key}"
+        client = http_client or get_http_client()
+        return complete_response(home_state, await self._post_async(client, "voice", data))
+
+    async def stream_response_async(self, user_text, home_state="", http_client=None):
+        """
+        Génère la réponse en streaming (streamGenerateContent, Server-Sent Events)
         
-        try:
-            response = requests.post(url_with_key, headers=headers, json=data, timeout=30)
-            response.raise_for_status()
-            resp = response.json()
+        Args:
+            user_text (str): Le texte de commande de l'utilisateur
+            home_state (dict | str): L'état actuel de la maison
+            http_client (httpx.AsyncClient): Client HTTP à utiliser (partagé par défaut)
             
-            if 'candidates' not in resp or not resp['candidates']:
-                raise ValueError("Invalid API response: no candidates found")
-                
-            if 'content' not in resp['candidates'][0] or 'parts' not in resp['candidates'][0]['content']:
-                raise ValueError("Invalid API response: no content parts found")
-                
-            content = resp['candidates'][0]['content']['parts'][0]['text']
-            try:
-                return json.loads(content)
-            except json.JSONDecodeError as e:
-                raise ValueError(f"Failed to parse JSON response: {e}")
-                
-        except requests.exceptions.Timeout:
-            raise ValueError("API request timed out")
-        except requests.exceptions.ConnectionError:
-            raise ValueError("Failed to connect to API")
-        except requests.exceptions.HTTPError as e:
-            error_detail = ""
-            try:
-                error_json = e.response.json()
-                if 'error' in error_json:
-                    error_detail = f": {error_json['error'].get('message', 'Unknown error')}"
-            except:
-                error_detail = f": {e.response.text}"
-            raise ValueError(f"API request failed with status {e.response.status_code}{error_detail}")
-        except requests.exceptions.RequestException as e:
-            raise ValueError(f"API request failed: {str(e)}")
-    
-    def _build_system_prompt(self, home_state):
-        """Construit le prompt système pour l'IA"""
+        Yields:
+            str: Morceaux successifs du texte JSON produit par le modèle
+                (en sortie compacte, à compléter avec complete_response)
+        """
+        client = http_client or get_http_client()
+        route = classify_request(user_text)
+        data = self._build_request_data(user_text, home_state, route)
+        usage = None
         
-        commands = "{" + home_state + "}" if home_state else "{}"
+        async def open_stream(model, timeout):
+            request = client.build_request(
+                "POST", self._url(model, "streamGenerateContent"), headers=self.headers, json=self._for_model(model, data), params={"alt": "sse"}, timeout=timeout
+            )
+            response = await client.send(request, stream=True)
+            if response.is_error:
+                await response.aread()
+                await response.aclose()
+                response.raise_for_status()
+            return response
         
-        return f"""
-Tu es Homelinks, l'assistant vocal de ma maison. Voici le JSON qui renseigne sur l'état actuel de la maison :
-{commands}
-
-Explication : 
-
-- **salon** (`boolean`): 
-- `true` : Lampes du salon allumés.
-- `false` : Lampes du salon éteints.
-
-- **cuisine** (`boolean`): 
-- `true` : Lampes de la cuisine allumés.
-- `false` : Lampes de la cuisine éteints.
-
-- **chambre** (`boolean`): 
-- `true` : Lampes de la chambre allumés.
-- `false` : Lampes de la chambre éteints.
-
-- **exterieur** (`boolean`): 
-- `true` : Lampes extérieurs allumés.
-- `false` : Lampes extérieurs éteints.
-
-- **garage** (`boolean`): 
-- `true` : Lampes du garage allumés.
-- `false` : Lampes du garage éteints.
-
-- **smoke** (`boolean`): 
-- `true` : Fumée détectée.
-- `false` : Pas de fumée détectée.
-
-- **presence** (`boolean`): 
-- `true` : Présence détectée.
-- `false` : Aucune présence détectée.
-
-- **auth** (`boolean`): 
-- `true` : Authentification verifiée.
-- `false` : Authentification non verifiée.
-
-- **door1** (`string`): 
-- `"on"` : Porte du salon ouverte.
-- `"off"` : Porte du salon fermée.
+        # Seule l'ouverture du flux est réessayée : une fois le texte transmis, on ne rejoue pas
+        # (l'étape mesure l'attente du premier octet ; la suite est consommée au fil de l'eau)
+        with stage("llm"):
+            response = await get_router(route).call(open_stream, hedge=False)
+        try:
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                payload = json.loads(line[len("data:"):])
+                usage = payload.get('usageMetadata', usage)
+                for candidate in payload.get('candidates', [])[:1]:
+                    for part in candidate.get('content', {}).get('parts', []):
+                        if part.get('text'):
+                            yield part['text']
+        except httpx.HTTPError as e:
+            raise classify_error(e)
+        finally:
+            await response.aclose()
+        
+        self._record_usage(usage or {})
 
-- **door2** (`string`): 
-- `"on"` : Porte du garage ouverte.
-- `"off"` : Porte du garage fermée.
+    async def _post_async(self, client, route, data):
+        """Envoie la requête à Gemini sans bloquer la boucle d'événements
+        (modèle et repli choisis par le routeur, nouvelles tentatives et échéance par la couche upstream)"""
+        async def attempt(model, timeout):
+            response = await client.post(self._url(model), headers=self.headers, json=self._for_model(model, data), timeout=timeout)
+            response.raise_for_status()
+            return response.json()
+        
+        with stage("llm"):
+            return self._parse_api_response(await get_router(route).call(attempt))
 
-- **time** (`string`): 
-- Heure actuelle sous le format `HH:MM:SS---JourMoisAnnee`.
+    def _url(self, model, method="generateContent"):
+        return f"{Config.GEMINI_BASE_URL}/v1beta/models/{model}:{method}"
 
-- **assistant_response** (`string`): 
-- Réponse textuelle de l'assistant vocal, à lire à haute voix.
+    def _for_model(self, model, data):
+        """Ajustements propres au modèle choisi par le routeur"""
+        if not Config.LLM_COMPACT_OUTPUT_ENABLED or not model.startswith("gemini-2.5-flash"):
+            return data
+        # Les tokens de réflexion comptent dans maxOutputTokens : désactivés pour une sortie courte
+        generation_config = dict(data["generationConfig"], thinkingConfig={"thinkingBudget": 0})
+        return dict(data, generationConfig=generation_config)
 
+    def _build_request_data(self, user_text, home_state, route="command"):
+        """Construit le corps de la requête generateContent"""
+        if isinstance(home_state, str):
+            home_state = parse_home_state(home_state)
+        with stage("prompt"):
+            user_prompt = build_user_prompt(user_text, home_state)
+            token_stats["estimated_prompt_tokens"] += SYSTEM_PROMPT_TOKENS + estimate_tokens(user_prompt)
+            return self._with_config([{"text": user_prompt}], route, RESPONSE_SCHEMA)
 
-Tu devras mettre à jour ce JSON en fonction de mes demandes, en respectant le format attendu.
+    def _build_voice_request_data(self, audio_bytes, mime_type, home_state):
+        """Corps de la requête multimodale : audio en ligne suivi de l'état de la maison"""
+        if isinstance(home_state, str):
+            home_state = parse_home_state(home_state)
+        with stage("prompt"):
+            voice_prompt = build_voice_prompt(home_state)
+            token_stats["estimated_prompt_tokens"] += SYSTEM_PROMPT_TOKENS + estimate_tokens(voice_prompt)
+            return self._with_config([
+                {
+                    "inline_data": {
+                        "mime_type": mime_type,
+                        "data": base64.b64encode(audio_bytes).decode("ascii")
+                    }
+                },
+                {"text": voice_prompt}
+            ], "voice", VOICE_RESPONSE_SCHEMA)
 
-Dans ce JSON, il y a une variable assistant_response. C'est dans cette variable que tu devras mettre ta réponse textuelle à mon message. Elle sera ensuite transcrite en audio par un autre outil.
+    def _with_config(self, parts, route, schema):
+        """Ajoute l'instruction système et la configuration de génération aux parties du message"""
+        generation_config = {
+            "temperature": 0.1,
+            "topP": 0.9,
+            "maxOutputTokens": 8192,
+            "responseMimeType": "application/json"
+        }
+        if Config.LLM_COMPACT_OUTPUT_ENABLED:
+            # Seuls les appareils modifiés sont générés : quelques dizaines de tokens au lieu de l'état complet
+            generation_config["maxOutputTokens"] = Config.LLM_OUTPUT_TOKEN_BUDGETS[route]
+            generation_config["responseSchema"] = schema
+        
+        # La partie statique passe en instruction système, identique d'une requête à l'autre
+        return {
+            "systemInstruction": {
+                "parts": [{"text": SYSTEM_PROMPT}]
+            },
+            "contents": [
+                {
+                    "role": "user",
+                    "parts": parts
+                }
+            ],
+            "generationConfig": generation_config
+        }
 
-Tu dois analyser mes demandes pour savoir :
+    def _parse_api_response(self, resp):
+        """Extrait et décode le JSON produit par le modèle"""
+        if 'candidates' not in resp or not resp['candidates']:
+            raise ValueError("Invalid API response: no candidates found")
+            
+        if 'content' not in resp['candidates'][0] or 'parts' not in resp['candidates'][0]['content']:
+            raise ValueError("Invalid API response: no content parts found")
+            
+        self._record_usage(resp.get('usageMetadata', {}))
+            
+        content = resp['candidates'][0]['content']['parts'][0]['text']
+        try:
+            return json.loads(content)
+        except json.JSONDecodeError as e:
+            if resp['candidates'][0].get('finishReason') == 'MAX_TOKENS':
+                raise ValueError(f"Model output truncated by maxOutputTokens: {e}")
+            raise ValueError(f"Failed to parse JSON response: {e}")
 
-Quels appareils allumer ou éteindre,
-Si je veux tout allumer ou tout éteindre,
-Me répondre si je pose des questions sur l'état de la maison,
-Mais aussi répondre à des questions diverses.
-Tu es un assistant chaleureux et responsable. Un membre à part entière de la famille. Au-delà de la gestion de la maison, ton rôle est aussi d'entretenir des discussions excitantes et fraternelles à travers la variable assistant_response.
+    def _record_usage(self, usage):
+        """Comptabilise les tokens consommés (usageMetadata de Gemini)"""
+        token_stats["requests"] += 1
+        token_stats["prompt_tokens"] += usage.get('promptTokenCount', 0)
+        token_stats["output_tokens"] += usage.get('candidatesTokenCount', 0)
+        token_stats["last_prompt_tokens"] = usage.get('promptTokenCount', 0)
+        LLM_TOKENS.inc(usage.get('promptTokenCount', 0), kind="prompt")
+        LLM_TOKENS.inc(usage.get('candidatesTokenCount', 0), kind="output")
 
-Tu es l'assistant savant, drole, sympathique, responsable et protecteur de la maison.
+    def _format_http_error(self, response):
+        """Formate une erreur HTTP de l'API"""
+        return describe_http_error(response)
 
-⚠️ N'oublie jamais : tu dois toujours me renvoyer le résultat sous forme de JSON. TOUJOURS. Et jamais de valeurs vides.
 
-Exemple :
-{commands}
-"""
+def complete_response(home_state, response):
+    """
+    Réponse complète (format ProcessResponse) à partir de la sortie du modèle
+    
+    En sortie compacte, le modèle ne renvoie que les appareils modifiés :
+    ils sont fusionnés dans l'état courant, qui fournit aussi l'heure.
+    """
+    if not Config.LLM_COMPACT_OUTPUT_ENABLED or not isinstance(response, dict):
+        return response
+    return merge_state_diff(home_state, response)
 
 
 # Instance globale pour réutilisation
@@ -186,16 +269,48 @@ def get_ai_generator():
         ai_generator = AIResponseGenerator()
     return ai_generator
 
-def generate_ai_response(user_text, home_state=""):
+async def generate_ai_response_async(user_text, home_state="", http_client=None):
     """
-    Fonction simplifiée pour générer une réponse IA
+    Génère une réponse IA (point d'entrée de l'application)
     
     Args:
         user_text (str): Texte de l'utilisateur
-        home_state (str): État de la maison en JSON
+        home_state (dict | str): État de la maison
+        http_client (httpx.AsyncClient): Client HTTP partagé de l'application
         
     Returns:
         dict: Réponse de l'IA
     """
     generator = get_ai_generator()
-    return generator.generate_response(user_text, home_state)
\ No newline at end of file
+    if isinstance(home_state, str):
+        home_state = parse_home_state(home_state)
+    # Même commande sur le même état depuis plusieurs clients : un seul appel
+    key = content_key(user_text, canonical_state(home_state))
+    return await get_flight("llm").do(key, generator.generate_response_async, user_text, home_state, http_client)
+
+
+async def generate_voice_response_async(audio_bytes, mime_type, home_state="", http_client=None):
+    """
+    Commande vocale en un seul appel (transcription + réponse)
+    
+    Returns:
+        dict: Réponse de l'IA, avec la clé transcription
+    """
+    generator = get_ai_generator()
+    if isinstance(home_state, str):
+        home_state = parse_home_state(home_state)
+    key = content_key(audio_bytes, mime_type, canonical_state(home_state))
+    return await get_flight("voice").do(
+        key, generator.generate_voice_response_async, audio_bytes, mime_type, home_state, http_client
+    )
+
+
+def stream_ai_response_async(user_text, home_state="", http_client=None):
+    """
+    Version streaming de generate_ai_response_async
+    
+    Returns:
+        AsyncIterator[str]: Morceaux du JSON produit par le modèle
+    """
+    generator = get_ai_generator()
+    return generator.stream_response_async(user_text, home_state, http_client)
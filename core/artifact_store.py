@@ -0,0 +1,137 @@
+"""
+Gestion du cycle de vie des fichiers audio (uploads temporaires, audio généré)
+Chaque fichier créé par l'application est enregistré dans un index en mémoire
+avec sa date de création et sa taille. Une seule tâche périodique (lancée dans
+lifespan) supprime les fichiers expirés et fait respecter le quota disque :
+plus aucun parcours du disque pendant le traitement des requêtes
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Délai pendant lequel un fichier est considéré en cours d'utilisation (jamais évincé par le quota)
+IN_USE_GRACE_SECONDS = 60
+
+
+class ArtifactStore:
+    """Index des fichiers gérés, avec expiration par type et quota global"""
+
+    def __init__(self, max_ages, quota_bytes):
+        self.max_ages = max_ages          # type -> durée de vie en secondes
+        self.quota_bytes = quota_bytes
+        self._artifacts = {}              # chemin -> (type, création, taille)
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def register(self, path, kind, size=None):
+        """Enregistre un fichier qui vient d'être écrit et retourne son chemin"""
+        if size is None:
+            size = os.path.getsize(path)
+        with self._lock:
+            previous = self._artifacts.get(path)
+            if previous is not None:
+                self.total_bytes -= previous[2]
+            self._artifacts[path] = (kind, time.time(), size)
+            self.total_bytes += size
+        return path
+
+    def release(self, path):
+        """Supprime un fichier dont on n'a plus besoin"""
+        with self._lock:
+            entry = self._artifacts.pop(path, None)
+            if entry is not None:
+                self.total_bytes -= entry[2]
+        try:
+            if path and os.path.exists(path):
+                os.remove(path)
+        except OSError as e:
+            logger.warning(f"Could not remove file {path}: {e}")
+
+    def release_kind(self, kind):
+        """Supprime tous les fichiers d'un type (arrêt du processus)"""
+        with self._lock:
+            paths = [path for path, entry in self._artifacts.items() if entry[0] == kind]
+        for path in paths:
+            self.release(path)
+        return len(paths)
+
+    def sweep(self):
+        """Supprime les fichiers expirés puis les plus anciens au-delà du quota"""
+        now = time.time()
+        with self._lock:
+            expired = [
+                path for path, (kind, created, _) in self._artifacts.items()
+                if now - created > self.max_ages.get(kind, self.max_ages["default"])
+            ]
+            over_quota = []
+            remaining = self.total_bytes - sum(self._artifacts[p][2] for p in expired)
+            if remaining > self.quota_bytes:
+                candidates = sorted(
+                    (created, path, size) for path, (_, created, size) in self._artifacts.items()
+                    if path not in expired and now - created > IN_USE_GRACE_SECONDS
+                )
+                for _, path, size in candidates:
+                    if remaining <= self.quota_bytes:
+                        break
+                    over_quota.append(path)
+                    remaining -= size
+
+        for path in expired + over_quota:
+            self.release(path)
+        self.expired += len(expired)
+        self.evicted += len(over_quota)
+        return len(expired) + len(over_quota)
+
+    async def run_sweeper(self, interval_seconds):
+        """Boucle de nettoyage périodique (une seule par processus)"""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                removed = await asyncio.to_thread(self.sweep)
+                if removed:
+                    logger.info(f"Cleaned up {removed} old audio files")
+            except Exception as e:
+                logger.warning(f"Audio file sweep failed: {e}")
+
+    def stats(self):
+        by_kind = {}
+        with self._lock:
+            for kind, _, size in self._artifacts.values():
+                entry = by_kind.setdefault(kind, {"files": 0, "bytes": 0})
+                entry["files"] += 1
+                entry["bytes"] += size
+            files = len(self._artifacts)
+        return {
+            "files": files,
+            "bytes": self.total_bytes,
+            "quota_bytes": self.quota_bytes,
+            "by_kind": by_kind,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
+
+
+# Instance globale pour réutilisation
+artifact_store = None
+
+def get_artifact_store():
+    """Retourne l'index des fichiers gérés (singleton)"""
+    global artifact_store
+    if artifact_store is None:
+        artifact_store = ArtifactStore(
+            max_ages={
+                "upload": Config.UPLOAD_MAX_AGE_SECONDS,
+                "audio": Config.AUDIO_MAX_AGE_SECONDS,
+                "default": Config.AUDIO_MAX_AGE_SECONDS,
+            },
+            quota_bytes=Config.ARTIFACT_QUOTA_MB * 1024 * 1024
+        )
+    return artifact_store
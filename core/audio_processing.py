@@ -1,8 +1,67 @@
+import logging
 import tempfile
 import os
+import io
 import time
 import glob
 import uuid
+import wave
+
+import aiofiles
+import numpy as np
+
+from artifact_store import get_artifact_store
+from metrics import stage
+
+logger = logging.getLogger(__name__)
+
+try:
+    from pydub import AudioSegment
+except ImportError:  # pydub (et ffmpeg) sont optionnels : seul le WAV est alors servi
+    AudioSegment = None
+
+# Taille maximale d'un enregistrement envoyé à /transcribe
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Type MIME envoyé à Gemini selon l'extension du fichier
+AUDIO_MIME_TYPES = {
+    ".webm": "audio/webm",
+    ".wav": "audio/wav",
+    ".mp3": "audio/mp3",
+    ".ogg": "audio/ogg",
+    ".m4a": "audio/aac",
+}
+
+class UploadTooLargeError(Exception):
+    """Levée dès que l'upload dépasse la taille maximale, sans attendre la fin du transfert"""
+
+class SilentAudioError(ValueError):
+    """Levée quand l'enregistrement ne contient que du silence (aucun appel à l'API)"""
+
+# Prétraitement avant transcription : mono 16 kHz, silences de début et de fin retirés
+TARGET_SAMPLE_RATE = 16000
+FRAME_MS = 20
+SILENCE_FLOOR_DB = -50.0     # En dessous : silence, quel que soit le bruit de fond
+SILENCE_MARGIN_DB = 10.0     # Au-dessus du bruit de fond estimé : parole
+SPEECH_DYNAMIC_DB = 25.0     # Parole faible tolérée sous le niveau maximal
+SILENCE_PADDING_MS = 200
+
+# Format ffmpeg (via pydub) des types MIME non WAV
+DECODER_FORMATS = {
+    "audio/webm": "webm",
+    "audio/ogg": "ogg",
+    "audio/mp3": "mp3",
+    "audio/mpeg": "mp3",
+    "audio/aac": "mp4",
+}
+WAV_MIME_TYPES = ("audio/wav", "audio/x-wav", "audio/wave")
+
+# Formats compressés servis par /audio : (format ffmpeg, codec, débit, type MIME)
+ENCODED_FORMATS = {
+    "mp3": ("mp3", None, "32k", "audio/mpeg"),
+    "opus": ("ogg", "libopus", "24k", "audio/ogg"),
+}
 
 def save_temp_file(file_data, file_extension="webm", prefix="temp_audio"):
     """Sauvegarde un fichier temporaire et retourne son chemin"""
@@ -16,20 +75,88 @@ def save_temp_file(file_data, file_extension="webm", prefix="temp_audio"):
         )
         temp_file.write(file_data)
         temp_file.close()
-        return temp_file.name
+        return get_artifact_store().register(temp_file.name, "upload", size=len(file_data))
     except Exception as e:
         raise Exception(f"Failed to save temporary file: {str(e)}")
 
+def resolve_mime_type(content_type=None, filename=None):
+    """Type MIME explicite du client (sans paramètres de codec), sinon déduit de l'extension"""
+    if content_type:
+        base_type = content_type.split(";")[0].strip().lower()
+        if base_type.startswith("audio/"):
+            return base_type
+    if filename:
+        extension = os.path.splitext(filename.lower())[1]
+        if extension in AUDIO_MIME_TYPES:
+            return AUDIO_MIME_TYPES[extension]
+    return "audio/webm"
+
+def extension_for_mime(mime_type):
+    """Extension de fichier correspondant à un type MIME audio (webm par défaut)"""
+    for extension, known_type in AUDIO_MIME_TYPES.items():
+        if known_type == mime_type:
+            return extension[1:]
+    return "webm"
+
+async def iter_upload(upload, chunk_size=UPLOAD_CHUNK_SIZE):
+    """Lit un UploadFile morceau par morceau"""
+    while True:
+        chunk = await upload.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+async def read_audio_upload(chunks, max_bytes=MAX_UPLOAD_BYTES, spill_threshold=0, file_extension="webm"):
+    """
+    Lit un upload en flux en appliquant la taille maximale au fil de l'eau
+    
+    Args:
+        chunks: Itérateur asynchrone de morceaux (UploadFile ou request.stream())
+        max_bytes (int): Taille maximale acceptée
+        spill_threshold (int): Au-delà, les données sont écrites sur disque (0 = jamais)
+        file_extension (str): Extension du fichier temporaire éventuel
+        
+    Returns:
+        tuple: (contenu en mémoire ou None, chemin du fichier temporaire ou None)
+    """
+    parts = []
+    total = 0
+    spill_path = None
+    spill_file = None
+    try:
+        async for chunk in chunks:
+            total += len(chunk)
+            if total > max_bytes:
+                raise UploadTooLargeError(f"File too large (max {max_bytes // (1024 * 1024)}MB)")
+            if spill_file is None and spill_threshold and total > spill_threshold:
+                unique_id = str(uuid.uuid4())[:8]
+                spill_path = os.path.join(tempfile.gettempdir(), f"temp_audio_{unique_id}.{file_extension}")
+                spill_file = await aiofiles.open(spill_path, "wb")
+                for part in parts:
+                    await spill_file.write(part)
+                parts = []
+            if spill_file is not None:
+                await spill_file.write(chunk)
+            else:
+                parts.append(chunk)
+    except BaseException:
+        if spill_file is not None:
+            await spill_file.close()
+            os.remove(spill_path)
+        raise
+    
+    if spill_file is not None:
+        await spill_file.close()
+        return None, get_artifact_store().register(spill_path, "upload", size=total)
+    return b"".join(parts), None
+
 def clean_temp_file(file_path):
     """Nettoie les fichiers temporaires après usage"""
-    try:
-        if file_path and os.path.exists(file_path):
-            os.remove(file_path)
-    except Exception as e:
-        print(f"Warning: Could not remove temporary file {file_path}: {e}")
+    get_artifact_store().release(file_path)
 
 def cleanup_old_temp_files(max_age_minutes=60):
-    """Nettoie les fichiers temporaires de plus de 60 minutes"""
+    """Nettoie les fichiers temporaires de plus de 60 minutes laissés par un processus précédent
+    (appelé une fois au démarrage ; ensuite l'index d'ArtifactStore prend le relais)"""
     try:
         temp_dir = tempfile.gettempdir()
         current_time = time.time()
@@ -52,10 +179,10 @@ def cleanup_old_temp_files(max_age_minutes=60):
                     continue  # Ignore individual file errors
                     
         if files_cleaned > 0:
-            print(f"Cleaned up {files_cleaned} old temporary audio files")
+            logger.info(f"Cleaned up {files_cleaned} old temporary audio files")
             
     except Exception as e:
-        print(f"Warning: Could not cleanup old temporary files: {e}")
+        logger.warning(f"Could not cleanup old temporary files: {e}")
 
 def get_file_size_mb(file_path):
     """Retourne la taille d'un fichier en MB"""
@@ -65,3 +192,171 @@ def get_file_size_mb(file_path):
         return 0
     except Exception:
         return 0
+
+def encode_audio(wav_path, audio_format):
+    """Encode un WAV en MP3 ou Opus (≈10x plus léger) et retourne le chemin du fichier encodé"""
+    if audio_format not in ENCODED_FORMATS:
+        raise ValueError(f"Unsupported audio format: {audio_format}")
+    if AudioSegment is None:
+        raise RuntimeError("Audio encoding requires pydub and ffmpeg")
+    
+    container, codec, bitrate, _ = ENCODED_FORMATS[audio_format]
+    extension = "opus" if audio_format == "opus" else container
+    encoded_path = os.path.splitext(wav_path)[0] + f".{extension}"
+    
+    # Réutiliser l'encodage s'il est plus récent que le WAV (toujours indexé : un autre
+    # worker a pu l'écrire, le quota doit le compter)
+    if os.path.exists(encoded_path) and os.path.getmtime(encoded_path) >= os.path.getmtime(wav_path):
+        return get_artifact_store().register(encoded_path, "audio")
+    
+    # Fichier temporaire puis renommage atomique : une requête concurrente ne lit jamais
+    # un encodage à moitié écrit
+    tmp_path = f"{encoded_path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        AudioSegment.from_wav(wav_path).export(tmp_path, format=container, codec=codec, bitrate=bitrate)
+        os.replace(tmp_path, encoded_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return get_artifact_store().register(encoded_path, "audio")
+
+def pcm_to_wav(pcm, sample_rate, channels=1, sample_width=2):
+    """Encapsule du PCM brut dans un WAV en mémoire"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(sample_width)
+        wf.setframerate(sample_rate)
+        wf.writeframes(pcm)
+    return buffer.getvalue()
+
+def frame_levels(samples, frame_samples):
+    """Niveau (dBFS) de chaque trame complète d'un signal mono normalisé dans [-1, 1]"""
+    usable = len(samples) - len(samples) % frame_samples
+    frames = samples[:usable].reshape(-1, frame_samples)
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    return 20.0 * np.log10(rms + 1e-10)
+
+def decode_audio(audio_bytes, mime_type):
+    """
+    Décode un enregistrement en échantillons flottants
+
+    Returns:
+        tuple: (tableau (échantillons, canaux) dans [-1, 1], fréquence) ou None si
+        le format ne peut pas être décodé ici (pydub/ffmpeg absents)
+    """
+    if mime_type in WAV_MIME_TYPES:
+        with wave.open(io.BytesIO(audio_bytes), "rb") as wf:
+            if wf.getsampwidth() != 2 or wf.getcomptype() != "NONE":
+                return None
+            channels, rate = wf.getnchannels(), wf.getframerate()
+            raw = wf.readframes(wf.getnframes())
+        samples = np.frombuffer(raw, dtype="<i2")
+    else:
+        if AudioSegment is None or mime_type not in DECODER_FORMATS:
+            return None
+        segment = AudioSegment.from_file(io.BytesIO(audio_bytes), format=DECODER_FORMATS[mime_type])
+        segment = segment.set_sample_width(2)
+        channels, rate = segment.channels, segment.frame_rate
+        samples = np.frombuffer(segment.raw_data, dtype="<i2")
+    
+    samples = samples[:len(samples) - len(samples) % channels]
+    return samples.reshape(-1, channels).astype(np.float32) / 32768.0, rate
+
+def downmix(samples):
+    """Moyenne des canaux"""
+    return samples.mean(axis=1) if samples.shape[1] > 1 else samples[:, 0]
+
+def resample(samples, rate, target_rate=TARGET_SAMPLE_RATE):
+    """Rééchantillonnage par interpolation linéaire, précédé d'un filtre anti-repliement"""
+    if rate == target_rate or len(samples) == 0:
+        return samples
+    if rate > target_rate:
+        width = int(round(rate / target_rate))
+        if width > 1:
+            samples = np.convolve(samples, np.full(width, 1.0 / width, dtype=np.float32), mode="same")
+    count = int(len(samples) * target_rate / rate)
+    positions = np.arange(count, dtype=np.float64) * (rate / target_rate)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+def trim_silence(samples, rate, padding_ms=SILENCE_PADDING_MS):
+    """
+    Retire les silences de début et de fin
+
+    Returns:
+        np.ndarray: signal rogné, ou None s'il ne contient que du silence
+    """
+    frame_samples = rate * FRAME_MS // 1000
+    levels = frame_levels(samples, frame_samples)
+    if len(levels) == 0:
+        return None
+    
+    noise_floor = np.percentile(levels, 10)
+    threshold = max(SILENCE_FLOOR_DB, min(noise_floor + SILENCE_MARGIN_DB, levels.max() - SPEECH_DYNAMIC_DB))
+    voiced = np.flatnonzero(levels > threshold)
+    if len(voiced) == 0:
+        return None
+    
+    padding = rate * padding_ms // 1000
+    start = max(0, voiced[0] * frame_samples - padding)
+    end = min(len(samples), (voiced[-1] + 1) * frame_samples + padding)
+    return samples[start:end]
+
+def encode_compact(samples, rate):
+    """Encode le signal mono : Opus si ffmpeg est disponible, sinon WAV 16 bits"""
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+    if AudioSegment is not None:
+        container, codec, bitrate, mime_type = ENCODED_FORMATS["opus"]
+        buffer = io.BytesIO()
+        AudioSegment(pcm, frame_rate=rate, sample_width=2, channels=1).export(
+            buffer, format=container, codec=codec, bitrate=bitrate
+        )
+        return buffer.getvalue(), mime_type
+    return pcm_to_wav(pcm, rate), "audio/wav"
+
+def preprocess_audio(audio_bytes, mime_type):
+    """
+    Prépare un enregistrement pour la transcription : décodage, mono, 16 kHz,
+    silences retirés puis ré-encodage compact (moins d'octets et moins de tokens audio)
+
+    Returns:
+        tuple: (contenu, type MIME) à envoyer ; l'original si le traitement n'apporte rien
+
+    Raises:
+        SilentAudioError: si l'enregistrement ne contient que du silence
+    """
+    # Chaque sous-étape est mesurée (histogramme de /metrics, Server-Timing de la requête)
+    try:
+        with stage("preprocess.decode"):
+            decoded = decode_audio(audio_bytes, mime_type)
+        if decoded is None:
+            logger.info(f"Audio preprocessing skipped: cannot decode {mime_type} here")
+            return audio_bytes, mime_type
+        samples, rate = decoded
+        original_duration = len(samples) / rate
+        
+        with stage("preprocess.downmix"):
+            samples = downmix(samples)
+        with stage("preprocess.resample"):
+            samples = resample(samples, rate)
+        with stage("preprocess.trim"):
+            samples = trim_silence(samples, TARGET_SAMPLE_RATE)
+        if samples is None:
+            raise SilentAudioError("No speech detected in audio")
+        
+        with stage("preprocess.encode"):
+            processed, processed_type = encode_compact(samples, TARGET_SAMPLE_RATE)
+    except SilentAudioError:
+        raise
+    except Exception as e:
+        logger.warning(f"Audio preprocessing failed, sending original audio: {e}")
+        return audio_bytes, mime_type
+    
+    duration = len(samples) / TARGET_SAMPLE_RATE
+    logger.debug(f"Audio preprocessing: {len(audio_bytes)} -> {len(processed)} bytes, "
+                 f"{original_duration:.2f}s -> {duration:.2f}s")
+    
+    # Un audio plus court coûte moins de tokens même si l'encodage est plus lourd
+    if len(processed) >= len(audio_bytes) and duration >= original_duration:
+        return audio_bytes, mime_type
+    return processed, processed_type
@@ -0,0 +1,53 @@
+"""
+Diffusion en continu de l'audio TTS
+Les morceaux PCM reçus de Gemini sont mis à disposition de plusieurs
+consommateurs (canal binaire Socket.IO, réponse HTTP en streaming) au fur et
+à mesure de leur arrivée, sans attendre l'écriture du fichier WAV complet
+"""
+import asyncio
+import struct
+
+# Format de sortie de Gemini TTS : PCM 16 bits mono à 24 kHz
+PCM_SAMPLE_RATE = 24000
+PCM_CHANNELS = 1
+PCM_SAMPLE_WIDTH = 2
+
+def wav_stream_header(rate=PCM_SAMPLE_RATE, channels=PCM_CHANNELS, sample_width=PCM_SAMPLE_WIDTH):
+    """En-tête WAV pour un flux de longueur inconnue (tailles au maximum)"""
+    byte_rate = rate * channels * sample_width
+    return (
+        b"RIFF" + struct.pack("<I", 0xFFFFFFFF) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, rate, byte_rate, channels * sample_width, sample_width * 8)
+        + b"data" + struct.pack("<I", 0xFFFFFFFF)
+    )
+
+
+class AudioBroadcast:
+    """Tampon de morceaux PCM qu'on peut lire depuis le début pendant qu'il se remplit"""
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self._changed = asyncio.Condition()
+
+    async def publish(self, chunk):
+        async with self._changed:
+            self.chunks.append(chunk)
+            self._changed.notify_all()
+
+    async def close(self):
+        async with self._changed:
+            self.done = True
+            self._changed.notify_all()
+
+    async def subscribe(self):
+        """Rejoue les morceaux déjà reçus puis suit le flux jusqu'à sa fermeture"""
+        index = 0
+        while True:
+            while index < len(self.chunks):
+                yield self.chunks[index]
+                index += 1
+            if self.done:
+                return
+            async with self._changed:
+                await self._changed.wait_for(lambda: index < len(self.chunks) or self.done)
@@ -0,0 +1,76 @@
+"""
+Registre des clients partagés pour Homelinks-AI
+Un seul client Gemini SDK par clé API et un seul client HTTP asynchrone
+pour tout le processus : les connexions TLS restent ouvertes (keep-alive)
+entre les requêtes au lieu d'être recréées à chaque énoncé
+"""
+import httpx
+from google import genai
+from google.genai import types
+
+from config import Config
+
+_genai_clients = {}
+_http_client = None
+
+def get_genai_client(api_key):
+    """Retourne le client Gemini associé à cette clé (créé une seule fois)"""
+    if not api_key:
+        raise ValueError("Gemini API key is not set in environment variables")
+    client = _genai_clients.get(api_key)
+    if client is None:
+        client = genai.Client(
+            api_key=api_key,
+            http_options=types.HttpOptions(
+                base_url=Config.GEMINI_BASE_URL,
+                timeout=int(Config.HTTP_TIMEOUT * 1000)
+            )
+        )
+        _genai_clients[api_key] = client
+    return client
+
+def get_stt_client():
+    """Client utilisé pour la transcription (GENAI_API_KEY)"""
+    if not Config.GENAI_API_KEY:
+        raise ValueError("GENAI_API_KEY is not set in environment variables")
+    return get_genai_client(Config.GENAI_API_KEY)
+
+def get_tts_client():
+    """Client utilisé pour la synthèse vocale (GEMINI_API_KEY)"""
+    if not Config.GEMINI_API_KEY:
+        raise ValueError("GEMINI_API_KEY is not set in environment variables")
+    return get_genai_client(Config.GEMINI_API_KEY)
+
+def get_http_client():
+    """Retourne le client HTTP asynchrone partagé (pool de connexions)"""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            timeout=Config.HTTP_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=Config.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=Config.HTTP_MAX_KEEPALIVE_CONNECTIONS
+            )
+        )
+    return _http_client
+
+def init_clients():
+    """Crée les clients au démarrage pour que la première requête ne paie pas leur construction"""
+    get_http_client()
+    for api_key in (Config.GENAI_API_KEY, Config.GEMINI_API_KEY):
+        if api_key:
+            get_genai_client(api_key)
+
+async def close_clients():
+    """Ferme proprement toutes les connexions ouvertes"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+    for client in _genai_clients.values():
+        try:
+            await client.aio.aclose()
+            client.close()
+        except Exception:
+            pass
+    _genai_clients.clear()
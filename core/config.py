@@ -2,6 +2,7 @@
 Configuration centralisée pour l'application Homelinks-AI
 """
 import os
+import secrets
 from dotenv import load_dotenv
 
 # Charger les variables d'environnement
@@ -14,6 +15,152 @@ class Config:
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
     GENAI_API_KEY = os.getenv("GENAI_API_KEY")
     
+    # Adresse de l'API Gemini (modifiable pour tester contre un faux serveur local)
+    GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com").rstrip("/")
+    
+    # Client HTTP partagé (pool de connexions vers l'API Gemini)
+    HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "30"))
+    HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+    HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    
+    # Appels à Gemini : nouvelles tentatives, disjoncteur, requêtes doublées, échéances
+    UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "2"))
+    UPSTREAM_BACKOFF_BASE = float(os.getenv("UPSTREAM_BACKOFF_BASE", "0.2"))
+    UPSTREAM_BACKOFF_MAX = float(os.getenv("UPSTREAM_BACKOFF_MAX", "2"))
+    BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+    BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+    HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "false").lower() == "true"
+    HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+    HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.3"))
+    REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "25"))
+    SPEECH_DEADLINE_SECONDS = float(os.getenv("SPEECH_DEADLINE_SECONDS", "45"))
+    
+    # Modèles par classe de requête : le premier est le principal, les suivants les replis
+    MODEL_ROUTES = {
+        "command": os.getenv("LLM_COMMAND_MODELS", "gemini-2.5-flash-lite,gemini-2.0-flash-lite"),
+        "conversation": os.getenv("LLM_CONVERSATION_MODELS", "gemini-2.5-flash,gemini-2.5-flash-lite"),
+        "voice": os.getenv("LLM_VOICE_MODELS", "gemini-2.5-flash-lite,gemini-2.0-flash-lite"),
+        "stt": os.getenv("STT_MODELS", "gemini-2.0-flash-exp,gemini-2.5-flash-lite"),
+        "tts": os.getenv("TTS_MODELS", "gemini-2.5-flash-preview-tts"),
+    }
+    # Latence (p95) au-delà de laquelle le modèle principal cède la place au repli
+    MODEL_LATENCY_BUDGETS_MS = {
+        "command": int(os.getenv("LLM_COMMAND_BUDGET_MS", "2500")),
+        "conversation": int(os.getenv("LLM_CONVERSATION_BUDGET_MS", "6000")),
+        "voice": int(os.getenv("LLM_VOICE_BUDGET_MS", "4000")),
+        "stt": int(os.getenv("STT_BUDGET_MS", "4000")),
+        "tts": int(os.getenv("TTS_BUDGET_MS", "8000")),
+    }
+    MODEL_MAX_ERROR_RATE = float(os.getenv("MODEL_MAX_ERROR_RATE", "0.3"))
+    MODEL_STATS_WINDOW_SECONDS = float(os.getenv("MODEL_STATS_WINDOW_SECONDS", "120"))
+    MODEL_MIN_SAMPLES = int(os.getenv("MODEL_MIN_SAMPLES", "5"))
+    MODEL_RATE_LIMIT_COOLDOWN = float(os.getenv("MODEL_RATE_LIMIT_COOLDOWN", "30"))
+    # Au-delà de ce nombre de mots, une phrase est traitée comme une conversation ouverte
+    COMMAND_MAX_WORDS = int(os.getenv("COMMAND_MAX_WORDS", "12"))
+    
+    # Nombre de processus du serveur (lu aussi par uvicorn)
+    WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+    
+    # Pools de workers (taille et file d'attente maximale avant refus)
+    STT_WORKERS = int(os.getenv("STT_WORKERS", "4"))
+    STT_MAX_QUEUE = int(os.getenv("STT_MAX_QUEUE", "16"))
+    TTS_WORKERS = int(os.getenv("TTS_WORKERS", "4"))
+    TTS_MAX_QUEUE = int(os.getenv("TTS_MAX_QUEUE", "32"))
+    
+    # Prétraitement de l'audio avant transcription (mono 16 kHz, silences retirés)
+    AUDIO_PREPROCESSING_ENABLED = os.getenv("AUDIO_PREPROCESSING_ENABLED", "true").lower() == "true"
+    # /voice : transcription et réponse en un seul appel multimodal (sinon deux appels successifs)
+    VOICE_SINGLE_CALL_ENABLED = os.getenv("VOICE_SINGLE_CALL_ENABLED", "true").lower() == "true"
+    # Taille au-delà de laquelle /transcribe écrit l'upload sur disque (0 = toujours en mémoire)
+    STT_SPILL_THRESHOLD_MB = float(os.getenv("STT_SPILL_THRESHOLD_MB", "0"))
+    
+    # Transcription en continu via Socket.IO (détection de fin d'énoncé par énergie)
+    STT_STREAM_SAMPLE_RATE = int(os.getenv("STT_STREAM_SAMPLE_RATE", "16000"))
+    VAD_SILENCE_MS = int(os.getenv("VAD_SILENCE_MS", "600"))
+    VAD_MARGIN_DB = float(os.getenv("VAD_MARGIN_DB", "10"))
+    VAD_MAX_UTTERANCE_MS = int(os.getenv("VAD_MAX_UTTERANCE_MS", "15000"))
+    
+    # Regroupement des appels identiques simultanés (LLM, transcription, synthèse)
+    SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+    
+    # Cache des réponses IA (RESPONSE_CACHE_PATH vide = mémoire uniquement)
+    RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "512"))
+    RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+    RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "")
+    
+    # État de référence des maisons (STATE_STORE_PATH vide = mémoire uniquement)
+    STATE_STORE_PATH = os.getenv("STATE_STORE_PATH", "")
+    # Fichier partagé par plusieurs workers : l'état est relu à chaque accès (défaut avec WEB_CONCURRENCY > 1)
+    STATE_STORE_SHARED = os.getenv("STATE_STORE_SHARED", str(WEB_CONCURRENCY > 1)).lower() == "true"
+    
+    # Sortie compacte du LLM : seuls les appareils modifiés (responseSchema), fusionnés côté serveur
+    LLM_COMPACT_OUTPUT_ENABLED = os.getenv("LLM_COMPACT_OUTPUT_ENABLED", "true").lower() == "true"
+    # maxOutputTokens par classe de requête en sortie compacte (8192 en sortie complète)
+    LLM_OUTPUT_TOKEN_BUDGETS = {
+        "command": int(os.getenv("LLM_COMMAND_MAX_OUTPUT_TOKENS", "256")),
+        "voice": int(os.getenv("LLM_VOICE_MAX_OUTPUT_TOKENS", "256")),
+        "conversation": int(os.getenv("LLM_CONVERSATION_MAX_OUTPUT_TOKENS", "1024")),
+    }
+    
+    # Chemin rapide local pour les commandes simples (sans appel au LLM)
+    FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "true").lower() == "true"
+    FAST_PATH_MIN_CONFIDENCE = float(os.getenv("FAST_PATH_MIN_CONFIDENCE", "0.9"))
+    
+    # Sessions (cookie signé). À fixer dans .env pour garder les sessions entre redémarrages
+    SESSION_SECRET_KEY = os.getenv("SESSION_SECRET_KEY") or secrets.token_hex(32)
+    SESSION_SAME_SITE = os.getenv("SESSION_SAME_SITE", "lax")
+    SESSION_HTTPS_ONLY = os.getenv("SESSION_HTTPS_ONLY", "false").lower() == "true"
+    
+    # Streaming des réponses du LLM (activé par requête avec "stream": true)
+    LLM_STREAMING_ENABLED = os.getenv("LLM_STREAMING_ENABLED", "true").lower() == "true"
+    
+    # Synthèse vocale en streaming (morceaux PCM via Socket.IO et /audio/stream)
+    TTS_STREAMING_ENABLED = os.getenv("TTS_STREAMING_ENABLED", "true").lower() == "true"
+    
+    # Cache des synthèses vocales (fichiers WAV adressés par contenu)
+    TTS_CACHE_ENABLED = os.getenv("TTS_CACHE_ENABLED", "true").lower() == "true"
+    TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "tts_cache")
+    TTS_CACHE_MAX_MB = int(os.getenv("TTS_CACHE_MAX_MB", "200"))
+    
+    # File de messages Socket.IO entre workers ("local" = sockets Unix dans SOCKETIO_LOCAL_DIR,
+    # ou redis://...), vide = "local" si plus d'un worker
+    SOCKETIO_MESSAGE_QUEUE = os.getenv("SOCKETIO_MESSAGE_QUEUE", "")
+    SOCKETIO_LOCAL_DIR = os.getenv("SOCKETIO_LOCAL_DIR", "/tmp/homelinks-socketio")
+    # Transports acceptés : sans répartition collante, le polling échoue dès qu'il change de worker
+    SOCKETIO_TRANSPORTS = os.getenv("SOCKETIO_TRANSPORTS", "websocket" if WEB_CONCURRENCY > 1 else "polling,websocket")
+    
+    # Fenêtre de regroupement des diffs d'état émis vers une même salle Socket.IO
+    SOCKET_EMIT_DEBOUNCE_MS = int(os.getenv("SOCKET_EMIT_DEBOUNCE_MS", "50"))
+    
+    # Registre des sessions (audio généré par session) : "memory" pour un seul processus,
+    # "sqlite" pour le partager entre workers ou conteneurs (SESSION_REGISTRY_PATH sur un volume commun)
+    SESSION_REGISTRY_BACKEND = os.getenv("SESSION_REGISTRY_BACKEND", "memory").lower()
+    SESSION_REGISTRY_PATH = os.getenv("SESSION_REGISTRY_PATH", "sessions.db")
+    SESSION_REGISTRY_MAX_ENTRIES = int(os.getenv("SESSION_REGISTRY_MAX_ENTRIES", "10000"))
+    SESSION_REGISTRY_TTL = int(os.getenv("SESSION_REGISTRY_TTL", os.getenv("AUDIO_MAX_AGE_SECONDS", "86400")))
+    # Dossier des fichiers audio de session hors cache (vide = dossier courant)
+    AUDIO_OUTPUT_DIR = os.getenv("AUDIO_OUTPUT_DIR", "")
+    
+    # Cycle de vie des fichiers audio (uploads, audio par session)
+    UPLOAD_MAX_AGE_SECONDS = int(os.getenv("UPLOAD_MAX_AGE_SECONDS", "3600"))
+    AUDIO_MAX_AGE_SECONDS = int(os.getenv("AUDIO_MAX_AGE_SECONDS", "86400"))
+    ARTIFACT_QUOTA_MB = int(os.getenv("ARTIFACT_QUOTA_MB", "500"))
+    ARTIFACT_SWEEP_INTERVAL = int(os.getenv("ARTIFACT_SWEEP_INTERVAL", "60"))
+    
+    # /health : durée de validité du résultat des sondes et délai maximal de chaque sonde
+    HEALTH_CACHE_SECONDS = float(os.getenv("HEALTH_CACHE_SECONDS", "15"))
+    HEALTH_PROBE_TIMEOUT = float(os.getenv("HEALTH_PROBE_TIMEOUT", "3"))
+    
+    # Diagnostics de la boucle d'événements : échantillonnage du retard, et en mode debug
+    # relevé de la pile des appels qui la bloquent plus de BLOCKING_THRESHOLD_MS
+    DIAGNOSTICS_LAG_INTERVAL_MS = float(os.getenv("DIAGNOSTICS_LAG_INTERVAL_MS", "100"))
+    DIAGNOSTICS_DEBUG = os.getenv("DIAGNOSTICS_DEBUG", "false").lower() == "true"
+    BLOCKING_THRESHOLD_MS = float(os.getenv("BLOCKING_THRESHOLD_MS", "100"))
+    PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+    # Jeton des points d'accès /admin (Authorization: Bearer ...) ; vide = désactivés
+    ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+    
     # CORS origins
     ALLOWED_ORIGINS = [
         "http://localhost:3000",
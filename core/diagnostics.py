@@ -0,0 +1,242 @@
+"""
+Diagnostics de la boucle d'événements
+- Retard de la boucle échantillonné en continu (histogramme /metrics, percentiles récents)
+- Mode debug (DIAGNOSTICS_DEBUG) : un thread de surveillance repère les blocages de la
+  boucle au-delà de BLOCKING_THRESHOLD_MS et relève la pile de l'appel bloquant pendant
+  qu'il s'exécute ; asyncio signale en plus les callbacks lents
+- Profileur par échantillonnage à la demande : piles du thread de la boucle (ou de tous
+  les threads) au format "folded" des flamegraphs
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from datetime import datetime
+
+from config import Config
+from metrics import EVENT_LOOP_BLOCKED, EVENT_LOOP_LAG
+
+logger = logging.getLogger("diagnostics")
+
+# Nombre d'échantillons de retard conservés pour les percentiles récents
+LAG_HISTORY = 600
+# Blocages conservés (avec leur pile)
+BLOCKING_HISTORY = 50
+
+
+class ProfilerBusyError(Exception):
+    """Levée quand un profilage est déjà en cours"""
+
+
+def _percentile(ordered, percentile):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percentile))]
+
+
+class LoopMonitor:
+    """Échantillonne le retard de la boucle et, en mode debug, surveille ses blocages depuis un thread"""
+
+    def __init__(self, interval=0.1, threshold=0.1, debug=False):
+        self.interval = interval
+        self.threshold = threshold
+        self.debug = debug
+        self._lags = deque(maxlen=LAG_HISTORY)    # ms
+        self._last_tick = None
+        self._loop_thread_id = None
+        self._task = None
+        self._watchdog = None
+        self._stop = threading.Event()
+        self._pending = None                      # blocage relevé, durée finale pas encore connue
+        self.blocking_events = deque(maxlen=BLOCKING_HISTORY)
+        self.blocked = 0
+        self.max_lag = 0.0
+
+    @property
+    def loop_thread_id(self):
+        return self._loop_thread_id
+
+    def start(self):
+        """Démarre l'échantillonnage sur la boucle courante (et la surveillance en mode debug)"""
+        loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = time.monotonic()
+        self._task = loop.create_task(self._sample())
+        if self.debug:
+            loop.set_debug(True)
+            loop.slow_callback_duration = self.threshold
+            self._stop.clear()
+            self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._watchdog.start()
+
+    async def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._watchdog is not None:
+            await asyncio.to_thread(self._watchdog.join, 1)
+            self._watchdog = None
+
+    async def _sample(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            self._last_tick = time.monotonic()
+            self._lags.append(lag * 1000)
+            self.max_lag = max(self.max_lag, lag * 1000)
+            EVENT_LOOP_LAG.observe(lag)
+            pending, self._pending = self._pending, None
+            if pending is not None:
+                # La boucle a repris : durée totale du blocage relevé
+                pending["blocked_ms"] = round(lag * 1000, 1)
+
+    def _watch(self):
+        reported = None
+        period = min(self.interval, self.threshold) / 2
+        while not self._stop.wait(period):
+            last_tick = self._last_tick
+            blocked_for = time.monotonic() - last_tick - self.interval
+            # Un seul relevé par blocage (la boucle n'a pas avancé depuis)
+            if blocked_for <= self.threshold or reported == last_tick:
+                continue
+            reported = last_tick
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+            event = {
+                "at": datetime.now().isoformat(),
+                "blocked_ms": round(blocked_for * 1000, 1),
+                "stack": stack,
+            }
+            self.blocking_events.append(event)
+            self._pending = event
+            self.blocked += 1
+            EVENT_LOOP_BLOCKED.inc()
+            logger.warning(f"Event loop blocked for more than {self.threshold * 1000:.0f} ms, current call:\n{stack}")
+
+    def lag_summary(self):
+        ordered = sorted(self._lags)
+        if not ordered:
+            return {"samples": 0}
+        return {
+            "samples": len(ordered),
+            "p50": round(_percentile(ordered, 0.5), 2),
+            "p99": round(_percentile(ordered, 0.99), 2),
+            "max": round(ordered[-1], 2),
+            "max_since_start": round(self.max_lag, 2),
+        }
+
+    def stats(self):
+        return {
+            "interval_ms": self.interval * 1000,
+            "debug": self.debug,
+            "threshold_ms": self.threshold * 1000,
+            "lag_ms": self.lag_summary(),
+            "blocked": self.blocked,
+        }
+
+    def report(self):
+        """Statistiques et blocages récents avec leur pile (le plus récent en dernier)"""
+        return dict(self.stats(), blocking_events=list(self.blocking_events))
+
+
+def _folded(frame, prefix=""):
+    """Pile d'un thread en une ligne "racine;...;feuille" (fichier:fonction)"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    names.reverse()
+    return ";".join(([prefix] if prefix else []) + names)
+
+
+class SamplingProfiler:
+    """Profileur par échantillonnage des piles (un profilage à la fois, dans un thread à part)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.runs = 0
+
+    def profile(self, seconds, interval, thread_id=None):
+        """
+        Relève les piles pendant seconds secondes, toutes les interval secondes
+
+        Args:
+            thread_id: thread profilé (None = tous sauf le profileur)
+
+        Returns:
+            tuple: (nombre d'échantillons, Counter pile "folded" -> occurrences)
+
+        Raises:
+            ProfilerBusyError: si un profilage est déjà en cours
+        """
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusyError("A profile is already running")
+        try:
+            own_id = threading.get_ident()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks = Counter()
+            samples = 0
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                for ident, frame in sys._current_frames().items():
+                    if ident == own_id or (thread_id is not None and ident != thread_id):
+                        continue
+                    stacks[_folded(frame, "" if thread_id is not None else names.get(ident, str(ident)))] += 1
+                samples += 1
+                time.sleep(interval)
+            self.runs += 1
+            return samples, stacks
+        finally:
+            self._lock.release()
+
+
+def summarize_profile(samples, stacks, top=20):
+    """Fonctions les plus présentes : en propre (feuille de la pile) et cumulé (n'importe où dans la pile)"""
+    own, total = Counter(), Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(";")
+        own[frames[-1]] += count
+        for name in set(frames):
+            total[name] += count
+
+    def as_rows(counter):
+        return [
+            {"function": name, "samples": count, "percent": round(100 * count / samples, 1) if samples else 0.0}
+            for name, count in counter.most_common(top)
+        ]
+
+    return {"samples": samples, "own": as_rows(own), "cumulative": as_rows(total)}
+
+
+def folded_text(stacks):
+    """Piles au format "folded" (flamegraph.pl, speedscope)"""
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+# Instances globales pour réutilisation
+loop_monitor = None
+profiler = None
+
+def get_loop_monitor():
+    """Retourne le moniteur de la boucle (singleton configuré par Config)"""
+    global loop_monitor
+    if loop_monitor is None:
+        loop_monitor = LoopMonitor(
+            interval=Config.DIAGNOSTICS_LAG_INTERVAL_MS / 1000,
+            threshold=Config.BLOCKING_THRESHOLD_MS / 1000,
+            debug=Config.DIAGNOSTICS_DEBUG
+        )
+    return loop_monitor
+
+def get_profiler():
+    """Retourne le profileur par échantillonnage (singleton)"""
+    global profiler
+    if profiler is None:
+        profiler = SamplingProfiler()
+    return profiler
@@ -0,0 +1,288 @@
+"""
+Chemin rapide déterministe pour les commandes simples
+Reconnaît en français les commandes allumer / éteindre / ouvrir / fermer
+(appareil par appareil ou "tout") et les questions sur l'état de la maison,
+construit l'état mis à jour localement et répond sans appeler le LLM.
+En cas de doute (mot inconnu, négation, cible ambiguë), on rend la main à Gemini
+"""
+from config import Config
+from response_cache import normalize_command
+
+# Verbes d'action -> (type d'appareil, valeur)
+ACTION_VERBS = {
+    "allume": ("light", True), "allumer": ("light", True), "allumes": ("light", True),
+    "rallume": ("light", True), "active": ("light", True), "activer": ("light", True),
+    "eteins": ("light", False), "eteindre": ("light", False), "eteint": ("light", False),
+    "coupe": ("light", False), "couper": ("light", False),
+    "desactive": ("light", False), "desactiver": ("light", False),
+    "ouvre": ("door", "on"), "ouvrir": ("door", "on"),
+    "ferme": ("door", "off"), "fermer": ("door", "off"),
+}
+
+# Adjectifs utilisés dans les questions ("le salon est allumé ?")
+STATE_ADJECTIVES = {
+    "allume": True, "allumee": True, "allumes": True, "allumees": True,
+    "eteint": False, "eteinte": False, "eteints": False, "eteintes": False,
+    "ouvert": "on", "ouverte": "on", "ouverts": "on", "ouvertes": "on",
+    "ferme": "off", "fermee": "off", "fermes": "off", "fermees": "off",
+}
+
+# Pièces (avec les formes élidées que laisse la validation de ProcessRequest)
+LOCATIONS = {
+    "salon": "salon", "cuisine": "cuisine", "chambre": "chambre",
+    "exterieur": "exterieur", "exterieure": "exterieur", "exterieures": "exterieur",
+    "lexterieur": "exterieur", "dehors": "exterieur", "jardin": "exterieur",
+    "garage": "garage",
+    "entree": "salon", "lentree": "salon", "dentree": "salon", "principale": "salon",
+}
+DOOR_BY_LOCATION = {"salon": "door1", "garage": "door2"}
+
+ALL_WORDS = {"tout", "toute", "toutes", "tous"}
+DOOR_WORDS = {"porte", "portes"}
+QUESTION_WORDS = {"est", "sont", "quel", "quelle", "quels", "quelles", "etat"}
+LIGHT_WORDS = {"lumiere", "lumieres", "lampe", "lampes", "eclairage"}
+# Négations, exceptions et conditions temporelles : toujours laissées au LLM
+REJECT_WORDS = {
+    "ne", "n", "pas", "jamais", "plus", "sauf", "excepte", "hormis", "si", "quand",
+    "apres", "avant", "minute", "minutes", "heure", "heures", "seconde", "secondes",
+    "demain", "soir", "matin", "nuit",
+}
+STOP_WORDS = {
+    "le", "la", "les", "l", "de", "du", "des", "d", "et", "a", "au", "aux", "en",
+    "dans", "maison", "moi", "aussi", "maintenant", "ce", "que", "qu", "il", "y",
+    "peux", "tu", "veux", "je",
+}
+
+LIGHT_NOUNS = {
+    "salon": "la lumière du salon",
+    "cuisine": "la lumière de la cuisine",
+    "chambre": "la lumière de la chambre",
+    "exterieur": "la lumière extérieure",
+    "garage": "la lumière du garage",
+}
+DOOR_NOUNS = {"door1": "la porte du salon", "door2": "la porte du garage"}
+LOCATION_NAMES = {
+    "salon": "le salon", "cuisine": "la cuisine", "chambre": "la chambre",
+    "exterieur": "l'extérieur", "garage": "le garage",
+}
+LIGHTS = tuple(LIGHT_NOUNS)
+DOORS = tuple(DOOR_NOUNS)
+
+# Compteurs exposés sur /stats
+fast_path_stats = {"handled": 0, "fallback": 0}
+
+
+def _join(items):
+    items = list(items)
+    if len(items) == 1:
+        return items[0]
+    return ", ".join(items[:-1]) + " et " + items[-1]
+
+def _adjective(field, value, plural=False):
+    if field in DOORS:
+        word = "ouverte" if value == "on" else "fermée"
+    else:
+        word = "allumée" if value else "éteinte"
+    return word + "s" if plural else word
+
+def _noun(field):
+    return LIGHT_NOUNS.get(field) or DOOR_NOUNS[field]
+
+
+def parse_intent(text):
+    """
+    Analyse une commande et retourne l'intention reconnue
+
+    Returns:
+        dict: {"intent": "set" | "query" | None, "changes": {...}, "fields": [...],
+               "expected": valeur demandée dans une question, "confidence": float}
+    """
+    words = normalize_command(text).split()
+    result = {"intent": None, "changes": {}, "fields": [], "expected": None, "confidence": 0.0}
+    if not words or any(w in REJECT_WORDS or w.isdigit() for w in words):
+        return result
+
+    is_query = words[0] in QUESTION_WORDS or "est" in words or "sont" in words
+    known = 0
+    clauses = []      # [(type, valeur, [cibles])]
+    queried = []
+    expected = None
+    door_mode = False
+    door_noun = False     # "porte" nommée dans la proposition en cours
+
+    for word in words:
+        if not is_query and word in ACTION_VERBS:
+            kind, value = ACTION_VERBS[word]
+            clauses.append((kind, value, []))
+            door_mode = kind == "door"
+            door_noun = False
+        elif is_query and word in STATE_ADJECTIVES:
+            expected = STATE_ADJECTIVES[word]
+        elif word in DOOR_WORDS:
+            door_mode = True
+            door_noun = True
+        elif word in LIGHT_WORDS:
+            if not is_query and clauses and clauses[-1][0] == "door":
+                # "ouvre / ferme la lumière" : allume / éteint ; si la proposition vise
+                # aussi une porte, on laisse le LLM trancher
+                kind, value, targets = clauses[-1]
+                if door_noun or targets not in ([], ["all_doors"]):
+                    return result
+                if targets:
+                    # "ferme toutes les lumières" : "toutes" a été lu avant le nom
+                    targets[0] = "all_lights"
+                clauses[-1] = ("light", value == "on", targets)
+                door_mode = False
+        elif word in LOCATIONS:
+            location = LOCATIONS[word]
+            targets = queried if is_query else (clauses[-1][2] if clauses else None)
+            if targets is None:
+                return result
+            if door_mode:
+                door = DOOR_BY_LOCATION.get(location)
+                if door is None:
+                    return result
+                targets.append(door)
+            else:
+                targets.append(location)
+            if is_query or clauses[-1][0] == "light":
+                door_mode = False
+        elif word in ALL_WORDS:
+            targets = queried if is_query else (clauses[-1][2] if clauses else None)
+            if targets is None:
+                return result
+            targets.append("all_doors" if door_mode else "all_lights")
+        elif word not in STOP_WORDS and word not in QUESTION_WORDS:
+            continue
+        known += 1
+
+    confidence = known / len(words)
+
+    if is_query:
+        if not queried:
+            if door_mode:
+                queried = ["all_doors"]
+            elif any(w in LIGHT_WORDS for w in words):
+                queried = ["all_lights"]
+        # "le garage est ouvert ?" porte sur la porte, pas sur la lumière
+        if isinstance(expected, str):
+            queried = [DOOR_BY_LOCATION.get(f, f) for f in queried]
+        result.update(intent="query", fields=queried or ["summary"], expected=expected, confidence=confidence)
+        return result
+
+    changes = {}
+    for kind, value, targets in clauses:
+        if not targets:
+            # Verbe sans cible ("ferme la porte" sans préciser laquelle) : ambigu
+            return result
+        for target in targets:
+            if target == "all_lights":
+                fields = LIGHTS if kind == "light" else DOORS
+            elif target == "all_doors":
+                fields = DOORS
+            elif target in DOORS:
+                fields = (target,)
+            elif kind == "door":
+                door = DOOR_BY_LOCATION.get(target)
+                if door is None:
+                    return result
+                fields = (door,)
+            else:
+                fields = (target,)
+            for field in fields:
+                if (field in DOORS) != (kind == "door"):
+                    return result
+                changes[field] = value
+
+    if changes:
+        result.update(intent="set", changes=changes, confidence=confidence)
+    return result
+
+
+def _describe_changes(changes, state):
+    """Phrase de confirmation pour les changements demandés"""
+    parts = []
+    groups = {}
+    for field, value in changes.items():
+        groups.setdefault((field in DOORS, value), []).append(field)
+
+    for (is_door, value), fields in groups.items():
+        every = DOORS if is_door else LIGHTS
+        if len(fields) > 1 and set(fields) == set(every):
+            noun = "toutes les portes" if is_door else "toutes les lumières"
+        else:
+            noun = _join(_noun(f) for f in fields)
+        verb = "sont" if len(fields) > 1 else "est"
+        parts.append(f"{noun} {verb} {_adjective(fields[0], value, plural=len(fields) > 1)}")
+
+    already = all(state.get(f) == v for f, v in changes.items())
+    prefix = "C'est déjà le cas" if already else "C'est fait"
+    return f"{prefix}, {_join(parts)} !"
+
+
+def _describe_state(fields, expected, state):
+    """Réponse à une question sur l'état de la maison, ou None si l'état est inconnu"""
+    if fields == ["summary"] or "all_lights" in fields or "all_doors" in fields:
+        sentences = []
+        if fields == ["summary"] or "all_lights" in fields:
+            if any(l not in state for l in LIGHTS):
+                return None
+            lit = [LOCATION_NAMES[l] for l in LIGHTS if state[l]]
+            sentences.append(
+                f"Les lumières allumées sont : {_join(lit)}." if lit else "Toutes les lumières sont éteintes."
+            )
+        if fields == ["summary"] or "all_doors" in fields:
+            if any(d not in state for d in DOORS):
+                return None
+            opened = [DOOR_NOUNS[d] for d in DOORS if state[d] == "on"]
+            sentences.append(
+                f"{_join(opened).capitalize()} {'sont ouvertes' if len(opened) > 1 else 'est ouverte'}."
+                if opened else "Toutes les portes sont fermées."
+            )
+        return " ".join(sentences)
+
+    sentences = []
+    for field in fields:
+        if field not in state:
+            return None
+        fact = f"{_noun(field)} est {_adjective(field, state[field])}."
+        if expected is not None and type(expected) == type(state[field]):
+            fact = ("Oui, " if state[field] == expected else "Non, ") + fact
+        else:
+            fact = fact[0].upper() + fact[1:]
+        sentences.append(fact)
+    return " ".join(sentences)
+
+
+def try_fast_path(text, state, min_confidence=None):
+    """
+    Tente de répondre localement à une commande
+
+    Args:
+        text (str): Commande de l'utilisateur
+        state (dict): État actuel de la maison
+        min_confidence (float): Seuil en dessous duquel on laisse le LLM répondre
+
+    Returns:
+        dict: Réponse au format ProcessResponse, ou None pour repasser par Gemini
+    """
+    if min_confidence is None:
+        min_confidence = Config.FAST_PATH_MIN_CONFIDENCE
+
+    intent = parse_intent(text)
+    message = None
+    if intent["intent"] and intent["confidence"] >= min_confidence:
+        if intent["intent"] == "set":
+            message = _describe_changes(intent["changes"], state)
+        else:
+            message = _describe_state(intent["fields"], intent["expected"], state)
+
+    if message is None:
+        fast_path_stats["fallback"] += 1
+        return None
+
+    fast_path_stats["handled"] += 1
+    response = dict(state)
+    response.update(intent["changes"])
+    response["assistant_response"] = message
+    return response
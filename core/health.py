@@ -0,0 +1,130 @@
+"""
+Sondes de disponibilité pour /health
+Chaque sonde vérifie réellement une dépendance (API Gemini, disjoncteurs, pools,
+magasins SQLite, ffmpeg). Les résultats sont mis en cache quelques secondes :
+un /health appelé en boucle par un répartiteur ne sollicite pas l'API Gemini à chaque fois
+"""
+import asyncio
+import shutil
+import time
+
+from clients import get_http_client
+from config import Config
+from model_router import get_router
+from session_registry import get_session_registry
+from state_store import get_state_store
+from upstream import get_upstreams_stats
+from workers import get_pools_stats
+
+# Instant de démarrage du processus (uptime)
+STARTED_AT = time.time()
+
+# Sondes dont l'échec rend le service indisponible (les autres le dégradent seulement)
+CRITICAL_CHECKS = ("gemini", "state_store", "session_registry")
+
+
+async def _check_gemini():
+    """Métadonnées du modèle principal des commandes : clé valide et API joignable"""
+    api_key = Config.GEMINI_API_KEY
+    if not api_key:
+        return False, "GEMINI_API_KEY is not set"
+    model = get_router("command").primary
+    response = await get_http_client().get(
+        f"{Config.GEMINI_BASE_URL}/v1beta/models/{model}",
+        headers={"x-goog-api-key": api_key},
+        timeout=Config.HEALTH_PROBE_TIMEOUT
+    )
+    if response.status_code != 200:
+        return False, f"{model}: HTTP {response.status_code}"
+    return True, model
+
+
+async def _check_breakers():
+    opened = [name for name, stats in get_upstreams_stats().items() if stats["circuit"] == "open"]
+    return not opened, f"open: {', '.join(opened)}" if opened else "closed"
+
+
+async def _check_workers():
+    saturated = [
+        name for name, stats in get_pools_stats().items()
+        if stats["queued"] >= stats["max_queue"]
+    ]
+    return not saturated, f"saturated: {', '.join(saturated)}" if saturated else "ok"
+
+
+async def _check_state_store():
+    await get_state_store().get("health")
+    return True, "persistent" if get_state_store().persist_path else "memory"
+
+
+async def _check_session_registry():
+    await get_session_registry().get("health")
+    return True, get_session_registry().backend
+
+
+async def _check_ffmpeg():
+    # Nécessaire au prétraitement des formats compressés (webm, ogg)
+    path = shutil.which("ffmpeg")
+    return path is not None, path or "not found"
+
+
+CHECKS = {
+    "gemini": _check_gemini,
+    "breakers": _check_breakers,
+    "workers": _check_workers,
+    "state_store": _check_state_store,
+    "session_registry": _check_session_registry,
+    "ffmpeg": _check_ffmpeg,
+}
+
+
+class HealthProbe:
+    """Exécute les sondes en parallèle, avec un résultat commun mis en cache"""
+
+    def __init__(self, ttl_seconds):
+        self.ttl_seconds = ttl_seconds
+        self._result = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def _run_check(self, name, check):
+        start = time.perf_counter()
+        try:
+            ok, detail = await asyncio.wait_for(check(), Config.HEALTH_PROBE_TIMEOUT)
+        except Exception as e:
+            ok, detail = False, f"{type(e).__name__}: {e}"
+        return name, {"ok": ok, "detail": detail, "ms": round((time.perf_counter() - start) * 1000, 1)}
+
+    async def check(self):
+        """
+        Returns:
+            dict: status ("healthy", "degraded" ou "unhealthy"), résultat de chaque sonde
+                et date de la vérification
+        """
+        async with self._lock:
+            if self._result is None or time.monotonic() - self._checked_at > self.ttl_seconds:
+                results = dict(await asyncio.gather(*(self._run_check(name, check) for name, check in CHECKS.items())))
+                if any(not results[name]["ok"] for name in CRITICAL_CHECKS):
+                    status = "unhealthy"
+                elif all(result["ok"] for result in results.values()):
+                    status = "healthy"
+                else:
+                    status = "degraded"
+                self._result = {"status": status, "checks": results, "checked_at": time.time()}
+                self._checked_at = time.monotonic()
+            return self._result
+
+
+# Instance globale pour réutilisation
+health_probe = None
+
+def get_health_probe():
+    """Retourne les sondes de disponibilité (singleton)"""
+    global health_probe
+    if health_probe is None:
+        health_probe = HealthProbe(Config.HEALTH_CACHE_SECONDS)
+    return health_probe
+
+
+def uptime_seconds():
+    return round(time.time() - STARTED_AT, 1)
@@ -0,0 +1,49 @@
+"""
+Utilitaires sur l'état de la maison
+Le client envoie l'état sous forme de fragment JSON sans accolades
+("\"salon\": false, \"cuisine\": true, ..."), on le convertit ici en dict
+"""
+import json
+
+# Appareils pilotables et capteurs, tels qu'exposés par ProcessResponse
+LIGHT_FIELDS = ("salon", "cuisine", "chambre", "exterieur", "garage")
+DOOR_FIELDS = ("door1", "door2")
+SENSOR_FIELDS = ("smoke", "presence", "auth")
+DEVICE_FIELDS = LIGHT_FIELDS + SENSOR_FIELDS + DOOR_FIELDS
+
+# Champs qui changent à chaque requête sans refléter l'état des appareils
+VOLATILE_FIELDS = ("time", "assistant_response")
+
+def parse_home_state(all_state):
+    """Convertit le fragment JSON envoyé par le client en dict (vide si invalide)"""
+    if not all_state or not all_state.strip():
+        return {}
+    raw = all_state.strip()
+    if not raw.startswith("{"):
+        raw = "{" + raw + "}"
+    try:
+        state = json.loads(raw)
+    except json.JSONDecodeError:
+        return {}
+    return state if isinstance(state, dict) else {}
+
+def canonical_state(state):
+    """Sérialisation stable de l'état des appareils (clés triées, sans champs volatils)"""
+    devices = {k: v for k, v in state.items() if k not in VOLATILE_FIELDS}
+    return json.dumps(devices, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+def merge_state_diff(state, diff):
+    """
+    État complet à partir de l'état courant et des champs renvoyés par le modèle
+
+    Les valeurs d'appareils invalides sont ignorées ; les autres champs
+    (assistant_response, transcription) sont repris tels quels.
+    """
+    merged = dict(state)
+    for field, value in diff.items():
+        if field in LIGHT_FIELDS and not isinstance(value, bool):
+            continue
+        if field in DOOR_FIELDS and value not in ("on", "off"):
+            continue
+        merged[field] = value
+    return merged
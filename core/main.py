@@ -1,29 +1,60 @@
 import asyncio
 import logging
 import os
-import json
-import uuid
-import tempfile
+import secrets
+import time
 from datetime import datetime
 from typing import Optional, Dict, Any
 from contextlib import asynccontextmanager
 
-import aiofiles
-import httpx
-from fastapi import FastAPI, File, UploadFile, HTTPException, Request, BackgroundTasks
-from fastapi.responses import JSONResponse, FileResponse, HTMLResponse
+from fastapi import FastAPI, File, Form, UploadFile, HTTPException, Request, BackgroundTasks, Depends
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, FileResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.security import HTTPBearer
-from pydantic import BaseModel, Field, validator
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from pydantic import BaseModel, Field, ValidationError, validator
 from starlette.middleware.sessions import SessionMiddleware
 import socketio
 
 from dotenv import load_dotenv
-from audio_processing import save_temp_file, clean_temp_file, cleanup_old_temp_files, get_file_size_mb
-from speech_to_text import transcribe_audio
-from tts import speech
-from ai_response import generate_ai_response
+from audio_processing import (
+    clean_temp_file, cleanup_old_temp_files, get_file_size_mb, encode_audio, ENCODED_FORMATS,
+    MAX_UPLOAD_BYTES, AUDIO_MIME_TYPES, UploadTooLargeError, SilentAudioError, pcm_to_wav, preprocess_audio,
+    iter_upload, read_audio_upload, resolve_mime_type, extension_for_mime
+)
+from audio_stream import AudioBroadcast, wav_stream_header, PCM_SAMPLE_RATE, PCM_CHANNELS, PCM_SAMPLE_WIDTH
+from speech_to_text import transcribe_audio_async, transcribe_audio_bytes_async
+from vad import EnergyVAD
+from tts import speech_async, speech_stream_to_file, cleanup_old_audio_files
+from artifact_store import get_artifact_store
+from tts_cache import get_tts_cache
+from ai_response import (
+    generate_ai_response_async, generate_voice_response_async, stream_ai_response_async,
+    complete_response, token_stats
+)
+from streaming import IncrementalResponseParser
+from prompts import SYSTEM_PROMPT_TOKENS, build_user_prompt, estimate_tokens
 from config import Config
+from clients import init_clients, close_clients, get_http_client
+from home_state import VOLATILE_FIELDS, parse_home_state
+from fast_path import try_fast_path, fast_path_stats
+from response_cache import get_response_cache
+from state_store import StaleStateError, device_changes, get_state_store, snapshot_changes, validate_changes
+from session_registry import audio_key, get_session_registry, parts_key
+from socket_queue import client_manager_stats, create_client_manager
+from rooms import (
+    DebouncedEmitter, client_identity, home_room, new_home_id, new_session_id, session_room,
+    valid_home_id, valid_session_id
+)
+from singleflight import get_flights_stats
+from upstream import UpstreamError, DeadlineExceededError, deadline, get_upstreams_stats
+from model_router import get_routers_stats
+from metrics import HTTP_REQUEST_DURATION, TraceIdFilter, new_trace, render_metrics, server_timing, stage
+from health import get_health_probe, uptime_seconds
+from diagnostics import (
+    ProfilerBusyError, folded_text, get_loop_monitor, get_profiler, summarize_profile
+)
+from workers import PoolSaturatedError, get_stt_pool, get_tts_pool, get_pools_stats, shutdown_pools
 
 # Load environment variables
 load_dotenv()
@@ -33,8 +64,17 @@ def validate_environment():
     """Validate that required environment variables are set"""
     missing_vars = Config.validate_required_keys()
     if missing_vars:
-        print(f"Warning: Missing required environment variables: {', '.join(missing_vars)}")
-        print("Some core features will not work properly without these variables.")
+        logger.warning(f"Missing required environment variables: {', '.join(missing_vars)}. "
+                       "Some core features will not work properly without these variables.")
+    
+    if Config.WEB_CONCURRENCY > 1:
+        # Per-process defaults that break as soon as requests are spread over several workers
+        if not os.getenv("SESSION_SECRET_KEY"):
+            logger.warning("SESSION_SECRET_KEY is not set: session cookies are not shared between workers")
+        if Config.SESSION_REGISTRY_BACKEND == "memory":
+            logger.warning("SESSION_REGISTRY_BACKEND=memory: /audio only works on the worker that synthesized it")
+        if not Config.STATE_STORE_PATH:
+            logger.warning("STATE_STORE_PATH is not set: each worker keeps its own home state")
         
     return len(missing_vars) == 0
 
@@ -42,7 +82,9 @@ def validate_environment():
 class ProcessRequest(BaseModel):
     text: str = Field(..., min_length=1, max_length=1000, description="Voice command text")
     state: Optional[str] = Field("", description="Current device state")
-    all_state: Optional[str] = Field("", description="Complete home state JSON")
+    all_state: Optional[str] = Field("", description="Complete home state JSON (optional once the server holds the home state)")
+    home_id: Optional[str] = Field(None, max_length=64, description="Home (id from POST /home) whose server-side state is used (stateless if omitted)")
+    stream: bool = Field(False, description="Stream device updates and sentence audio over Socket.IO")
     
     @validator('text')
     def sanitize_text(cls, v):
@@ -59,6 +101,7 @@ class HealthResponse(BaseModel):
 
 class TranscriptionResponse(BaseModel):
     transcription: str
+    session_id: Optional[str] = None
 
 class ProcessResponse(BaseModel):
     salon: Optional[bool] = None
@@ -73,45 +116,188 @@ class ProcessResponse(BaseModel):
     door2: Optional[str] = None
     time: Optional[str] = None
     assistant_response: str
+    session_id: Optional[str] = Field(None, description="Session whose audio is served by /audio and sent to its Socket.IO room")
+
+class HomeStateResponse(BaseModel):
+    home_id: str
+    version: int
+    state: Dict[str, Any]
+
+class VoiceResponse(BaseModel):
+    transcription: str
+    response: ProcessResponse
+    mode: str = Field(..., description="single_call or two_step")
+    session_id: Optional[str] = None
+
+class SessionResponse(BaseModel):
+    session_id: str
+
+class HomeResponse(BaseModel):
+    home_id: str
 
-# Global storage for user sessions and audio files
-user_audio_files: Dict[str, str] = {}
-user_sessions: Dict[str, str] = {}
+# Speech being synthesized, by session (finished audio is in the session registry)
+audio_streams: Dict[str, AudioBroadcast] = {}
+# Socket.IO microphone streams, by sid
+voice_streams: Dict[str, Dict[str, Any]] = {}
+# Sample rates accepted for streamed PCM (telephony to studio)
+MIN_STREAM_SAMPLE_RATE = 8000
+MAX_STREAM_SAMPLE_RATE = 48000
+
+# Strong references to fire-and-forget tasks so they are not garbage collected
+background_jobs: set = set()
+
+def spawn(coro) -> asyncio.Task:
+    """Run a coroutine in the background, outside the request lifecycle"""
+    task = asyncio.create_task(coro)
+    background_jobs.add(task)
+    task.add_done_callback(background_jobs.discard)
+    return task
 
 # Setup logging
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    format='%(asctime)s - %(name)s - %(levelname)s - [%(trace_id)s] %(message)s'
 )
+for log_handler in logging.getLogger().handlers:
+    log_handler.addFilter(TraceIdFilter())
 logger = logging.getLogger(__name__)
 
-# Async HTTP client for API calls
-async def get_http_client():
-    return httpx.AsyncClient(timeout=30.0)
+def upstream_http_error(e: UpstreamError) -> HTTPException:
+    """Map a failed Gemini call to a client-facing error (504 past the deadline, 503 otherwise)"""
+    status_code = 504 if isinstance(e, DeadlineExceededError) else 503
+    headers = {"Retry-After": str(int(e.retry_after))} if e.retry_after else None
+    return HTTPException(status_code=status_code, detail=str(e), headers=headers)
 
-async def gen_response(sys_prompt: str, user_prompt: str) -> Dict[str, Any]:
+async def gen_response(home_state: Dict[str, Any], user_prompt: str) -> Dict[str, Any]:
     """Generate response using the separated AI module"""
     try:
-        # Extraire l'état de la maison du prompt système
-        # Le prompt contient l'état entre les premiers { }
-        import re
-        state_match = re.search(r'\{([^}]+)\}', sys_prompt)
-        home_state = state_match.group(1) if state_match else ""
-        
-        # Utiliser le module séparé
-        response = generate_ai_response(user_prompt, home_state)
+        # Utiliser le module séparé, sans bloquer la boucle d'événements
+        response = await generate_ai_response_async(user_prompt, home_state, get_http_client())
         return response
         
+    except UpstreamError as e:
+        raise upstream_http_error(e)
+    except ValueError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"AI response generation failed: {str(e)}")
+
+async def stream_response(home_state: Dict[str, Any], user_prompt: str, session_id: str) -> Dict[str, Any]:
+    """Stream the AI response: push device updates as soon as they are final
+    and start speech synthesis sentence by sentence while the rest arrives"""
+    parser = IncrementalResponseParser()
+    speech_parts = []
+    await get_session_registry().set(parts_key(session_id), {})
+    
+    async def dispatch(events):
+        # Preview for the requesting session only (no version yet): the validated diff is
+        # committed and sent to the home as state_update once the response is complete
+        updates = device_changes({event[1]: event[2] for event in events if event[0] == "field"})
+        if updates:
+            emitter.queue('state_preview', {'session_id': session_id, 'state': updates}, session_room(session_id))
+        for event in events:
+            if event[0] == "sentence":
+                speech_parts.append(spawn(generate_speech_part(event[1], session_id, len(speech_parts))))
+    
+    try:
+        async for chunk in stream_ai_response_async(user_prompt, home_state, get_http_client()):
+            await dispatch(parser.feed(chunk))
+        response, events = parser.finish()
+        response = complete_response(home_state, response)
+        await dispatch(events)
+    except UpstreamError as e:
+        raise upstream_http_error(e)
     except ValueError as e:
         raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"AI response generation failed: {str(e)}")
+    
+    spawn(finish_speech_parts(session_id, speech_parts))
+    return response
+
+async def merge_home_state(home_id: str, changes: Dict[str, Any]) -> Dict[str, Any]:
+    """Apply changes to the server-side state of a home (new version only if a field differs)
+    and push the fields that changed to the clients of the home"""
+    store = get_state_store()
+    _, current = await store.get(home_id)
+    changed = {field: value for field, value in changes.items() if current.get(field) != value}
+    version, state = await store.update(home_id, changes)
+    if changed:
+        emitter.queue('state_update', {'home_id': home_id, 'version': version, 'state': changed}, home_room(home_id))
+    return state
+
+async def load_home_state(home_id: Optional[str], all_state: Optional[str]) -> Dict[str, Any]:
+    """Home state used for a command. Without a home_id the request is stateless, as before:
+    the all_state snapshot is used as is. With one, the snapshot (sensors, devices switched
+    by hand) is merged into the server-side state, which is used when all_state is omitted"""
+    snapshot = parse_home_state(all_state or "")
+    if not home_id:
+        return snapshot
+    if not valid_home_id(home_id):
+        raise HTTPException(status_code=403, detail="Invalid home_id")
+    if snapshot:
+        state = await merge_home_state(home_id, snapshot_changes(snapshot))
+    else:
+        _, state = await get_state_store().get(home_id)
+    # The current time is not stored: it comes from the request
+    if isinstance(snapshot.get("time"), str):
+        state["time"] = snapshot["time"]
+    return state
+
+async def commit_home_state(home_id: Optional[str], response: Dict[str, Any]):
+    """Record the devices switched by a command in the state of its home (if any)"""
+    if home_id:
+        await merge_home_state(home_id, device_changes(response))
+
+async def run_command(data: ProcessRequest, session_id: str) -> tuple[Dict[str, Any], bool]:
+    """Command pipeline shared by /process and streamed voice input:
+    local fast path, then response cache, then the LLM.
+    Returns the response and whether its speech was already started while streaming"""
+    text = data.text
+    logger.info(f"Processing text ({len(text)} characters)")
+    streamed = False
+
+    # Simple device commands are answered locally, repeated ones from the cache
+    home_state = await load_home_state(data.home_id, data.all_state)
+    cache = get_response_cache()
+    response = try_fast_path(text, home_state) if Config.FAST_PATH_ENABLED else None
+    if response is not None:
+        logger.info("Command handled by the local fast path")
+    else:
+        response = await cache.get(text, home_state) if cache else None
+        if response is not None:
+            logger.info("AI response served from cache")
+            if "time" in home_state:
+                response["time"] = home_state["time"]
+        else:
+            # Generate response
+            logger.info("Generating AI response")
+            logger.info(f"Estimated prompt size: {SYSTEM_PROMPT_TOKENS + estimate_tokens(build_user_prompt(text, home_state))} tokens")
+            if data.stream and Config.LLM_STREAMING_ENABLED:
+                response = await stream_response(home_state, text, session_id)
+                streamed = True
+            else:
+                response = await gen_response(home_state, text)
+            logger.info("AI response generated successfully")
+            if cache and "assistant_response" in response:
+                await cache.put(text, home_state, response)
+    
+    # Validate response structure
+    if "assistant_response" not in response:
+        logger.error("Missing assistant_response in AI response")
+        raise HTTPException(status_code=502, detail="Missing assistant_response in AI response")
+    
+    await commit_home_state(data.home_id, response)
+    return response, streamed
 
 def get_user_session(request: Request) -> str:
-    """Get or create a unique session ID for the user"""
-    session_id = request.session.get('session_id')
+    """Get or create a unique session ID for the user. Clients that cannot rely on the
+    cookie (cross-origin front end) send the session_id they were given in X-Session-ID.
+    Only ids signed by this server are accepted: a guessed or made-up id starts a new session"""
+    session_id = valid_session_id(request.headers.get('x-session-id')) or valid_session_id(request.session.get('session_id'))
     if not session_id:
-        session_id = str(uuid.uuid4())[:8]
+        session_id = new_session_id()
+    if request.session.get('session_id') != session_id:
         request.session['session_id'] = session_id
     return session_id
 
@@ -123,9 +309,9 @@ def validate_audio_file(file: UploadFile) -> tuple[bool, str]:
     if not file.filename:
         return False, "No file selected"
     
-    # Check file size (max 10MB)
+    # Check file size (max 10MB, enforced again while reading)
     if hasattr(file, 'size') and file.size:
-        if file.size > 10 * 1024 * 1024:
+        if file.size > MAX_UPLOAD_BYTES:
             return False, "File too large (max 10MB)"
         if file.size == 0:
             return False, "Empty file not allowed"
@@ -144,16 +330,34 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting Homelinks AI Assistant API")
     validate_environment()
+    init_clients()
+    get_response_cache()
+    get_state_store()
+    get_session_registry()
+    get_tts_cache()
+    get_stt_pool()
+    get_tts_pool()
+    # Files left by a previous run are collected once, then the indexed sweeper takes over
+    await asyncio.to_thread(cleanup_old_temp_files)
+    await asyncio.to_thread(cleanup_old_audio_files)
+    sweeper = spawn(get_artifact_store().run_sweeper(Config.ARTIFACT_SWEEP_INTERVAL))
+    get_loop_monitor().start()
     yield
     # Shutdown
     logger.info("Shutting down Homelinks AI Assistant API")
-    # Cleanup any remaining audio files
-    for audio_file in user_audio_files.values():
-        try:
-            if os.path.exists(audio_file):
-                os.remove(audio_file)
-        except Exception:
-            pass
+    sweeper.cancel()
+    await get_loop_monitor().stop()
+    await emitter.close()
+    await close_clients()
+    shutdown_pools()
+    if get_response_cache() is not None:
+        get_response_cache().close()
+    get_state_store().close()
+    # Cleanup the session audio files (cached phrases are kept for the next run).
+    # With a shared registry other workers may still serve them: the TTL expires them instead
+    if not get_session_registry().shared:
+        get_artifact_store().release_kind("audio")
+    get_session_registry().close()
 
 # Create FastAPI app
 app = FastAPI(
@@ -163,6 +367,38 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Sessions are required by get_user_session (request.session)
+app.add_middleware(
+    SessionMiddleware,
+    secret_key=Config.SESSION_SECRET_KEY,
+    same_site=Config.SESSION_SAME_SITE,
+    https_only=Config.SESSION_HTTPS_ONLY
+)
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """One trace per request: id in the logs and X-Trace-Id, per-stage durations in Server-Timing"""
+    trace_id = new_trace(request.headers.get("x-request-id"))
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Trace-Id"] = trace_id
+        timing = server_timing()
+        if timing:
+            response.headers["Server-Timing"] = timing
+        return response
+    finally:
+        # Route template rather than the raw path, to keep the number of series bounded
+        route = request.scope.get("route")
+        HTTP_REQUEST_DURATION.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=status
+        )
+
 # # CORS configuration
 allowed_origins = Config.ALLOWED_ORIGINS
 
@@ -177,89 +413,312 @@ app.add_middleware(
 
 
 # SocketIO setup
+# With several workers, emits reach the clients of the other workers through the message queue
+client_manager = create_client_manager()
 sio = socketio.AsyncServer(
     async_mode='asgi',
-    cors_allowed_origins=allowed_origins
+    cors_allowed_origins=allowed_origins,
+    client_manager=client_manager,
+    transports=[t.strip() for t in Config.SOCKETIO_TRANSPORTS.split(",") if t.strip()]
 )
 socket_app = socketio.ASGIApp(sio, app)
+# State diffs for the same room within the debounce window go out as one event
+emitter = DebouncedEmitter(sio, Config.SOCKET_EMIT_DEBOUNCE_MS / 1000)
+# Rooms joined by each Socket.IO client, by sid
+client_rooms: Dict[str, tuple] = {}
+# Session of each Socket.IO client, by sid (same key as the HTTP session cookie / X-Session-ID)
+client_sessions: Dict[str, str] = {}
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint for monitoring"""
+    """Readiness: real dependency probes (cached for HEALTH_CACHE_SECONDS), 503 when a critical one fails"""
+    result = await get_health_probe().check()
+    checks = result["checks"]
+    body = {
+        "status": result["status"],
+        "timestamp": datetime.now().isoformat(),
+        "services": {
+            "speech_to_text": checks["gemini"]["ok"],
+            "tts": checks["gemini"]["ok"],
+            "ai_response": checks["gemini"]["ok"]
+        },
+        "checks": checks,
+        "checked_at": datetime.fromtimestamp(result["checked_at"]).isoformat(),
+        "version": "1.0",
+        "uptime": uptime_seconds()
+    }
+    if result["status"] == "unhealthy":
+        logger.error(f"Health check failed: {', '.join(name for name, check in checks.items() if not check['ok'])}")
+        return JSONResponse(status_code=503, content=body)
+    return body
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Per-stage and upstream latency histograms, error codes and tokens (Prometheus text format)"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/stats")
+async def get_stats():
+    """Runtime load counters for the worker pools"""
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "workers": get_pools_stats(),
+        "response_cache": get_response_cache().stats() if get_response_cache() else None,
+        "home_state": get_state_store().stats(),
+        "sessions": await get_session_registry().stats(),
+        "socketio": dict(emitter.stats(), clients=len(client_rooms), queue=client_manager_stats(client_manager)),
+        "fast_path": fast_path_stats,
+        "llm_tokens": token_stats,
+        "tts_cache": get_tts_cache().stats() if get_tts_cache() else None,
+        "artifacts": get_artifact_store().stats(),
+        "singleflight": get_flights_stats(),
+        "upstream": get_upstreams_stats(),
+        "models": get_routers_stats(),
+        "event_loop": get_loop_monitor().stats()
+    }
+
+
+# Admin endpoints: disabled (404) unless ADMIN_TOKEN is set
+admin_auth = HTTPBearer(auto_error=False)
+
+def require_admin(credentials: Optional[HTTPAuthorizationCredentials] = Depends(admin_auth)):
+    if not Config.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if credentials is None or not secrets.compare_digest(credentials.credentials, Config.ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid admin token", headers={"WWW-Authenticate": "Bearer"})
+
+
+@app.get("/admin/diagnostics", dependencies=[Depends(require_admin)])
+async def get_diagnostics():
+    """Event loop lag and, in debug mode, recent blocking calls with their stack trace"""
+    return dict(get_loop_monitor().report(), timestamp=datetime.now().isoformat())
+
+
+@app.post("/admin/profile", dependencies=[Depends(require_admin)])
+async def run_profile(seconds: float = 10, interval_ms: float = 5, all_threads: bool = False, format: str = "json"):
+    """Sample stacks for a few seconds (event loop thread by default); format=folded for flame graphs"""
+    if not 0 < seconds <= Config.PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be between 0 and {Config.PROFILE_MAX_SECONDS:g}")
+    if format not in ("json", "folded"):
+        raise HTTPException(status_code=400, detail="format must be json or folded")
+    thread_id = None if all_threads else get_loop_monitor().loop_thread_id
     try:
-        # Test basic functionality
-        current_time = datetime.now().isoformat()
-    
-        
-        # Check services availability (basic test)
-        services_status = {
-            "speech_to_text": True,  # Could add actual service test
-            "tts": True,
-            "ai_response": True
-        }
-        
-        return {
-            "status": "healthy",
-            "timestamp": current_time,
-            "services": services_status,
-            "version": "1.0",
-            "uptime": current_time
-        }
-    except Exception as e:
-        logger.error(f"Health check failed: {str(e)}")
-        raise HTTPException(status_code=503, detail=f"Service unhealthy: {str(e)}")
+        # The sampler runs in its own thread: the loop being profiled keeps serving requests
+        samples, stacks = await asyncio.to_thread(
+            get_profiler().profile, seconds, max(interval_ms, 1) / 1000, thread_id
+        )
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    logger.info(f"Profile completed: {samples} samples over {seconds:g} s")
+    if format == "folded":
+        return PlainTextResponse(folded_text(stacks))
+    return summarize_profile(samples, stacks)
+
 
+async def receive_audio(request: Request, audio: Optional[UploadFile], spill_threshold: int = 0) -> tuple[Optional[bytes], Optional[str], str]:
+    """Read an audio upload (multipart field or raw audio/* body) with the size cap
+    enforced while it arrives. Returns (bytes, None) or (None, spilled temp file), and the MIME type"""
+    if audio is not None:
+        # Validate file
+        is_valid, message = validate_audio_file(audio)
+        if not is_valid:
+            logger.warning(f"Invalid audio file: {message}")
+            raise HTTPException(status_code=400, detail=message)
+        mime_type = resolve_mime_type(audio.content_type, audio.filename)
+        chunks = iter_upload(audio)
+    else:
+        content_type = request.headers.get("content-type", "")
+        if not content_type.startswith("audio/"):
+            raise HTTPException(status_code=400, detail="No file provided")
+        declared_size = request.headers.get("content-length")
+        if declared_size and declared_size.isdigit() and int(declared_size) > MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail="File too large (max 10MB)")
+        mime_type = resolve_mime_type(content_type)
+        chunks = request.stream()
+    
+    try:
+        with stage("upload"):
+            audio_bytes, temp_audio_path = await read_audio_upload(
+                chunks,
+                spill_threshold=spill_threshold,
+                file_extension=extension_for_mime(mime_type)
+            )
+    except UploadTooLargeError as e:
+        logger.warning(f"Audio upload rejected: {str(e)}")
+        raise HTTPException(status_code=413, detail=str(e))
+    
+    if temp_audio_path is None and not audio_bytes:
+        logger.error("Empty file content received")
+        raise HTTPException(status_code=400, detail="Empty file content")
+    return audio_bytes, temp_audio_path, mime_type
 
 @app.post("/transcribe", response_model=TranscriptionResponse)
 async def transcribe_audio_route(
+    request: Request,
     background_tasks: BackgroundTasks,
-    audio: UploadFile = File(...)
+    audio: Optional[UploadFile] = File(None)
 ):
-    """Transcribe audio file to text"""
+    """Transcribe audio to text (multipart upload or raw audio/* request body)"""
     logger.info("Transcribe audio request received")
     
-    # Cleanup old temporary files in background
-    background_tasks.add_task(cleanup_old_temp_files)
-    
-    # Validate file
-    is_valid, message = validate_audio_file(audio)
-    if not is_valid:
-        logger.warning(f"Invalid audio file: {message}")
-        raise HTTPException(status_code=400, detail=message)
-    
     try:
-        # Read file content
-        file_content = await audio.read()
-        logger.info(f"File content size: {len(file_content)} bytes")
-        
-        if not file_content or len(file_content) == 0:
-            logger.error("Empty file content received")
-            raise HTTPException(status_code=400, detail="Empty file content")
+        # Read the upload incrementally, keeping it in memory unless it crosses the spill threshold
+        audio_bytes, temp_audio_path, mime_type = await receive_audio(
+            request, audio, spill_threshold=int(Config.STT_SPILL_THRESHOLD_MB * 1024 * 1024)
+        )
         
-        # Save temporary file
-        file_extension = os.path.splitext(audio.filename.lower())[1][1:] or "webm"
-        temp_audio_path = save_temp_file(file_content, file_extension=file_extension)
-        logger.info(f"Audio file saved temporarily at {temp_audio_path} ({get_file_size_mb(temp_audio_path):.2f} MB)")
+        if temp_audio_path:
+            logger.info(f"Audio upload spilled to {temp_audio_path} ({get_file_size_mb(temp_audio_path):.2f} MB)")
+            background_tasks.add_task(clean_temp_file, temp_audio_path)
+        else:
+            logger.info(f"Audio content size: {len(audio_bytes)} bytes ({mime_type})")
 
-        # Transcribe audio
-        transcription = transcribe_audio(temp_audio_path)
+        # Transcribe audio within the bounded STT pool
+        with deadline(Config.REQUEST_DEADLINE_SECONDS):
+            async with get_stt_pool().slot():
+                if temp_audio_path:
+                    transcription = await transcribe_audio_async(temp_audio_path)
+                else:
+                    transcription = await transcribe_audio_bytes_async(audio_bytes, mime_type)
         logger.info("Audio transcription completed successfully")
 
-        # Clean up temporary file
-        background_tasks.add_task(clean_temp_file, temp_audio_path)
-
-        return TranscriptionResponse(transcription=transcription)
+        return TranscriptionResponse(transcription=transcription, session_id=get_user_session(request))
 
+    except SilentAudioError as e:
+        logger.info(f"Audio rejected locally: {str(e)}")
+        raise HTTPException(status_code=422, detail=str(e))
+    except PoolSaturatedError as e:
+        logger.warning(f"Transcription rejected: {str(e)}")
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except UpstreamError as e:
+        logger.error(f"Transcription upstream error: {str(e)}")
+        raise upstream_http_error(e)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Transcription error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Transcription failed: {str(e)}")
 
+async def single_call_voice(audio_bytes: bytes, mime_type: str, home_state: Dict[str, Any]) -> Optional[tuple[str, Dict[str, Any]]]:
+    """Transcription and command in one multimodal request; None when the two-step path must take over"""
+    try:
+        response = await generate_voice_response_async(audio_bytes, mime_type, home_state, get_http_client())
+    except Exception as e:
+        logger.warning(f"Single-call voice request failed, falling back to two steps: {str(e)}")
+        return None
+    
+    transcription = response.pop("transcription", None)
+    if not isinstance(transcription, str) or "assistant_response" not in response:
+        logger.warning("Single-call voice response incomplete, falling back to two steps")
+        return None
+    
+    transcription = transcription.strip()
+    cache = get_response_cache()
+    if cache and transcription:
+        await cache.put(transcription, home_state, response)
+    return transcription, response
+
+@app.post("/voice", response_model=VoiceResponse)
+async def process_voice(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    audio: Optional[UploadFile] = File(None),
+    all_state: Optional[str] = Form(None),
+    home_id: Optional[str] = Form(None)
+):
+    """Voice command straight from audio: one multimodal Gemini call returning both the
+    transcription and the device update, with transcribe + process as a fallback"""
+    logger.info("Voice command request received")
+    
+    try:
+        audio_bytes, _, mime_type = await receive_audio(request, audio)
+        # Raw audio bodies carry the home state in the query string
+        all_state = all_state if all_state is not None else request.query_params.get("all_state", "")
+        home_id = home_id or request.query_params.get("home_id")
+        session_id = get_user_session(request)
+        
+        with deadline(Config.REQUEST_DEADLINE_SECONDS):
+            async with get_stt_pool().slot():
+                if Config.AUDIO_PREPROCESSING_ENABLED:
+                    with stage("preprocess"):
+                        audio_bytes, mime_type = await get_stt_pool().offload(preprocess_audio, audio_bytes, mime_type)
+            
+                result = None
+                if Config.VOICE_SINGLE_CALL_ENABLED:
+                    result = await single_call_voice(audio_bytes, mime_type, await load_home_state(home_id, all_state))
+                mode = "single_call"
+                if result is None:
+                    mode = "two_step"
+                    transcription = await transcribe_audio_bytes_async(audio_bytes, mime_type, preprocess=False)
+        
+            if result is not None:
+                transcription, response = result
+                await commit_home_state(home_id, response)
+            else:
+                if not transcription:
+                    raise HTTPException(status_code=422, detail="No speech detected in audio")
+                response, _ = await run_command(ProcessRequest(text=transcription, all_state=all_state, home_id=home_id), session_id)
+        logger.info(f"Voice command handled ({mode})")
+        
+        background_tasks.add_task(
+            generate_speech_background,
+            response["assistant_response"],
+            session_id
+        )
+        return VoiceResponse(transcription=transcription, response=ProcessResponse(**dict(response, session_id=session_id)), mode=mode, session_id=session_id)
+
+    except SilentAudioError as e:
+        logger.info(f"Audio rejected locally: {str(e)}")
+        raise HTTPException(status_code=422, detail=str(e))
+    except PoolSaturatedError as e:
+        logger.warning(f"Voice command rejected: {str(e)}")
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except UpstreamError as e:
+        logger.error(f"Voice command upstream error: {str(e)}")
+        raise upstream_http_error(e)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Voice command error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Voice processing failed: {str(e)}")
+
+async def audio_file_response(audio_file: str, audio_format: Optional[str]):
+    """Serve a stored WAV, optionally encoded to MP3/Opus (Range requests are handled by FileResponse)"""
+    if not audio_format or audio_format == "wav":
+        return FileResponse(audio_file, media_type="audio/wav")
+    if audio_format not in ENCODED_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format. Allowed: wav, {', '.join(ENCODED_FORMATS)}")
+    try:
+        # ffmpeg encoding is bounded by the TTS pool like the synthesis that produced the file
+        encoded_file = await get_tts_pool().run(encode_audio, audio_file, audio_format)
+    except PoolSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    return FileResponse(encoded_file, media_type=ENCODED_FORMATS[audio_format][3])
+
 @app.get("/audio")
-async def get_recording(request: Request):
-    """Download generated speech audio file"""
+async def get_recording(request: Request, part: Optional[int] = None, format: Optional[str] = None):
+    """Download generated speech audio file (or one sentence of a streamed response)"""
     try:
         session_id = get_user_session(request)
-        audio_file = user_audio_files.get(session_id)
+        if part is not None:
+            parts = await get_session_registry().get(parts_key(session_id)) or {}
+            audio_file = parts.get(str(part))
+            if not audio_file or not os.path.exists(audio_file):
+                raise HTTPException(status_code=404, detail="Audio part not found")
+            return await audio_file_response(audio_file, format)
+        audio_file = await get_session_registry().get(audio_key(session_id))
         
         if not audio_file or not os.path.exists(audio_file):
             # Fallback to legacy system
@@ -268,11 +727,52 @@ async def get_recording(request: Request):
                 return FileResponse(fallback_file)
             raise HTTPException(status_code=404, detail="Audio file not found")
             
-        return FileResponse(audio_file)
+        return await audio_file_response(audio_file, format)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Audio retrieval error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to retrieve audio: {str(e)}")
 
+@app.get("/audio/stream")
+async def stream_recording(request: Request):
+    """Stream the speech audio of the session while it is being synthesized"""
+    session_id = get_user_session(request)
+    broadcast = audio_streams.get(session_id)
+    if broadcast is None:
+        # Synthesis already finished: serve the stored file
+        audio_file = await get_session_registry().get(audio_key(session_id))
+        if not audio_file or not os.path.exists(audio_file):
+            raise HTTPException(status_code=404, detail="Audio stream not found")
+        return FileResponse(audio_file, media_type="audio/wav")
+    
+    async def body():
+        yield wav_stream_header()
+        async for chunk in broadcast.subscribe():
+            yield chunk
+    
+    return StreamingResponse(body(), media_type="audio/wav")
+
+@app.get("/session", response_model=SessionResponse)
+async def get_session(request: Request):
+    """Session of the caller (created if needed): Socket.IO room of its audio events,
+    and X-Session-ID header for clients whose session cookie is not sent (cross-origin)"""
+    return SessionResponse(session_id=get_user_session(request))
+
+@app.post("/home", response_model=HomeResponse)
+async def create_home():
+    """New home. Its id is the secret shared by the household's clients: it gives access
+    to the home state (home_id on /process, /voice, /state and Socket.IO)"""
+    return HomeResponse(home_id=new_home_id())
+
+@app.get("/state", response_model=HomeStateResponse)
+async def get_home_state(home_id: str):
+    """Server-side home state and its version (base for incremental Socket.IO updates)"""
+    if not valid_home_id(home_id):
+        raise HTTPException(status_code=403, detail="Invalid home_id")
+    version, state = await get_state_store().get(home_id)
+    return HomeStateResponse(home_id=home_id, version=version, state=state)
+
 @app.post("/process", response_model=ProcessResponse)
 async def process_transcription(
     request: Request,
@@ -283,152 +783,308 @@ async def process_transcription(
     logger.info("Process transcription request received")
     
     try:
-        text = data.text
-        state = data.state or ""
-        all_state = data.all_state or ""
+        session_id = get_user_session(request)
+        with deadline(Config.REQUEST_DEADLINE_SECONDS):
+            response, streamed = await run_command(data, session_id)
         
-        logger.info(f"Processing text: {text[:50]}...")
-
-        commands = "{" + all_state + "}"
+        # Generate speech in background (already started sentence by sentence when streamed)
+        if not streamed:
+            background_tasks.add_task(
+                generate_speech_background, 
+                response["assistant_response"], 
+                session_id
+            )
         
-        system = f"""
-            Tu es Homelinks, l'assistant vocal de ma maison. Voici le JSON qui renseigne sur l'état actuel de la maison :
-            {commands}
-            
-            Explication : 
-            
-            - **salon** (`boolean`): 
-            - `true` : Lampes du salon allumés.
-            - `false` : Lampes du salon éteints.
-
-            - **cuisine** (`boolean`): 
-            - `true` : Lampes de la cuisine allumés.
-            - `false` : Lampes de la cuisine éteints.
-
-            - **chambre** (`boolean`): 
-            - `true` : Lampes de la chambre allumés.
-            - `false` : Lampes de la chambre éteints.
-
-            - **exterieur** (`boolean`): 
-            - `true` : Lampes extérieurs allumés.
-            - `false` : Lampes extérieurs éteints.
+        logger.info("Process completed successfully")
+        return ProcessResponse(**dict(response, session_id=session_id))
 
-            - **garage** (`boolean`): 
-            - `true` : Lampes du garage allumés.
-            - `false` : Lampes du garage éteints.
-
-            - **smoke** (`boolean`): 
-            - `true` : Fumée détectée.
-            - `false` : Pas de fumée détectée.
-
-            - **presence** (`boolean`): 
-            - `true` : Présence détectée.
-            - `false` : Aucune présence détectée.
-
-            - **auth** (`boolean`): 
-            - `true` : Authentification verifiée.
-            - `false` : Authentification non verifiée.
-
-            - **door1** (`string`): 
-            - `"on"` : Porte du salon ouverte.
-            - `"off"` : Porte du salon fermée.
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Process transcription error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
 
-            - **door2** (`string`): 
-            - `"on"` : Porte du garage ouverte.
-            - `"off"` : Porte du garage fermée.
+async def synthesize_speech(text: str, session_id: str) -> str:
+    """Synthesize speech, forwarding PCM chunks to the session while they arrive"""
+    if not Config.TTS_STREAMING_ENABLED:
+        return await speech_async(text, session_id)
+    
+    broadcast = AudioBroadcast()
+    audio_streams[session_id] = broadcast
+    
+    async def on_chunk(seq: int, pcm: bytes):
+        # Announced on the first chunk only: cached phrases go straight to audio_ready
+        if seq == 0:
+            await sio.emit('audio_stream_start', {
+                'url': '/audio/stream',
+                'session_id': session_id,
+                'sample_rate': PCM_SAMPLE_RATE,
+                'channels': PCM_CHANNELS,
+                'sample_width': PCM_SAMPLE_WIDTH
+            }, room=session_room(session_id))
+        await broadcast.publish(pcm)
+        await sio.emit('audio_chunk', {'session_id': session_id, 'seq': seq, 'data': pcm}, room=session_room(session_id))
+    
+    try:
+        return await speech_stream_to_file(text, session_id, on_chunk)
+    finally:
+        await broadcast.close()
+        if audio_streams.get(session_id) is broadcast:
+            del audio_streams[session_id]
 
-            - **time** (`string`): 
-            - Heure actuelle sous le format `HH:MM:SS---JourMoisAnnee`.
+async def generate_speech_background(text: str, session_id: str):
+    """Background task to generate speech (transient Gemini errors are retried with backoff upstream)"""
+    try:
+        logger.info("Generating speech audio")
+        # Runs after the response is sent: its own deadline, not the request's
+        with deadline(Config.SPEECH_DEADLINE_SECONDS, inherit=False):
+            async with get_tts_pool().slot():
+                with stage("tts"):
+                    audio_file_path = await synthesize_speech(text, session_id)
+        
+        # Store the audio file path for this session (visible to every worker with a shared registry)
+        await get_session_registry().set(audio_key(session_id), audio_file_path)
+        
+        # Emit audio ready signal via SocketIO
+        with stage("emit"):
+            await sio.emit('audio_ready', {'url': '/audio', 'session_id': session_id}, room=session_room(session_id))
+        logger.info("Speech generated and audio ready signal sent")
+        
+    except PoolSaturatedError as e:
+        logger.warning(f"Speech generation skipped: {str(e)}")
+    except Exception as e:
+        logger.error(f"Speech generation failed: {e}")
 
-            - **assistant_response** (`string`): 
-            - Réponse textuelle de l'assistant vocal, à lire à haute voix.
-            
+async def generate_speech_part(text: str, session_id: str, index: int):
+    """Synthesize one sentence of a streamed response"""
+    try:
+        with deadline(Config.SPEECH_DEADLINE_SECONDS, inherit=False):
+            async with get_tts_pool().slot():
+                with stage("tts"):
+                    audio_file_path = await speech_async(text, f"{session_id}_{index}")
+        await get_session_registry().set_field(parts_key(session_id), index, audio_file_path)
+        await sio.emit('audio_chunk_ready', {
+            'url': f'/audio?part={index}',
+            'session_id': session_id,
+            'index': index
+        }, room=session_room(session_id))
+    except PoolSaturatedError as e:
+        logger.warning(f"Speech part {index} skipped: {str(e)}")
+    except Exception as e:
+        logger.warning(f"Speech part {index} failed: {e}")
 
-            Tu devras mettre à jour ce JSON en fonction de mes demandes, en respectant le format attendu.
+async def finish_speech_parts(session_id: str, parts: list):
+    """Signal the end of a streamed response once every sentence is synthesized"""
+    await asyncio.gather(*parts, return_exceptions=True)
+    stored = await get_session_registry().get(parts_key(session_id)) or {}
+    await sio.emit('audio_ready', {
+        'url': '/audio?part=0',
+        'session_id': session_id,
+        'parts': len(stored)
+    }, room=session_room(session_id))
 
-            Dans ce JSON, il y a une variable assistant_response. C'est dans cette variable que tu devras mettre ta réponse textuelle à mon message. Elle sera ensuite transcrite en audio par un autre outil.
+async def join_rooms(sid: str, session_id: Optional[str], home_id: Optional[str]):
+    """Put a client in the room of its session (speech audio) and of its home (state diffs)"""
+    rooms = tuple(room for room in (
+        session_room(session_id) if session_id else None, home_room(home_id) if home_id else None
+    ) if room)
+    for room in client_rooms.get(sid, ()):
+        if room not in rooms:
+            await sio.leave_room(sid, room)
+    for room in rooms:
+        await sio.enter_room(sid, room)
+    client_rooms[sid] = rooms
+    client_sessions[sid] = session_id
 
-            Tu dois analyser mes demandes pour savoir :
+# SocketIO event handlers
+@sio.event
+async def connect(sid, environ, auth=None):
+    # Browsers send the session cookie: they join their session room without any client change.
+    # Other clients get a new session, returned by join / stt_start and usable as X-Session-ID on HTTP
+    session_id, home_id = client_identity(environ, auth)
+    session_id = session_id or new_session_id()
+    await join_rooms(sid, session_id, home_id)
+    logger.info(f"Client connected: {sid} (session {session_id or '-'}, home {home_id or '-'})")
 
-            Quels appareils allumer ou éteindre,
-            Si je veux tout allumer ou tout éteindre,
-            Me répondre si je pose des questions sur l'état de la maison,
-            Mais aussi répondre à des questions diverses.
-            Tu es un assistant chaleureux et responsable. Un membre à part entière de la famille. Au-delà de la gestion de la maison, ton rôle est aussi d'entretenir des discussions excitantes et fraternelles à travers la variable assistant_response.
+@sio.event
+async def join(sid, data):
+    """Switch the session and home a client listens to"""
+    data = data or {}
+    home_id = data.get('home_id')
+    if home_id is not None and not valid_home_id(home_id):
+        return {'ok': False, 'detail': "Invalid home_id"}
+    session_id = valid_session_id(data.get('session_id')) or client_sessions.get(sid) or new_session_id()
+    await join_rooms(sid, session_id, home_id)
+    return {'ok': True, 'session_id': session_id, 'rooms': list(client_rooms[sid])}
 
-            Tu es l'assistant savant, drole, sympathique, responsable et protecteur de la maison.
+@sio.event
+async def disconnect(sid):
+    logger.info(f"Client disconnected: {sid}")
+    voice_streams.pop(sid, None)
+    client_rooms.pop(sid, None)
+    client_sessions.pop(sid, None)
 
-            ⚠️ N'oublie jamais : tu dois toujours me renvoyer le résultat sous forme de JSON. TOUJOURS. Et jamais de valeurs vides.
+async def handle_utterance(sid: str, stream: Dict[str, Any], audio_bytes: bytes, mime_type: str):
+    """Transcribe one utterance as soon as it ends and run it through the command pipeline"""
+    new_trace()
+    try:
+        with deadline(Config.REQUEST_DEADLINE_SECONDS):
+            async with get_stt_pool().slot():
+                transcription = await transcribe_audio_bytes_async(audio_bytes, mime_type)
+    except PoolSaturatedError as e:
+        logger.warning(f"Streamed transcription rejected: {str(e)}")
+        await sio.emit('stt_error', {'detail': str(e), 'retry_after': e.retry_after}, to=sid)
+        return
+    except SilentAudioError as e:
+        await sio.emit('stt_error', {'detail': str(e)}, to=sid)
+        return
+    except Exception as e:
+        logger.error(f"Streamed transcription error: {str(e)}")
+        await sio.emit('stt_error', {'detail': f"Transcription failed: {str(e)}"}, to=sid)
+        return
+    
+    await sio.emit('transcription', {'transcription': transcription}, to=sid)
+    if not transcription:
+        return
+    
+    session_id = stream['session_id']
+    try:
+        data = ProcessRequest(text=transcription, all_state=stream['all_state'], home_id=stream['home_id'], stream=stream['stream'])
+        with deadline(Config.REQUEST_DEADLINE_SECONDS):
+            response, streamed = await run_command(data, session_id)
+        if not streamed:
+            spawn(generate_speech_background(response["assistant_response"], session_id))
+        await sio.emit('process_result', jsonable_encoder(ProcessResponse(**dict(response, session_id=session_id))), to=sid)
+    except ValidationError as e:
+        await sio.emit('process_error', {'status': 400, 'detail': str(e)}, to=sid)
+    except HTTPException as e:
+        await sio.emit('process_error', {'status': e.status_code, 'detail': e.detail}, to=sid)
+    except Exception as e:
+        logger.error(f"Streamed command error: {str(e)}")
+        await sio.emit('process_error', {'status': 500, 'detail': f"Processing failed: {str(e)}"}, to=sid)
 
-            Exemple :
-            {commands}
-        """
-        
-        # Generate response
-        logger.info("Generating AI response")
-        response = await gen_response(system, text)
-        logger.info("AI response generated successfully")
-        
-        # Validate response structure
-        if "assistant_response" not in response:
-            logger.error("Missing assistant_response in AI response")
-            raise HTTPException(status_code=502, detail="Missing assistant_response in AI response")
-        
-        # Generate speech in background
-        session_id = get_user_session(request)
-        background_tasks.add_task(
-            generate_speech_background, 
-            response["assistant_response"], 
-            session_id
-        )
-        
-        logger.info(f"Process completed successfully")
-        return ProcessResponse(**response)
+@sio.event
+async def stt_start(sid, data):
+    """Open (or update) a microphone stream: 16-bit mono PCM frames are segmented
+    server-side, encoded audio (webm/ogg Opus) is transcribed on stt_stop"""
+    data = data or {}
+    audio_format = data.get('format', 'pcm16')
+    if audio_format != 'pcm16' and f".{audio_format}" not in AUDIO_MIME_TYPES:
+        return {'ok': False, 'detail': f"Unsupported format. Allowed: pcm16, {', '.join(ext[1:] for ext in AUDIO_MIME_TYPES)}"}
+    
+    sample_rate = data.get('sample_rate')
+    try:
+        sample_rate = int(Config.STT_STREAM_SAMPLE_RATE if sample_rate is None else sample_rate)
+    except (TypeError, ValueError):
+        sample_rate = None
+    # The VAD frames are sized from the rate: reject values it cannot segment
+    if sample_rate is None or not MIN_STREAM_SAMPLE_RATE <= sample_rate <= MAX_STREAM_SAMPLE_RATE:
+        return {'ok': False, 'detail': f"Invalid sample_rate. Allowed: {MIN_STREAM_SAMPLE_RATE}-{MAX_STREAM_SAMPLE_RATE} Hz"}
+    if data.get('home_id') is not None and not valid_home_id(data.get('home_id')):
+        return {'ok': False, 'detail': "Invalid home_id"}
+    voice_streams[sid] = {
+        'format': audio_format,
+        'sample_rate': sample_rate,
+        'vad': EnergyVAD(sample_rate) if audio_format == 'pcm16' else None,
+        'encoded': [],
+        'size': 0,
+        # Same session key as the HTTP endpoints: /audio finds the audio of streamed utterances
+        'session_id': valid_session_id(data.get('session_id')) or client_sessions.get(sid) or new_session_id(),
+        'all_state': data.get('all_state') or "",
+        'home_id': data.get('home_id'),
+        'stream': bool(data.get('stream', False)),
+    }
+    await join_rooms(sid, voice_streams[sid]['session_id'], voice_streams[sid]['home_id'])
+    logger.info(f"Voice stream started for {sid} ({audio_format}, {sample_rate} Hz)")
+    return {'ok': True, 'session_id': voice_streams[sid]['session_id']}
 
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Process transcription error: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
+@sio.event
+async def stt_audio(sid, chunk):
+    """Receive a microphone frame; end of speech triggers transcription immediately"""
+    stream = voice_streams.get(sid)
+    if stream is None or not isinstance(chunk, (bytes, bytearray)):
+        return
+    
+    if stream['vad'] is None:
+        stream['size'] += len(chunk)
+        if stream['size'] > MAX_UPLOAD_BYTES:
+            voice_streams.pop(sid, None)
+            await sio.emit('stt_error', {'detail': "File too large (max 10MB)"}, to=sid)
+            return
+        stream['encoded'].append(bytes(chunk))
+        return
+    
+    for event in stream['vad'].feed(bytes(chunk)):
+        if event[0] == "speech_start":
+            await sio.emit('speech_start', {}, to=sid)
+        else:
+            await sio.emit('speech_end', {}, to=sid)
+            spawn(handle_utterance(sid, stream, pcm_to_wav(event[1], stream['sample_rate']), "audio/wav"))
 
-async def generate_speech_background(text: str, session_id: str):
-    """Background task to generate speech"""
-    max_retries = 2
-    audio_file_path = None
+@sio.event
+async def stt_stop(sid, data=None):
+    """Close the microphone stream and transcribe whatever is still buffered"""
+    stream = voice_streams.pop(sid, None)
+    if stream is None:
+        return
     
-    for attempt in range(max_retries):
-        try:
-            logger.info(f"Generating speech audio (attempt {attempt + 1}/{max_retries})")
-            audio_file_path = speech(text, session_id)
-            
-            # Store the audio file path for this session
-            user_audio_files[session_id] = audio_file_path
-            
-            # Emit audio ready signal via SocketIO
-            await sio.emit('audio_ready', {'url': '/audio', 'session_id': session_id})
-            logger.info("Speech generated and audio ready signal sent")
-            break
-            
-        except Exception as e:
-            logger.warning(f"Speech generation failed (attempt {attempt + 1}): {e}")
-            if attempt == max_retries - 1:
-                logger.error("All speech generation attempts failed")
+    if stream['vad'] is not None:
+        utterance = stream['vad'].flush()
+        if utterance:
+            await sio.emit('speech_end', {}, to=sid)
+            spawn(handle_utterance(sid, stream, pcm_to_wav(utterance, stream['sample_rate']), "audio/wav"))
+    elif stream['encoded']:
+        spawn(handle_utterance(sid, stream, b"".join(stream['encoded']), AUDIO_MIME_TYPES[f".{stream['format']}"]))
 
-# SocketIO event handlers
 @sio.event
-async def connect(sid, environ):
-    logger.info(f"Client connected: {sid}")
+async def state_update(sid, data):
+    """Incremental home state update from a client (device switched by hand, sensor change).
+    The update must be based on the current version; a stale one is rejected with the
+    current state so the client can resynchronize"""
+    data = data or {}
+    home_id = data.get('home_id')
+    changes = data.get('state') or {}
+    if not valid_home_id(home_id):
+        return {'ok': False, 'detail': "A valid home_id is required"}
+    try:
+        validate_changes(changes)
+        base_version = data.get('version')
+        _, current = await get_state_store().get(home_id)
+        version, state = await get_state_store().update(
+            home_id, changes, int(base_version) if base_version is not None else None
+        )
+    except StaleStateError as e:
+        return {'ok': False, 'detail': str(e), 'version': e.version, 'state': e.state}
+    except (TypeError, ValueError) as e:
+        return {'ok': False, 'detail': str(e)}
+    
+    changed = {
+        field: value for field, value in changes.items()
+        if field not in VOLATILE_FIELDS and current.get(field) != value
+    }
+    if changed:
+        emitter.queue('state_update', {'home_id': home_id, 'version': version, 'state': changed}, home_room(home_id))
+    return {'ok': True, 'version': version, 'state': state}
 
 @sio.event
-async def disconnect(sid):
-    logger.info(f"Client disconnected: {sid}")
+async def get_state(sid, data=None):
+    """Current server-side state of a home, with its version"""
+    home_id = (data or {}).get('home_id')
+    if not valid_home_id(home_id):
+        return {'ok': False, 'detail': "A valid home_id is required"}
+    version, state = await get_state_store().get(home_id)
+    return {'home_id': home_id, 'version': version, 'state': state}
 
 if __name__ == '__main__':
     import uvicorn
+    if Config.WEB_CONCURRENCY > 1:
+        # Workers inherit the environment: they all sign session cookies with the same key
+        os.environ.setdefault("SESSION_SECRET_KEY", Config.SESSION_SECRET_KEY)
     uvicorn.run(
         "main:socket_app",  # Use socket_app instead of app for SocketIO support
         host="0.0.0.0",
         port=5000,
         reload=False,  # Set to True for development
+        workers=Config.WEB_CONCURRENCY,
         log_level="info"
     )
\ No newline at end of file
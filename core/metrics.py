@@ -0,0 +1,202 @@
+"""
+Métriques et traces des requêtes
+- Un identifiant de trace par requête (contextvars) : il suit la requête dans ses tâches
+  et threads (upload → transcription → prompt → LLM → synthèse → émission) et apparaît dans les logs
+- Durée de chaque étape, par requête (en-tête Server-Timing) et cumulée en histogrammes
+- Latence, codes d'erreur et tokens des appels à Gemini
+- Export au format texte Prometheus (/metrics)
+"""
+import contextvars
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# Bornes des histogrammes de durée (secondes)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Bornes du retard de la boucle d'événements (secondes)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+logger = logging.getLogger("metrics")
+
+_trace_id = contextvars.ContextVar("trace_id", default=None)
+# Durées des étapes de la trace courante (partagées avec les tâches lancées par la requête)
+_trace_stages = contextvars.ContextVar("trace_stages", default=None)
+
+
+def new_trace(trace_id=None):
+    """Démarre une trace (identifiant transmis par le client, ou nouveau) et retourne son identifiant"""
+    trace_id = trace_id or uuid.uuid4().hex[:16]
+    _trace_id.set(trace_id)
+    _trace_stages.set([])
+    return trace_id
+
+
+def current_trace():
+    return _trace_id.get()
+
+
+def trace_stages():
+    """Étapes mesurées dans la trace courante : liste de (étape, durée en s)"""
+    return list(_trace_stages.get() or ())
+
+
+def server_timing():
+    """Valeur de l'en-tête Server-Timing (durées en ms, étapes répétées cumulées)"""
+    totals = {}
+    for name, seconds in trace_stages():
+        totals[name] = totals.get(name, 0.0) + seconds
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in totals.items())
+
+
+class TraceIdFilter(logging.Filter):
+    """Ajoute trace_id aux enregistrements de log ("-" hors requête)"""
+
+    def filter(self, record):
+        record.trace_id = _trace_id.get() or "-"
+        return True
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _format_labels(self, key, extra=()):
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+
+class Counter(_Metric):
+    """Compteur croissant, par combinaison d'étiquettes"""
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{self._format_labels(key)} {value}"]
+
+
+class Histogram(_Metric):
+    """Histogramme à bornes fixes, par combinaison d'étiquettes"""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # Effectifs par borne (non cumulés), somme, nombre
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][index] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def _render_value(self, key, value):
+        counts, total, count = value
+        lines, cumulative = [], 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            lines.append(f"{self.name}_bucket{self._format_labels(key, [('le', f'{bound:g}')])} {cumulative}")
+        lines.append(f"{self.name}_bucket{self._format_labels(key, [('le', '+Inf')])} {count}")
+        lines.append(f"{self.name}_sum{self._format_labels(key)} {total:.6f}")
+        lines.append(f"{self.name}_count{self._format_labels(key)} {count}")
+        return lines
+
+
+REGISTRY = []
+
+HTTP_REQUEST_DURATION = Histogram(
+    "homelinks_http_request_duration_seconds", "Durée des requêtes HTTP", ("method", "route", "status")
+)
+STAGE_DURATION = Histogram(
+    "homelinks_stage_duration_seconds", "Durée de chaque étape du traitement", ("stage",)
+)
+STAGE_ERRORS = Counter(
+    "homelinks_stage_errors_total", "Étapes terminées par une erreur", ("stage",)
+)
+UPSTREAM_DURATION = Histogram(
+    "homelinks_upstream_duration_seconds", "Durée de chaque appel à Gemini", ("endpoint", "model", "outcome")
+)
+UPSTREAM_ERRORS = Counter(
+    "homelinks_upstream_errors_total", "Appels à Gemini en échec, par code", ("endpoint", "model", "status")
+)
+LLM_TOKENS = Counter(
+    "homelinks_llm_tokens_total", "Tokens consommés par le LLM (usageMetadata)", ("kind",)
+)
+EVENT_LOOP_LAG = Histogram(
+    "homelinks_event_loop_lag_seconds", "Retard de la boucle d'événements", buckets=LAG_BUCKETS
+)
+EVENT_LOOP_BLOCKED = Counter(
+    "homelinks_event_loop_blocked_total", "Blocages de la boucle au-delà du seuil (mode debug)"
+)
+
+
+@contextmanager
+def stage(name):
+    """Mesure une étape : histogramme global et durées de la trace courante"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_DURATION.observe(elapsed, stage=name)
+        stages = _trace_stages.get()
+        if stages is not None:
+            stages.append((name, elapsed))
+        logger.debug(f"{name} took {elapsed * 1000:.1f} ms")
+
+
+def record_upstream(upstream_name, seconds, status=None):
+    """Enregistre un appel à Gemini ; upstream_name vaut "point d'accès:modèle" """
+    endpoint, _, model = upstream_name.partition(":")
+    UPSTREAM_DURATION.observe(seconds, endpoint=endpoint, model=model, outcome="ok" if status is None else "error")
+    if status is not None:
+        UPSTREAM_ERRORS.inc(endpoint=endpoint, model=model, status=status)
+
+
+def render_metrics():
+    """Toutes les métriques au format texte Prometheus"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,181 @@
+"""
+Routage des requêtes vers les modèles Gemini
+- Un modèle principal et des replis par classe de requête (Config.MODEL_ROUTES) :
+  commande simple, conversation ouverte, commande vocale, transcription, synthèse
+- Latence et taux d'erreur glissants mesurés par modèle
+- Bascule automatique sur le repli quand le principal est lent, limité (429) ou en panne ;
+  le principal reprend la main quand ses mesures sortent de la fenêtre
+"""
+import logging
+import time
+from collections import deque
+
+from config import Config
+from fast_path import ACTION_VERBS, DOOR_WORDS, LIGHT_WORDS, LOCATIONS
+from response_cache import normalize_command
+from upstream import CircuitOpenError, DeadlineExceededError, UpstreamError, get_upstream
+
+logger = logging.getLogger(__name__)
+
+# Point d'accès (disjoncteur, nouvelles tentatives) de chaque classe de requête
+ENDPOINTS = {"command": "llm", "conversation": "llm", "voice": "llm", "stt": "stt", "tts": "tts"}
+
+DEVICE_WORDS = set(ACTION_VERBS) | set(LOCATIONS) | LIGHT_WORDS | DOOR_WORDS
+
+
+def classify_request(text):
+    """Commande courte sur les appareils ("command") ou conversation ouverte ("conversation")"""
+    words = normalize_command(text or "").split()
+    if len(words) <= Config.COMMAND_MAX_WORDS and any(w in DEVICE_WORDS for w in words):
+        return "command"
+    return "conversation"
+
+
+class ModelHealth:
+    """Latences et erreurs récentes d'un modèle (fenêtre glissante dans le temps)"""
+
+    def __init__(self, window_seconds):
+        self.window_seconds = window_seconds
+        self.samples = deque()        # (instant, latence en s, succès)
+        self.rate_limited_until = 0.0
+        self.served = 0
+
+    def record(self, latency, ok):
+        self.samples.append((time.monotonic(), latency, ok))
+        self._prune()
+
+    def _prune(self):
+        horizon = time.monotonic() - self.window_seconds
+        while self.samples and self.samples[0][0] < horizon:
+            self.samples.popleft()
+
+    def rate_limited(self):
+        return time.monotonic() < self.rate_limited_until
+
+    def error_rate(self):
+        self._prune()
+        if not self.samples:
+            return 0.0
+        return sum(1 for _, _, ok in self.samples if not ok) / len(self.samples)
+
+    def latency_percentile(self, percentile):
+        self._prune()
+        ordered = sorted(latency for _, latency, ok in self.samples if ok)
+        if not ordered:
+            return None
+        return ordered[round(percentile * (len(ordered) - 1))]
+
+    def stats(self):
+        p50 = self.latency_percentile(0.5)
+        p95 = self.latency_percentile(0.95)
+        return {
+            "served": self.served,
+            "samples": len(self.samples),
+            "error_rate": round(self.error_rate(), 3),
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "rate_limited": self.rate_limited(),
+        }
+
+
+class ModelRouter:
+    """Choix du modèle d'une classe de requête, avec repli automatique"""
+
+    def __init__(self, route, models, latency_budget_ms):
+        if not models:
+            raise ValueError(f"No model configured for route '{route}'")
+        self.route = route
+        self.endpoint = ENDPOINTS.get(route, route)
+        self.models = models
+        self.latency_budget = latency_budget_ms / 1000
+        self.health = {model: ModelHealth(Config.MODEL_STATS_WINDOW_SECONDS) for model in models}
+        self.fallbacks = 0
+
+    @property
+    def primary(self):
+        """Modèle principal configuré (sert aussi de clé de cache, stable d'une requête à l'autre)"""
+        return self.models[0]
+
+    def _healthy(self, model):
+        health = self.health[model]
+        if health.rate_limited() or get_upstream(self._upstream_name(model)).breaker.state == "open":
+            return False
+        if len(health.samples) < Config.MODEL_MIN_SAMPLES:
+            return True
+        p95 = health.latency_percentile(0.95)
+        return health.error_rate() <= Config.MODEL_MAX_ERROR_RATE and (p95 is None or p95 <= self.latency_budget)
+
+    def candidates(self):
+        """Modèles à essayer dans l'ordre : les modèles sains d'abord, dans l'ordre configuré"""
+        healthy = [model for model in self.models if self._healthy(model)]
+        return healthy + [model for model in self.models if model not in healthy]
+
+    def select(self):
+        """Modèle à utiliser pour un appel sans repli (fonctions synchrones)"""
+        return self.candidates()[0]
+
+    def _upstream_name(self, model):
+        return f"{self.endpoint}:{model}"
+
+    async def call(self, attempt, hedge=True):
+        """
+        Exécute attempt(model, timeout) sur le meilleur modèle, puis sur les replis en cas d'échec
+
+        Le dernier candidat bénéficie des nouvelles tentatives de la couche upstream ;
+        les précédents échouent vite pour laisser place au repli.
+
+        Raises:
+            UpstreamError: si tous les modèles ont échoué, ou erreur non liée au modèle
+        """
+        models = self.candidates()
+        for index, model in enumerate(models):
+            last = index == len(models) - 1
+            health = self.health[model]
+            start = time.monotonic()
+            try:
+                result = await get_upstream(self._upstream_name(model)).call(
+                    lambda timeout: attempt(model, timeout), hedge=hedge, retry=last
+                )
+            except UpstreamError as e:
+                if not isinstance(e, CircuitOpenError):
+                    health.record(time.monotonic() - start, ok=False)
+                if e.status == 429:
+                    health.rate_limited_until = time.monotonic() + (e.retry_after or Config.MODEL_RATE_LIMIT_COOLDOWN)
+                if last or not self._should_fall_back(e):
+                    raise
+                self.fallbacks += 1
+                logger.warning(f"{self.route} model {model} failed ({e}), falling back to {models[index + 1]}")
+                continue
+            health.record(time.monotonic() - start, ok=True)
+            health.served += 1
+            return result
+
+    @staticmethod
+    def _should_fall_back(error):
+        """Panne, lenteur ou quota du modèle (ou modèle inconnu) : un autre modèle peut répondre"""
+        if isinstance(error, DeadlineExceededError):
+            return False
+        return error.retryable or isinstance(error, CircuitOpenError) or error.status == 404
+
+    def stats(self):
+        return {
+            "primary": self.primary,
+            "order": self.candidates(),
+            "fallbacks": self.fallbacks,
+            "latency_budget_ms": round(self.latency_budget * 1000),
+            "models": {model: health.stats() for model, health in self.health.items()},
+        }
+
+
+# Un routeur par classe de requête, créé au premier usage depuis Config.MODEL_ROUTES
+routers = {}
+
+def get_router(route):
+    """Retourne le routeur de la classe de requête"""
+    if route not in routers:
+        models = [model.strip() for model in Config.MODEL_ROUTES[route].split(",") if model.strip()]
+        routers[route] = ModelRouter(route, models, Config.MODEL_LATENCY_BUDGETS_MS[route])
+    return routers[route]
+
+def get_routers_stats():
+    return {route: router.stats() for route, router in routers.items()}
@@ -0,0 +1,100 @@
+"""
+Prompt système de l'assistant Homelinks
+La partie statique est construite une seule fois à l'import et envoyée comme
+instruction système ; seul l'état de la maison (sérialisé de façon compacte)
+et la commande de l'utilisateur changent d'une requête à l'autre
+
+En sortie compacte (LLM_COMPACT_OUTPUT_ENABLED), le modèle ne renvoie que les
+appareils modifiés et assistant_response, contraints par RESPONSE_SCHEMA ;
+le serveur fusionne ce diff dans l'état courant (home_state.merge_state_diff)
+"""
+import json
+
+from config import Config
+from home_state import DOOR_FIELDS, LIGHT_FIELDS
+
+_BASE_PROMPT = """Tu es Homelinks, l'assistant vocal de ma maison. L'état actuel de la maison t'est fourni en JSON avec chaque message.
+
+Explication :
+
+- **salon** (`boolean`): `true` : Lampes du salon allumés. `false` : Lampes du salon éteints.
+- **cuisine** (`boolean`): `true` : Lampes de la cuisine allumés. `false` : Lampes de la cuisine éteints.
+- **chambre** (`boolean`): `true` : Lampes de la chambre allumés. `false` : Lampes de la chambre éteints.
+- **exterieur** (`boolean`): `true` : Lampes extérieurs allumés. `false` : Lampes extérieurs éteints.
+- **garage** (`boolean`): `true` : Lampes du garage allumés. `false` : Lampes du garage éteints.
+- **smoke** (`boolean`): `true` : Fumée détectée. `false` : Pas de fumée détectée.
+- **presence** (`boolean`): `true` : Présence détectée. `false` : Aucune présence détectée.
+- **auth** (`boolean`): `true` : Authentification verifiée. `false` : Authentification non verifiée.
+- **door1** (`string`): `"on"` : Porte du salon ouverte. `"off"` : Porte du salon fermée.
+- **door2** (`string`): `"on"` : Porte du garage ouverte. `"off"` : Porte du garage fermée.
+- **time** (`string`): Heure actuelle sous le format `HH:MM:SS---JourMoisAnnee`.
+- **assistant_response** (`string`): Réponse textuelle de l'assistant vocal, à lire à haute voix.
+
+Tu devras mettre à jour ce JSON en fonction de mes demandes, en respectant le format attendu.
+
+Dans ce JSON, il y a une variable assistant_response. C'est dans cette variable que tu devras mettre ta réponse textuelle à mon message. Elle sera ensuite transcrite en audio par un autre outil.
+
+Tu dois analyser mes demandes pour savoir :
+
+Quels appareils allumer ou éteindre,
+Si je veux tout allumer ou tout éteindre,
+Me répondre si je pose des questions sur l'état de la maison,
+Mais aussi répondre à des questions diverses.
+Tu es un assistant chaleureux et responsable. Un membre à part entière de la famille. Au-delà de la gestion de la maison, ton rôle est aussi d'entretenir des discussions excitantes et fraternelles à travers la variable assistant_response.
+
+Tu es l'assistant savant, drole, sympathique, responsable et protecteur de la maison."""
+
+FULL_SYSTEM_PROMPT = _BASE_PROMPT + """
+
+⚠️ N'oublie jamais : tu dois toujours me renvoyer le résultat sous forme de JSON, avec les mêmes clés que l'état reçu. TOUJOURS. Et jamais de valeurs vides."""
+
+COMPACT_SYSTEM_PROMPT = _BASE_PROMPT + """
+
+⚠️ N'oublie jamais : tu dois toujours me renvoyer un JSON contenant uniquement les appareils dont l'état change (aucun si rien ne change) et assistant_response. Ne recopie jamais les appareils inchangés, les capteurs ni l'heure."""
+
+SYSTEM_PROMPT = COMPACT_SYSTEM_PROMPT if Config.LLM_COMPACT_OUTPUT_ENABLED else FULL_SYSTEM_PROMPT
+
+def _response_schema(extra_fields=()):
+    """Schéma de sortie compacte : appareils pilotables optionnels, puis les champs texte requis"""
+    properties = {field: {"type": "BOOLEAN"} for field in LIGHT_FIELDS}
+    properties.update({field: {"type": "STRING", "enum": ["on", "off"]} for field in DOOR_FIELDS})
+    text_fields = list(extra_fields) + ["assistant_response"]
+    properties.update({field: {"type": "STRING"} for field in text_fields})
+    return {
+        "type": "OBJECT",
+        "properties": properties,
+        "required": text_fields,
+        # Appareils d'abord : en streaming, les mises à jour partent avant la phrase à prononcer
+        "propertyOrdering": list(LIGHT_FIELDS + DOOR_FIELDS) + text_fields,
+    }
+
+RESPONSE_SCHEMA = _response_schema()
+VOICE_RESPONSE_SCHEMA = _response_schema(["transcription"])
+
+# Nombre moyen de caractères par token pour du français (estimation locale)
+CHARS_PER_TOKEN = 4
+
+def serialize_state(state):
+    """Sérialisation compacte de l'état (sans espaces superflus)"""
+    return json.dumps(state or {}, separators=(",", ":"), ensure_ascii=False)
+
+def build_user_prompt(user_text, state):
+    """Partie variable du prompt : état courant puis commande de l'utilisateur"""
+    return f"État actuel de la maison : {serialize_state(state)}\n\nUtilisateur: {user_text}"
+
+# Mode /voice : la commande arrive sous forme d'audio joint au message
+VOICE_INSTRUCTION = (
+    "Ma demande est dans l'enregistrement audio joint. Ajoute au JSON une clé "
+    "\"transcription\" contenant la transcription exacte en français de ce que j'ai dit."
+)
+
+def build_voice_prompt(state):
+    """Partie texte du prompt multimodal : état courant puis consigne de transcription"""
+    return f"État actuel de la maison : {serialize_state(state)}\n\n{VOICE_INSTRUCTION}"
+
+def estimate_tokens(text):
+    """Estimation rapide du nombre de tokens, sans appel à l'API"""
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+# Calculé une fois : la partie statique ne change jamais
+SYSTEM_PROMPT_TOKENS = estimate_tokens(SYSTEM_PROMPT)
@@ -0,0 +1,184 @@
+"""
+Cache des réponses IA pour les commandes vocales répétées
+La clé combine le texte normalisé (casse, accents, mots de remplissage) et
+l'état canonique de la maison. Éviction LRU + TTL en mémoire, avec un
+stockage SQLite optionnel pour survivre aux redémarrages
+"""
+import asyncio
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from config import Config
+from home_state import canonical_state
+
+# Expressions sans influence sur la commande
+# (ProcessRequest retire les apostrophes : "s'il" arrive sous la forme "sil")
+FILLER_PHRASES = (
+    "s il te plait", "s il vous plait", "sil te plait", "sil vous plait",
+    "est ce que tu peux", "est ce que tu pourrais", "tu peux", "tu pourrais", "peux tu", "pourrais tu", "je veux que tu", "je voudrais que tu",
+)
+FILLER_WORDS = {
+    "euh", "heu", "hum", "bon", "alors", "ben", "bah", "stp", "svp", "merci",
+    "hey", "salut", "ok", "okay", "dis", "homelinks", "please", "donc", "vite",
+}
+
+# Vocabulaire des commandes de la maison : seules ces requêtes sont mises en cache
+COMMAND_KEYWORDS = {
+    "allume", "allumer", "eteins", "eteindre", "eteint", "ouvre", "ouvrir",
+    "ferme", "fermer", "active", "desactive", "lumiere", "lumieres", "lampe",
+    "lampes", "porte", "portes", "salon", "cuisine", "chambre", "exterieur",
+    "garage", "tout", "toutes", "tous",
+}
+# Indices de réponses qui dépendent du moment ou de la conversation
+CONVERSATIONAL_KEYWORDS = {
+    "heure", "date", "jour", "aujourd", "demain", "hier", "meteo", "temps",
+    "blague", "raconte", "pourquoi", "comment", "qui", "histoire", "chanson",
+}
+MAX_CACHEABLE_WORDS = 12
+
+def normalize_command(text):
+    """Normalise une commande : minuscules, sans accents ni ponctuation ni remplissage"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"[^\w\s]", " ", text)
+    text = " ".join(text.split())
+    for phrase in FILLER_PHRASES:
+        text = re.sub(rf"\b{phrase}\b", " ", text)
+    return " ".join(w for w in text.split() if w not in FILLER_WORDS)
+
+def is_cacheable(normalized_text):
+    """Seules les commandes courtes sur les appareils sont mises en cache"""
+    words = normalized_text.split()
+    if not words or len(words) > MAX_CACHEABLE_WORDS:
+        return False
+    if any(w in CONVERSATIONAL_KEYWORDS for w in words):
+        return False
+    return any(w in COMMAND_KEYWORDS for w in words)
+
+
+class ResponseCache:
+    """Cache LRU + TTL des réponses du générateur IA"""
+
+    def __init__(self, max_entries=512, ttl_seconds=3600, persist_path=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.persist_path = persist_path
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._writes = 0
+        if persist_path:
+            self._db = sqlite3.connect(persist_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT, created REAL)"
+            )
+            self._db.commit()
+
+    def make_key(self, text, state):
+        """Retourne la clé de cache, ou None si la requête ne doit pas être mise en cache"""
+        normalized = normalize_command(text)
+        if not is_cacheable(normalized):
+            return None
+        raw = normalized + "\n" + canonical_state(state)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def get(self, text, state):
+        key = self.make_key(text, state)
+        if key is None:
+            self.bypassed += 1
+            return None
+
+        entry = self._entries.get(key)
+        if entry is None and self._db is not None:
+            entry = await asyncio.to_thread(self._load, key)
+            if entry is not None:
+                self._store(key, entry)
+
+        if entry is None or time.time() - entry[0] > self.ttl_seconds:
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return dict(entry[1])
+
+    async def put(self, text, state, response):
+        key = self.make_key(text, state)
+        if key is None:
+            return
+        entry = (time.time(), dict(response))
+        self._store(key, entry)
+        if self._db is not None:
+            await asyncio.to_thread(self._save, key, entry)
+
+    def _store(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _load(self, key):
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT created, value FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def _save(self, key, entry):
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created) VALUES (?, ?, ?)",
+                (key, json.dumps(entry[1], ensure_ascii=False), entry[0])
+            )
+            self._writes += 1
+            # Purge périodique des entrées expirées sur disque
+            if self._writes % 100 == 0:
+                self._db.execute(
+                    "DELETE FROM responses WHERE created < ?", (time.time() - self.ttl_seconds,)
+                )
+            self._db.commit()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "persistent": self._db is not None,
+        }
+
+    def close(self):
+        if self._db is not None:
+            with self._db_lock:
+                self._db.close()
+            self._db = None
+
+
+# Instance globale pour réutilisation
+response_cache = None
+
+def get_response_cache():
+    """Retourne le cache de réponses (singleton), None s'il est désactivé"""
+    global response_cache
+    if response_cache is None and Config.RESPONSE_CACHE_ENABLED:
+        response_cache = ResponseCache(
+            max_entries=Config.RESPONSE_CACHE_MAX_ENTRIES,
+            ttl_seconds=Config.RESPONSE_CACHE_TTL,
+            persist_path=Config.RESPONSE_CACHE_PATH or None
+        )
+    return response_cache
@@ -0,0 +1,151 @@
+"""
+Salles Socket.IO et regroupement des émissions
+- Une salle par session (audio de la réponse) et une par maison (état des appareils) :
+  un événement ne part plus vers tous les clients connectés
+- Les diffs d'état destinés à une même salle sont fusionnés pendant une courte fenêtre
+  et envoyés en un seul événement
+"""
+import asyncio
+import json
+import logging
+import secrets
+from base64 import b64decode
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+
+import itsdangerous
+
+from config import Config
+from metrics import stage
+
+logger = logging.getLogger(__name__)
+
+
+# Longueur maximale d'un identifiant reçu d'un client (jeton + signature)
+MAX_ID_LENGTH = 64
+
+
+def _signer(kind):
+    return itsdangerous.Signer(str(Config.SESSION_SECRET_KEY), salt=f"homelinks-{kind}")
+
+
+def _new_id(kind):
+    """Jeton aléatoire de 128 bits signé avec la clé de l'application : ni devinable ni forgeable"""
+    return _signer(kind).sign(secrets.token_urlsafe(16)).decode("ascii")
+
+
+def _valid_id(kind, value):
+    if not isinstance(value, str) or len(value) > MAX_ID_LENGTH:
+        return None
+    return value if _signer(kind).validate(value) else None
+
+
+def new_session_id():
+    return _new_id("session")
+
+
+def valid_session_id(value):
+    """value si c'est un identifiant de session émis par le serveur (en-tête X-Session-ID,
+    Socket.IO), None sinon"""
+    return _valid_id("session", value)
+
+
+def new_home_id():
+    return _new_id("home")
+
+
+def valid_home_id(value):
+    """value si c'est un identifiant de maison émis par le serveur, None sinon"""
+    return _valid_id("home", value)
+
+
+def session_room(session_id):
+    return f"session:{session_id}"
+
+
+def home_room(home_id):
+    return f"home:{home_id}"
+
+
+def session_from_environ(environ):
+    """session_id du cookie de session signé (SessionMiddleware), None s'il est absent ou invalide"""
+    cookie = SimpleCookie(environ.get("HTTP_COOKIE", ""))
+    if "session" not in cookie:
+        return None
+    signer = itsdangerous.TimestampSigner(str(Config.SESSION_SECRET_KEY))
+    try:
+        data = signer.unsign(cookie["session"].value.encode("utf-8"))
+        return valid_session_id(json.loads(b64decode(data)).get("session_id"))
+    except (itsdangerous.BadSignature, ValueError):
+        return None
+
+
+def client_identity(environ, auth=None):
+    """(session_id, home_id) annoncés à la connexion : auth, puis paramètres d'URL, puis cookie"""
+    auth = auth if isinstance(auth, dict) else {}
+    query = parse_qs(environ.get("QUERY_STRING", ""))
+    session_id = (
+        valid_session_id(auth.get("session_id")) or valid_session_id(query.get("session_id", [None])[0])
+        or session_from_environ(environ)
+    )
+    home_id = valid_home_id(auth.get("home_id")) or valid_home_id(query.get("home_id", [None])[0])
+    return session_id, home_id
+
+
+class DebouncedEmitter:
+    """Fusionne les événements d'état destinés à une même salle avant de les émettre"""
+
+    def __init__(self, sio, delay_seconds):
+        self.sio = sio
+        self.delay_seconds = delay_seconds
+        self._pending = {}        # (événement, salle) -> données fusionnées
+        self._flush_task = None
+        self.queued = 0
+        self.emitted = 0
+
+    def queue(self, event, data, room):
+        """
+        Programme l'émission ; le champ "state" est fusionné avec celui déjà en attente,
+        les autres champs (version...) sont remplacés par les plus récents
+        """
+        key = (event, room)
+        pending = self._pending.get(key)
+        if pending is None:
+            self._pending[key] = dict(data, state=dict(data.get("state") or {}))
+        else:
+            state = pending["state"]
+            state.update(data.get("state") or {})
+            pending.update(data, state=state)
+        self.queued += 1
+        if self._flush_task is None:
+            self._flush_task = asyncio.ensure_future(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.delay_seconds)
+        self._flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        """Émet immédiatement tout ce qui est en attente"""
+        pending, self._pending = self._pending, {}
+        for (event, room), data in pending.items():
+            try:
+                with stage("emit"):
+                    await self.sio.emit(event, data, room=room)
+                self.emitted += 1
+            except Exception as e:
+                logger.warning(f"Could not emit {event} to {room}: {e}")
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+
+    def stats(self):
+        return {
+            "queued": self.queued,
+            "emitted": self.emitted,
+            "coalesced": self.queued - self.emitted - len(self._pending),
+            "pending": len(self._pending),
+        }
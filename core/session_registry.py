@@ -0,0 +1,183 @@
+"""
+Registre des sessions : audio généré pour chaque session (réponse complète et phrases)
+Remplace les dictionnaires du processus, qui grossissaient sans fin et n'étaient pas
+visibles des autres workers : /audio peut être servi par n'importe quel worker.
+Deux implémentations interchangeables (SESSION_REGISTRY_BACKEND) :
+- "memory" : LRU + TTL en mémoire, pour un seul processus
+- "sqlite" : fichier SQLite en mode WAL partagé par les workers (et les conteneurs
+  qui montent le même volume)
+Les valeurs sont des objets JSON ; set_field met à jour un champ d'un objet de façon atomique
+"""
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from config import Config
+
+
+def audio_key(session_id):
+    """Clé du fichier audio de la dernière réponse d'une session"""
+    return f"audio:{session_id}"
+
+
+def parts_key(session_id):
+    """Clé des fichiers audio des phrases d'une réponse en streaming (numéro -> chemin)"""
+    return f"parts:{session_id}"
+
+
+class MemoryRegistry:
+    """Registre en mémoire, LRU + TTL (limité au processus courant)"""
+
+    backend = "memory"
+    shared = False
+
+    def __init__(self, max_entries=10000, ttl_seconds=86400):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()     # clé -> (écriture, valeur)
+        self.evicted = 0
+
+    async def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry[0] > self.ttl_seconds:
+            del self._entries[key]
+            self.evicted += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    async def set(self, key, value):
+        self._entries[key] = (time.time(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evicted += 1
+
+    async def set_field(self, key, field, value):
+        current = await self.get(key)
+        current = dict(current) if isinstance(current, dict) else {}
+        current[str(field)] = value
+        await self.set(key, current)
+
+    async def delete(self, key):
+        self._entries.pop(key, None)
+
+    async def stats(self):
+        return {"backend": self.backend, "entries": len(self._entries), "evicted": self.evicted}
+
+    def close(self):
+        pass
+
+
+class SQLiteRegistry:
+    """Registre partagé entre processus : SQLite en mode WAL (lectures sans bloquer les écritures)"""
+
+    backend = "sqlite"
+    shared = True
+
+    def __init__(self, path, ttl_seconds=86400):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.evicted = 0
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=5, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS registry (key TEXT PRIMARY KEY, value TEXT, updated REAL)"
+        )
+
+    async def get(self, key):
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key, value):
+        await asyncio.to_thread(self._set, key, value)
+
+    async def set_field(self, key, field, value):
+        await asyncio.to_thread(self._set_field, key, str(field), value)
+
+    async def delete(self, key):
+        await asyncio.to_thread(self._delete, key)
+
+    def _get(self, key):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM registry WHERE key = ? AND updated >= ?", (key, time.time() - self.ttl_seconds)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _set(self, key, value):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO registry (key, value, updated) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), time.time())
+            )
+            self._after_write()
+
+    def _set_field(self, key, field, value):
+        # Lecture et écriture dans la même transaction : deux workers ne s'écrasent pas
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT value FROM registry WHERE key = ? AND updated >= ?", (key, time.time() - self.ttl_seconds)
+                ).fetchone()
+                current = json.loads(row[0]) if row else {}
+                if not isinstance(current, dict):
+                    current = {}
+                current[field] = value
+                self._db.execute(
+                    "INSERT OR REPLACE INTO registry (key, value, updated) VALUES (?, ?, ?)",
+                    (key, json.dumps(current, ensure_ascii=False), time.time())
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            self._after_write()
+
+    def _delete(self, key):
+        with self._lock:
+            self._db.execute("DELETE FROM registry WHERE key = ?", (key,))
+
+    def _after_write(self):
+        # Purge périodique des entrées expirées
+        self._writes += 1
+        if self._writes % 100 == 0:
+            cursor = self._db.execute("DELETE FROM registry WHERE updated < ?", (time.time() - self.ttl_seconds,))
+            self.evicted += cursor.rowcount
+
+    async def stats(self):
+        # COUNT(*) parcourt la table : hors de la boucle, comme les autres requêtes
+        return await asyncio.to_thread(self._stats)
+
+    def _stats(self):
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM registry").fetchone()[0]
+        return {"backend": self.backend, "entries": entries, "evicted": self.evicted, "path": self.path}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+# Instance globale pour réutilisation
+session_registry = None
+
+def get_session_registry():
+    """Retourne le registre des sessions (singleton, implémentation choisie dans Config)"""
+    global session_registry
+    if session_registry is None:
+        if Config.SESSION_REGISTRY_BACKEND == "sqlite":
+            session_registry = SQLiteRegistry(Config.SESSION_REGISTRY_PATH, Config.SESSION_REGISTRY_TTL)
+        elif Config.SESSION_REGISTRY_BACKEND == "memory":
+            session_registry = MemoryRegistry(Config.SESSION_REGISTRY_MAX_ENTRIES, Config.SESSION_REGISTRY_TTL)
+        else:
+            raise ValueError(f"Unknown SESSION_REGISTRY_BACKEND: {Config.SESSION_REGISTRY_BACKEND}")
+    return session_registry
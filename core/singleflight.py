@@ -0,0 +1,83 @@
+"""
+Regroupement des appels identiques en cours (single-flight)
+Quand plusieurs clients de la maison (tablette, téléphone, web) envoient la même
+commande ou demandent la même synthèse au même moment, un seul appel à Gemini
+est lancé : les doublons attendent son résultat au lieu de refaire l'appel
+"""
+import asyncio
+import copy
+import hashlib
+
+from config import Config
+
+
+def content_key(*parts):
+    """Clé de regroupement : hash du contenu de la requête (textes ou octets)"""
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part if isinstance(part, (bytes, bytearray, memoryview)) else str(part).encode("utf-8")
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class SingleFlight:
+    """Un appel par clé à un instant donné, résultat partagé entre les appelants"""
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}          # clé -> tâche en cours
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key, fn, *args, **kwargs):
+        """
+        Exécute fn(*args, **kwargs), ou attend l'appel identique déjà en cours
+
+        L'appel tourne dans sa propre tâche : l'annulation d'un appelant (client
+        déconnecté) n'interrompt pas les autres. Chaque appelant reçoit sa propre
+        copie du résultat, qu'il peut modifier librement.
+        """
+        if not Config.SINGLE_FLIGHT_ENABLED:
+            return await fn(*args, **kwargs)
+
+        task = self._calls.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(fn(*args, **kwargs))
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.coalesced += 1
+        result = await asyncio.shield(task)
+        return copy.deepcopy(result)
+
+    def _forget(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # L'exception est transmise aux appelants ; si tous ont abandonné, elle ne doit pas être signalée
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self):
+        requests = self.calls + self.coalesced
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._calls),
+            "coalesced_rate": round(self.coalesced / requests, 3) if requests else 0.0,
+        }
+
+
+# Un regroupement par type d'appel (LLM, transcription, synthèse)
+flights = {}
+
+def get_flight(name):
+    """Retourne le regroupement nommé (créé au premier usage)"""
+    if name not in flights:
+        flights[name] = SingleFlight(name)
+    return flights[name]
+
+def get_flights_stats():
+    """Compteurs d'appels réels et de requêtes regroupées"""
+    return {name: flight.stats() for name, flight in flights.items()}
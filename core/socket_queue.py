@@ -0,0 +1,159 @@
+"""
+File de messages Socket.IO entre workers
+Avec plusieurs workers, un client n'est connecté qu'à l'un d'eux : les émissions
+(audio_ready, state_update...) passent par une file commune pour atteindre les
+clients des autres workers.
+- "redis://..." : AsyncRedisManager de python-socketio (paquet redis requis)
+- "local" : sockets Unix dans un dossier partagé, sans service externe
+  (workers d'une même machine ou conteneurs montant le même dossier)
+"""
+import asyncio
+import glob
+import logging
+import os
+import time
+
+import socketio
+from socketio.async_pubsub_manager import AsyncPubSubManager
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Taille maximale d'un message (les morceaux audio passent aussi par la file)
+MAX_MESSAGE_BYTES = 16 * 1024 * 1024
+# Intervalle de relecture du dossier des sockets (workers démarrés ou arrêtés)
+PEER_REFRESH_SECONDS = 5
+# Délai maximal de connexion / d'envoi vers un worker : un worker lent ne retarde pas les autres
+PEER_SEND_TIMEOUT = 2
+
+
+class LocalSocketManager(AsyncPubSubManager):
+    """
+    Diffusion entre workers par sockets Unix : chaque worker écoute sur
+    <dossier>/<canal>-<host_id>.sock et envoie ses messages à tous les autres
+    (messages JSON précédés de leur longueur)
+    """
+
+    name = "localsocket"
+
+    def __init__(self, directory, channel="socketio", write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.directory = directory
+        self.path = os.path.join(directory, f"{channel}-{self.host_id}.sock")
+        self._peers = {}          # chemin -> StreamWriter
+        self._peer_list = None    # sockets des autres workers (None = dossier à relire)
+        self._scanned_at = 0.0
+        self._inbox = None
+        self.published = 0
+        self.received = 0
+        self.failed = 0
+
+    def _peer_paths(self):
+        """Sockets des autres workers, relus au plus toutes les PEER_REFRESH_SECONDS secondes"""
+        now = time.monotonic()
+        if self._peer_list is None or now - self._scanned_at > PEER_REFRESH_SECONDS:
+            pattern = os.path.join(self.directory, f"{self.channel}-*.sock")
+            self._peer_list = [path for path in glob.glob(pattern) if path != self.path]
+            self._scanned_at = now
+        return self._peer_list
+
+    async def _publish(self, data):
+        payload = self.json.dumps(data).encode("utf-8")
+        frame = len(payload).to_bytes(4, "big") + payload
+        # Envois en parallèle ; chaque tâche écrit dès son démarrage (dans l'ordre des
+        # émissions), seule l'attente du tampon est concurrente
+        await asyncio.gather(*(self._send(path, frame) for path in self._peer_paths()))
+        self.published += 1
+
+    async def _send(self, path, frame):
+        writer = self._peers.get(path)
+        try:
+            if writer is None:
+                _, opened = await asyncio.wait_for(asyncio.open_unix_connection(path), PEER_SEND_TIMEOUT)
+                # Une autre émission a pu ouvrir la connexion pendant l'attente
+                writer = self._peers.setdefault(path, opened)
+                if writer is not opened:
+                    opened.close()
+            writer.write(frame)
+            await asyncio.wait_for(writer.drain(), PEER_SEND_TIMEOUT)
+        except (OSError, asyncio.TimeoutError) as e:
+            self._drop_peer(path, writer, stale=isinstance(e, ConnectionRefusedError))
+
+    def _drop_peer(self, path, writer, stale):
+        """Oublie un worker injoignable ou trop lent ; son socket est supprimé s'il n'écoute
+        plus (worker arrêté) et le dossier est relu à la prochaine émission"""
+        self.failed += 1
+        self._peers.pop(path, None)
+        self._peer_list = None
+        if writer is not None:
+            writer.close()
+        if stale:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    async def _listen(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._inbox = asyncio.Queue()
+        server = await asyncio.start_unix_server(self._receive, path=self.path)
+        try:
+            while True:
+                yield await self._inbox.get()
+        finally:
+            server.close()
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    async def _receive(self, reader, writer):
+        try:
+            while True:
+                size = int.from_bytes(await reader.readexactly(4), "big")
+                if size > MAX_MESSAGE_BYTES:
+                    logger.warning(f"Dropping oversized Socket.IO queue message ({size} bytes)")
+                    break
+                self._inbox.put_nowait(await reader.readexactly(size))
+                self.received += 1
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def stats(self):
+        return {
+            "backend": "local",
+            "peers": len(self._peer_paths()),
+            "published": self.published,
+            "received": self.received,
+            "failed": self.failed,
+        }
+
+
+def message_queue_url():
+    """File configurée ; "local" par défaut avec plusieurs workers, aucune sinon"""
+    if Config.SOCKETIO_MESSAGE_QUEUE:
+        return Config.SOCKETIO_MESSAGE_QUEUE
+    return "local" if Config.WEB_CONCURRENCY > 1 else ""
+
+
+def create_client_manager():
+    """Gestionnaire de clients Socket.IO partagé entre workers, None pour un seul processus"""
+    url = message_queue_url()
+    if not url:
+        return None
+    if url == "local":
+        return LocalSocketManager(Config.SOCKETIO_LOCAL_DIR)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return socketio.AsyncRedisManager(url)
+    raise ValueError(f"Unsupported SOCKETIO_MESSAGE_QUEUE: {url}")
+
+
+def client_manager_stats(manager):
+    if manager is None:
+        return {"backend": None}
+    if isinstance(manager, LocalSocketManager):
+        return manager.stats()
+    return {"backend": manager.name}
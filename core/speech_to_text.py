@@ -1,76 +1,108 @@
-from google import genai
 from google.genai import types
+import logging
 import os
-from dotenv import load_dotenv
-
-
-def transcribe_audio(file_path):
-    """Transcrire un fichier audio directement avec Gemini"""
-    # Charger les variables d'environnement
-    load_dotenv()
-    
-    genai_key = os.getenv("GENAI_API_KEY")
-    if not genai_key:
-        raise ValueError("GENAI_API_KEY is not set in environment variables")
-    
-    try:
-        print(f"Processing audio file: {file_path}")
-        
-        # Vérifier que le fichier existe et a du contenu
-        if not os.path.exists(file_path):
-            raise ValueError(f"Audio file not found: {file_path}")
-        
-        file_size = os.path.getsize(file_path)
-        print(f"Audio file size: {file_size} bytes")
-        
-        if file_size == 0:
-            raise ValueError("Audio file is empty")
-        
-        # Créer le client Gemini
-        client = genai.Client(api_key=genai_key)
-        
-        # Lire le fichier audio
-        with open(file_path, 'rb') as f:
-            audio_bytes = f.read()
-        
-        print(f"Audio bytes read: {len(audio_bytes)} bytes")
-        
-        # Déterminer le type MIME du fichier
-        mime_type = 'audio/webm'
-        if file_path.endswith('.wav'):
-            mime_type = 'audio/wav'
-        elif file_path.endswith('.mp3'):
-            mime_type = 'audio/mp3'
-        elif file_path.endswith('.ogg'):
-            mime_type = 'audio/ogg'
-        elif file_path.endswith('.m4a'):
-            mime_type = 'audio/aac'
-        
-        print(f"Audio file type: {mime_type}")
-        
-        # Prompt pour la transcription en français
-        prompt = """Génère une transcription exacte de ce contenu audio en français. 
+import aiofiles
+
+from clients import get_stt_client
+from config import Config
+from singleflight import content_key, get_flight
+from metrics import stage
+from workers import get_stt_pool
+from model_router import get_router
+from audio_processing import resolve_mime_type, preprocess_audio
+
+logger = logging.getLogger(__name__)
+
+# Prompt pour la transcription en français
+TRANSCRIPTION_PROMPT = """Génère une transcription exacte de ce contenu audio en français.
         Retourne uniquement la transcription textuelle, sans commentaires ni explications.
-        Si l'audio contient des commandes pour une maison connectée (lumières, portes, etc.), 
+        Si l'audio contient des commandes pour une maison connectée (lumières, portes, etc.),
         transcris exactement ce qui a été dit."""
-        
-        # Génération de la transcription avec inline audio
-        response = client.models.generate_content(
-            model='gemini-2.0-flash-exp',
-            contents=[
-                prompt,
-                types.Part.from_bytes(
-                    data=audio_bytes,
-                    mime_type=mime_type,
-                )
-            ]
+
+
+def _detect_mime_type(file_path):
+    """Déterminer le type MIME du fichier à partir de son extension"""
+    return resolve_mime_type(filename=file_path)
+
+
+def _check_audio_file(file_path):
+    """Vérifier que le fichier existe et a du contenu"""
+    if not os.path.exists(file_path):
+        raise ValueError(f"Audio file not found: {file_path}")
+
+    file_size = os.path.getsize(file_path)
+    logger.debug(f"Audio file size: {file_size} bytes")
+
+    if file_size == 0:
+        raise ValueError("Audio file is empty")
+
+
+def _build_contents(audio_bytes, mime_type):
+    return [
+        TRANSCRIPTION_PROMPT,
+        types.Part.from_bytes(
+            data=audio_bytes,
+            mime_type=mime_type,
         )
-        
+    ]
+
+
+async def transcribe_audio_async(file_path):
+    """Transcrire un fichier audio avec Gemini (client.aio, lecture via aiofiles)"""
+    logger.debug(f"Processing audio file: {file_path}")
+    _check_audio_file(file_path)
+
+    async with aiofiles.open(file_path, 'rb') as f:
+        audio_bytes = await f.read()
+
+    return await transcribe_audio_bytes_async(audio_bytes, _detect_mime_type(file_path))
+
+
+async def transcribe_audio_bytes_async(audio_data, mime_type, preprocess=True):
+    """
+    Transcrire un enregistrement déjà en mémoire, sans passer par le disque
+
+    Args:
+        audio_data (bytes | memoryview): Contenu audio
+        mime_type (str): Type MIME explicite (ex. "audio/webm")
+        preprocess (bool): False si l'audio a déjà été prétraité par l'appelant
+    """
+    if not audio_data or len(audio_data) == 0:
+        raise ValueError("Audio data is empty")
+
+    # Le SDK n'accepte que des bytes : une seule copie si on reçoit une vue
+    audio_bytes = audio_data if isinstance(audio_data, bytes) else bytes(audio_data)
+
+    # Le même enregistrement reçu plusieurs fois en même temps n'est transcrit qu'une fois
+    key = content_key(audio_bytes, mime_type, preprocess)
+    return await get_flight("stt").do(key, _transcribe_bytes_async, audio_bytes, mime_type, preprocess)
+
+
+async def _transcribe_bytes_async(audio_bytes, mime_type, preprocess):
+    client = get_stt_client()
+
+    # Décodage et rééchantillonnage sur les threads du pool STT (l'appelant y tient une place) ;
+    # le silence est rejeté ici
+    if preprocess and Config.AUDIO_PREPROCESSING_ENABLED:
+        with stage("preprocess"):
+            audio_bytes, mime_type = await get_stt_pool().offload(preprocess_audio, audio_bytes, mime_type)
+
+    try:
+        logger.debug(f"Audio bytes received: {len(audio_bytes)} bytes ({mime_type})")
+
+        contents = _build_contents(audio_bytes, mime_type)
+        # Modèle principal ou repli (Config.MODEL_ROUTES["stt"]) selon sa latence et ses erreurs récentes
+        with stage("stt"):
+            response = await get_router("stt").call(
+                lambda model, timeout: client.aio.models.generate_content(model=model, contents=contents)
+            )
+
         transcription = response.text.strip()
-        print(f"Transcription: {transcription}")
-        
+        # Longueur seulement : le contenu est la parole de l'utilisateur
+        logger.info(f"Transcription received ({len(transcription)} characters)")
+
         return transcription
 
     except Exception as e:
-        print(f"Error in transcribing audio: {e}")
+        logger.error(f"Error in transcribing audio: {e}")
         raise e
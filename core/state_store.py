@@ -0,0 +1,236 @@
+"""
+État de référence de chaque maison, conservé par le serveur
+Chaque maison (home_id) a un état versionné : les clients envoient des mises à
+jour incrémentales avec la version sur laquelle elles se basent, et une mise à
+jour construite sur une version dépassée est refusée (le client doit se resynchroniser).
+L'état est gardé en mémoire, avec un stockage SQLite optionnel pour survivre aux redémarrages
+(et, en mode partagé, pour servir plusieurs workers : chaque mise à jour est alors une
+transaction sur le fichier commun)
+"""
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+
+from config import Config
+from home_state import DOOR_FIELDS, LIGHT_FIELDS, SENSOR_FIELDS, VOLATILE_FIELDS
+
+# Champs qu'un client peut mettre à jour, avec leur validation
+CLIENT_FIELDS = {field: "bool" for field in LIGHT_FIELDS + SENSOR_FIELDS}
+CLIENT_FIELDS.update({field: "door" for field in DOOR_FIELDS})
+CLIENT_FIELDS["time"] = "str"
+
+
+class StaleStateError(ValueError):
+    """Mise à jour basée sur une version dépassée de l'état"""
+
+    def __init__(self, version, state):
+        super().__init__(f"Stale home state update (current version is {version})")
+        self.version = version
+        self.state = state
+
+
+def _field_error(field, value):
+    """Message d'erreur pour une valeur invalide, None si elle est acceptée"""
+    kind = CLIENT_FIELDS.get(field)
+    if kind is None:
+        return f"Unknown state field: {field}"
+    if kind == "bool" and not isinstance(value, bool):
+        return f"{field} must be a boolean"
+    if kind == "door" and value not in ("on", "off"):
+        return f"{field} must be \"on\" or \"off\""
+    if kind == "str" and not isinstance(value, str):
+        return f"{field} must be a string"
+    return None
+
+
+def _stable(state):
+    """État sans les champs volatils (heure...) : ils ne sont ni conservés ni versionnés"""
+    return {field: value for field, value in state.items() if field not in VOLATILE_FIELDS}
+
+
+def snapshot_changes(snapshot):
+    """Champs valides et stables de l'instantané complet d'un client (all_state), à fusionner
+    dans l'état de référence ; les champs inconnus, invalides ou volatils sont ignorés"""
+    return {field: value for field, value in _stable(snapshot).items() if _field_error(field, value) is None}
+
+
+def validate_changes(changes):
+    """Vérifie les champs et valeurs envoyés par un client (ValueError sinon)"""
+    if not isinstance(changes, dict):
+        raise ValueError("State changes must be an object")
+    for field, value in changes.items():
+        error = _field_error(field, value)
+        if error:
+            raise ValueError(error)
+
+
+def device_changes(response):
+    """Appareils pilotés dans une réponse de l'assistant (à reporter dans l'état de référence)"""
+    return {
+        field: value for field, value in response.items()
+        if field in LIGHT_FIELDS + DOOR_FIELDS and _field_error(field, value) is None
+    }
+
+
+class HomeStateStore:
+    """États versionnés des maisons, en mémoire avec persistance SQLite optionnelle"""
+
+    def __init__(self, persist_path=None, shared=False):
+        self.persist_path = persist_path
+        self.shared = bool(persist_path) and shared
+        self._homes = {}          # home_id -> (version, état)
+        self.updates = 0
+        self.rejected = 0
+        self._db = None
+        self._db_lock = threading.Lock()
+        if persist_path:
+            self._db = sqlite3.connect(persist_path, check_same_thread=False, timeout=5)
+            if self.shared:
+                self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS homes (home_id TEXT PRIMARY KEY, version INTEGER, state TEXT, updated REAL)"
+            )
+            self._db.commit()
+
+    async def get(self, home_id):
+        """
+        Returns:
+            tuple: (version, copie de l'état) ; (0, {}) pour une maison inconnue
+        """
+        if self.shared:
+            # Les autres workers écrivent dans le même fichier : la copie en mémoire n'est pas fiable
+            entry = await asyncio.to_thread(self._load, home_id)
+            return (entry[0], dict(entry[1])) if entry is not None else (0, {})
+        entry = self._homes.get(home_id)
+        if entry is None and self._db is not None:
+            entry = await asyncio.to_thread(self._load, home_id)
+            # Une écriture concurrente pendant la lecture disque reste prioritaire
+            if entry is not None:
+                entry = self._homes.setdefault(home_id, entry)
+        if entry is None:
+            return 0, {}
+        return entry[0], dict(entry[1])
+
+    async def update(self, home_id, changes, base_version=None):
+        """
+        Applique une mise à jour incrémentale
+
+        Args:
+            changes (dict): Champs modifiés
+            base_version (int): Version connue du client ; None pour ne pas vérifier
+
+        Returns:
+            tuple: (nouvelle version, état complet)
+
+        Raises:
+            StaleStateError: si base_version n'est plus la version courante
+        """
+        def apply(version, state):
+            if base_version is not None and base_version != version:
+                raise StaleStateError(version, state)
+            changed = {field: value for field, value in _stable(changes).items() if state.get(field) != value}
+            if not changed:
+                return None
+            state.update(changed)
+            return state
+
+        try:
+            return await self._apply(home_id, apply)
+        except StaleStateError:
+            self.rejected += 1
+            raise
+
+    async def _apply(self, home_id, apply):
+        """
+        Calcule et enregistre la version suivante de l'état
+
+        apply(version, état) retourne le nouvel état, None s'il ne change pas,
+        ou lève StaleStateError
+
+        Returns:
+            tuple: (version, copie de l'état)
+        """
+        if self.shared:
+            version, state, changed = await asyncio.to_thread(self._apply_shared, home_id, apply)
+            if changed:
+                self._homes[home_id] = (version, state)
+        else:
+            version, state = await self.get(home_id)
+            new_state = apply(version, state)
+            changed = new_state is not None
+            if changed:
+                version, state = version + 1, new_state
+                self._homes[home_id] = (version, state)
+                if self._db is not None:
+                    await asyncio.to_thread(self._save, home_id, version, state)
+        if changed:
+            self.updates += 1
+        return version, dict(state)
+
+    def _apply_shared(self, home_id, apply):
+        """Lecture, calcul et écriture dans une seule transaction : les workers passent l'un après l'autre"""
+        with self._db_lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute("SELECT version, state FROM homes WHERE home_id = ?", (home_id,)).fetchone()
+                version, state = (row[0], json.loads(row[1])) if row else (0, {})
+                new_state = apply(version, dict(state))
+                if new_state is not None:
+                    version, state = version + 1, new_state
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO homes (home_id, version, state, updated) VALUES (?, ?, ?, ?)",
+                        (home_id, version, json.dumps(state, ensure_ascii=False), time.time())
+                    )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return version, state, new_state is not None
+
+    def _load(self, home_id):
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT version, state FROM homes WHERE home_id = ?", (home_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def _save(self, home_id, version, state):
+        with self._db_lock:
+            # Les écritures partent dans des threads : une version plus ancienne n'écrase jamais la plus récente
+            self._db.execute(
+                "INSERT INTO homes (home_id, version, state, updated) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(home_id) DO UPDATE SET version = excluded.version, state = excluded.state, "
+                "updated = excluded.updated WHERE excluded.version > homes.version",
+                (home_id, version, json.dumps(state, ensure_ascii=False), time.time())
+            )
+            self._db.commit()
+
+    def stats(self):
+        return {
+            "homes": len(self._homes),
+            "updates": self.updates,
+            "rejected": self.rejected,
+            "persistent": self._db is not None,
+            "shared": self.shared,
+        }
+
+    def close(self):
+        if self._db is not None:
+            with self._db_lock:
+                self._db.close()
+            self._db = None
+
+
+# Instance globale pour réutilisation
+state_store = None
+
+def get_state_store():
+    """Retourne le magasin d'états des maisons (singleton)"""
+    global state_store
+    if state_store is None:
+        state_store = HomeStateStore(persist_path=Config.STATE_STORE_PATH or None, shared=Config.STATE_STORE_SHARED)
+    return state_store
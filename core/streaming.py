@@ -0,0 +1,117 @@
+"""
+Analyse incrémentale de la réponse JSON du LLM en streaming
+Les champs d'appareils sont signalés dès que leur valeur est complète, et
+assistant_response est découpé en phrases au fil de l'arrivée du texte pour
+lancer la synthèse vocale sans attendre la fin de la génération
+"""
+import json
+import re
+
+from home_state import DEVICE_FIELDS
+
+# Valeur scalaire complète d'un champ d'appareil, suivie d'un séparateur
+FIELD_PATTERN = re.compile(
+    r'"(' + "|".join(DEVICE_FIELDS) + r')"\s*:\s*(true|false|null|"(?:[^"\\]|\\.)*")\s*[,}]'
+)
+RESPONSE_START = re.compile(r'"assistant_response"\s*:\s*"')
+# Fin de phrase : ponctuation suivie d'un espace (la suite est déjà arrivée)
+SENTENCE_END = re.compile(r'[.!?…]+["»)]*\s+')
+
+
+class IncrementalResponseParser:
+    """Reçoit les morceaux de texte du modèle et produit des événements"""
+
+    def __init__(self):
+        self.buffer = ""
+        self.fields = {}
+        self.sentences = []
+        self._spoken = 0          # caractères de assistant_response déjà découpés
+        self._response_start = None
+        self._response_closed = False
+
+    def feed(self, chunk):
+        """
+        Ajoute un morceau de texte
+
+        Returns:
+            list: événements ("field", nom, valeur) et ("sentence", texte)
+        """
+        self.buffer += chunk
+        events = []
+
+        for match in FIELD_PATTERN.finditer(self.buffer):
+            name = match.group(1)
+            if name not in self.fields:
+                value = json.loads(match.group(2))
+                self.fields[name] = value
+                events.append(("field", name, value))
+
+        text = self._response_text()
+        if text is not None:
+            events.extend(("sentence", s) for s in self._split_sentences(text))
+        return events
+
+    def finish(self):
+        """
+        Termine l'analyse
+
+        Returns:
+            tuple: (réponse JSON complète, événements des phrases restantes)
+        """
+        try:
+            response = json.loads(self.buffer)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Failed to parse JSON response: {e}")
+
+        events = []
+        text = response.get("assistant_response")
+        if isinstance(text, str):
+            rest = text[self._spoken:].strip()
+            if rest:
+                self.sentences.append(rest)
+                events.append(("sentence", rest))
+            self._spoken = len(text)
+        return response, events
+
+    def _response_text(self):
+        """Texte déjà décodable de assistant_response (None s'il n'a pas commencé)"""
+        if self._response_start is None:
+            match = RESPONSE_START.search(self.buffer)
+            if match is None:
+                return None
+            self._response_start = match.end()
+
+        raw = self.buffer[self._response_start:]
+        end = 0
+        i = 0
+        while i < len(raw):
+            char = raw[i]
+            if char == "\\":
+                size = 6 if raw[i + 1:i + 2] == "u" else 2
+                if i + size > len(raw):
+                    break
+                i += size
+                end = i
+                continue
+            if char == '"':
+                self._response_closed = True
+                break
+            i += 1
+            end = i
+        return json.loads('"' + raw[:end] + '"')
+
+    def _split_sentences(self, text):
+        sentences = []
+        pending = text[self._spoken:]
+        position = 0
+        for match in SENTENCE_END.finditer(pending):
+            sentence = pending[position:match.end()].strip()
+            position = match.end()
+            if sentence:
+                sentences.append(sentence)
+        if self._response_closed and pending[position:].strip():
+            sentences.append(pending[position:].strip())
+            position = len(pending)
+        self._spoken += position
+        self.sentences.extend(sentences)
+        return sentences
@@ -1,26 +1,35 @@
+import logging
 import os
 import uuid
 import time
 import glob
 import wave
-from dotenv import load_dotenv
-from google import genai
 from google.genai import types
 
-# Charger les variables d'environnement
-load_dotenv()
+from config import Config
+from clients import get_tts_client
+from tts_cache import get_tts_cache, normalize_tts_text
+from artifact_store import get_artifact_store
+from singleflight import content_key, get_flight
+from model_router import get_router
+from workers import get_tts_pool
+
+logger = logging.getLogger(__name__)
 
 def cleanup_old_audio_files(max_age_hours=24):
-    """Nettoie les fichiers audio de plus de 24h"""
+    """Nettoie les fichiers audio de plus de 24h laissés par un processus précédent
+    (appelé une fois au démarrage ; ensuite le cache TTS et ArtifactStore gèrent l'éviction)"""
     try:
+        if Config.AUDIO_OUTPUT_DIR:
+            os.makedirs(Config.AUDIO_OUTPUT_DIR, exist_ok=True)
         current_time = time.time()
-        pattern = "audio_*.wav"  # Changé en .wav pour Gemini
+        pattern = os.path.join(Config.AUDIO_OUTPUT_DIR, "audio_*.wav")  # Changé en .wav pour Gemini
         for file_path in glob.glob(pattern):
             file_age = current_time - os.path.getctime(file_path)
             if file_age > (max_age_hours * 3600):
                 os.remove(file_path)
     except Exception as e:
-        print(f"Warning: Could not cleanup old audio files: {e}")
+        logger.warning(f"Could not cleanup old audio files: {e}")
 
 def wave_file(filename, pcm, channels=1, rate=24000, sample_width=2):
     """Sauvegarde les données PCM dans un fichier WAV"""
@@ -30,59 +39,176 @@ def wave_file(filename, pcm, channels=1, rate=24000, sample_width=2):
         wf.setframerate(rate)
         wf.writeframes(pcm)
 
-def speech(text, session_id=None, voice_name='Kore'):
-    """Génère de la parole à partir d'un texte et sauvegarde le fichier audio avec Gemini TTS"""
-    GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-    
-    if not GEMINI_API_KEY:
-        raise ValueError("GEMINI_API_KEY is not set in environment variables")
-    
+def _cache_model():
+    """Modèle principal configuré : il identifie la voix dans les clés de cache, même si un repli a servi"""
+    return get_router("tts").primary
+
+def _tts_config(voice_name):
+    """Configuration de génération audio pour Gemini TTS"""
+    return types.GenerateContentConfig(
+        response_modalities=["AUDIO"],
+        speech_config=types.SpeechConfig(
+            voice_config=types.VoiceConfig(
+                prebuilt_voice_config=types.PrebuiltVoiceConfig(
+                    voice_name=voice_name,
+                )
+            )
+        ),
+    )
+
+def _output_target(text, session_id, voice_name):
+    """Chemin de sortie et clé de cache (None si le cache est désactivé)"""
+    cache = get_tts_cache()
+    if cache is not None:
+        key = cache.make_key(text, voice_name, _cache_model())
+        return cache.path_for(key), key
+    # Génération d'un nom de fichier unique
+    unique_id = session_id or str(uuid.uuid4())[:8]
+    return os.path.join(Config.AUDIO_OUTPUT_DIR, f"audio_{unique_id}.wav"), None  # Changé en .wav
+
+def _store_audio(path, pcm, key=None):
+    """Écrit le WAV de façon atomique puis l'enregistre dans le cache"""
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    wave_file(tmp_path, pcm)
+    os.replace(tmp_path, path)
+    if key is not None:
+        get_tts_cache().add(key)
+    else:
+        get_artifact_store().register(path, "audio", size=len(pcm) + 44)
+
+def cached_speech_path(text, voice_name='Kore'):
+    """Chemin du WAV déjà synthétisé pour ce texte et cette voix, ou None"""
+    cache = get_tts_cache()
+    if cache is None or not text or not text.strip():
+        return None
+    return cache.get(cache.make_key(text, voice_name, _cache_model()))
+
+def _check_text(text):
     if not text or not text.strip():
         raise ValueError("Text cannot be empty")
+
+def _wrap_tts_error(e):
+    if "API_KEY" in str(e):
+        return Exception(f"Gemini API authentication error: {str(e)}")
+    elif "quota" in str(e).lower() or "limit" in str(e).lower():
+        return Exception(f"Gemini API quota/limit error: {str(e)}")
+    else:
+        return Exception(f"Gemini TTS request failed: {str(e)}")
+
+async def speech_async(text, session_id=None, voice_name='Kore'):
+    """Génère de la parole avec Gemini TTS (client.aio) ; l'écriture disque passe par le pool TTS"""
+    _check_text(text)
+
+    cached_path = cached_speech_path(text, voice_name)
+    if cached_path:
+        return cached_path
+
+    OUTPUT_PATH, cache_key = _output_target(text, session_id, voice_name)
+
+    # Même phrase demandée en même temps par plusieurs clients : une seule synthèse
+    key = _flight_key(text, voice_name, OUTPUT_PATH)
+    return await get_flight("tts").do(key, _synthesize_async, text, voice_name, OUTPUT_PATH, cache_key)
+
+def _flight_key(text, voice_name, output_path):
+    """Clé de regroupement d'une synthèse (le chemin distingue les sessions quand le cache est désactivé)"""
+    return content_key(normalize_tts_text(text), voice_name, _cache_model(), output_path)
+
+async def _synthesize_async(text, voice_name, output_path, cache_key):
+    client = get_tts_client()
+    try:
+        config = _tts_config(voice_name)
+        response = await get_router("tts").call(
+            lambda model, timeout: client.aio.models.generate_content(model=model, contents=text[:5000], config=config)
+        )
+
+        audio_data = response.candidates[0].content.parts[0].inline_data.data
+        await get_tts_pool().offload(_store_audio, output_path, audio_data, cache_key)
+
+        logger.debug(f"Audio stream saved successfully to {output_path}")
+        return output_path
+
+    except Exception as e:
+        raise _wrap_tts_error(e)
+
+async def speech_stream_async(text, voice_name='Kore'):
+    """
+    Synthèse vocale en streaming
     
-    # Nettoyage automatique des anciens fichiers
-    cleanup_old_audio_files()
+    Yields:
+        bytes: Morceaux PCM (16 bits, mono, 24 kHz) dès leur arrivée
+    """
+    client = get_tts_client()
+    _check_text(text)
+    config = _tts_config(voice_name)
     
-    # Génération d'un nom de fichier unique
-    unique_id = session_id or str(uuid.uuid4())[:8]
-    OUTPUT_PATH = f"audio_{unique_id}.wav"  # Changé en .wav
+    async def open_stream(model, timeout):
+        # Le flux est considéré ouvert au premier morceau : seule cette étape est réessayée
+        stream = await client.aio.models.generate_content_stream(
+            model=model,
+            contents=text[:5000],
+            config=config
+        )
+        try:
+            return stream, await stream.__anext__()
+        except StopAsyncIteration:
+            return stream, None
     
     try:
-        # Configuration du client Gemini
-        client = genai.Client(api_key=GEMINI_API_KEY)
-        
-        # Génération du contenu audio avec Gemini TTS
-        response = client.models.generate_content(
-            model="gemini-2.5-flash-preview-tts",
-            contents=text[:5000],  # Limite de longueur du texte
-            config=types.GenerateContentConfig(
-                response_modalities=["AUDIO"],
-                speech_config=types.SpeechConfig(
-                    voice_config=types.VoiceConfig(
-                        prebuilt_voice_config=types.PrebuiltVoiceConfig(
-                            voice_name=voice_name,
-                        )
-                    )
-                ),
-            )
-        )
-        
-        # Extraction des données audio
-        audio_data = response.candidates[0].content.parts[0].inline_data.data
-        
-        # Sauvegarde du fichier audio
-        wave_file(OUTPUT_PATH, audio_data)
-        
-        print(f"Audio stream saved successfully to {OUTPUT_PATH}")
-        return OUTPUT_PATH  # Retourner le chemin du fichier créé
-        
+        stream, first = await get_router("tts").call(open_stream, hedge=False)
+        if first is None:
+            return
+        for pcm in _audio_parts(first):
+            yield pcm
+        async for chunk in stream:
+            for pcm in _audio_parts(chunk):
+                yield pcm
     except Exception as e:
-        if "API_KEY" in str(e):
-            raise Exception(f"Gemini API authentication error: {str(e)}")
-        elif "quota" in str(e).lower() or "limit" in str(e).lower():
-            raise Exception(f"Gemini API quota/limit error: {str(e)}")
-        else:
-            raise Exception(f"Gemini TTS request failed: {str(e)}")
+        raise _wrap_tts_error(e)
+
+def _audio_parts(chunk):
+    """Données PCM contenues dans un morceau de réponse"""
+    if not chunk.candidates or not chunk.candidates[0].content:
+        return []
+    return [
+        part.inline_data.data
+        for part in chunk.candidates[0].content.parts or []
+        if part.inline_data and part.inline_data.data
+    ]
+
+async def speech_stream_to_file(text, session_id=None, on_chunk=None, voice_name='Kore'):
+    """
+    Synthèse en streaming : chaque morceau est transmis à on_chunk dès réception,
+    puis le fichier WAV complet est écrit pour /audio
+    
+    Args:
+        on_chunk (callable): Coroutine appelée avec (numéro, pcm) pour chaque morceau.
+            Jamais appelée si la phrase est déjà dans le cache.
+        
+    Returns:
+        str: Chemin du fichier audio créé
+    """
+    cached_path = cached_speech_path(text, voice_name)
+    if cached_path:
+        return cached_path
+    
+    OUTPUT_PATH, cache_key = _output_target(text, session_id, voice_name)
+
+    # Les doublons simultanés attendent le fichier final, sans recevoir les morceaux
+    key = _flight_key(text, voice_name, OUTPUT_PATH)
+    return await get_flight("tts").do(key, _stream_synthesize, text, voice_name, OUTPUT_PATH, cache_key, on_chunk)
+
+async def _stream_synthesize(text, voice_name, output_path, cache_key, on_chunk):
+    chunks = []
+    async for pcm in speech_stream_async(text, voice_name):
+        if on_chunk is not None:
+            await on_chunk(len(chunks), pcm)
+        chunks.append(pcm)
+
+    if not chunks:
+        raise Exception("Gemini TTS request failed: no audio received")
+    await get_tts_pool().offload(_store_audio, output_path, b"".join(chunks), cache_key)
+    logger.debug(f"Audio stream saved successfully to {output_path}")
+    return output_path
 
 # Fonction utilitaire pour lister les voix disponibles (optionnelle)
 def get_available_voices():
@@ -0,0 +1,128 @@
+"""
+Cache des synthèses vocales, adressé par contenu
+Chaque fichier WAV est nommé d'après le hash de (texte normalisé, voix, modèle) :
+une phrase déjà prononcée n'est jamais resynthétisée, et /audio sert
+directement le fichier du cache (par référence, sans copie).
+L'index en mémoire permet une éviction LRU bornée en taille sans parcourir le disque
+"""
+import hashlib
+import os
+import threading
+import unicodedata
+from collections import OrderedDict
+
+from config import Config
+
+ENCODED_EXTENSIONS = ("wav", "mp3", "opus")
+
+def normalize_tts_text(text):
+    """Normalisation qui ne change pas la prononciation (espaces, forme Unicode, apostrophes)"""
+    text = unicodedata.normalize("NFC", text).replace("’", "'")
+    return " ".join(text.split())
+
+
+class TTSCache:
+    """Stockage disque des WAV générés, avec index LRU en mémoire"""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._index = OrderedDict()   # clé -> taille en octets
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        """Reconstruit l'index une seule fois au démarrage (du moins au plus récemment utilisé)"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".wav"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_atime, name[:-4], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self.total_bytes += size
+        self.evict()
+
+    def make_key(self, text, voice_name, model):
+        raw = f"{normalize_tts_text(text)}\n{voice_name}\n{model}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def path_for(self, key):
+        return os.path.join(self.directory, f"{key}.wav")
+
+    def contains_path(self, path):
+        return os.path.dirname(os.path.abspath(path)) == os.path.abspath(self.directory)
+
+    def get(self, key):
+        """Chemin du fichier en cache, ou None"""
+        path = self.path_for(key)
+        with self._lock:
+            if key in self._index and not os.path.exists(path):
+                # Fichier évincé par un autre worker : entrée périmée, la phrase sera resynthétisée
+                self.total_bytes -= self._index.pop(key)
+                self.stale += 1
+            if key not in self._index:
+                self.misses += 1
+                return None
+            self._index.move_to_end(key)
+            self.hits += 1
+        return path
+
+    def add(self, key):
+        """Enregistre un fichier déjà écrit à path_for(key)"""
+        size = os.path.getsize(self.path_for(key))
+        with self._lock:
+            self.total_bytes += size - self._index.pop(key, 0)
+            self._index[key] = size
+        self.evict()
+
+    def evict(self):
+        """Supprime les entrées les moins récemment utilisées au-delà du quota"""
+        while True:
+            with self._lock:
+                if self.total_bytes <= self.max_bytes or len(self._index) <= 1:
+                    return
+                key, size = self._index.popitem(last=False)
+                self.total_bytes -= size
+                self.evictions += 1
+            # Le WAV et ses éventuels encodages (MP3/Opus servis par /audio)
+            for extension in ENCODED_EXTENSIONS:
+                try:
+                    os.remove(os.path.join(self.directory, f"{key}.{extension}"))
+                except OSError:
+                    pass
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._index),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "stale": self.stale,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+# Instance globale pour réutilisation
+tts_cache = None
+
+def get_tts_cache():
+    """Retourne le cache TTS (singleton), None s'il est désactivé"""
+    global tts_cache
+    if tts_cache is None and Config.TTS_CACHE_ENABLED:
+        tts_cache = TTSCache(Config.TTS_CACHE_DIR, Config.TTS_CACHE_MAX_MB * 1024 * 1024)
+    return tts_cache
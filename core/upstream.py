@@ -0,0 +1,310 @@
+"""
+Couche commune des appels à Gemini (LLM, transcription, synthèse)
+- Nouvelles tentatives sur 429/5xx/timeouts, avec attente exponentielle aléatoire
+- Un disjoncteur par point d'accès : échec immédiat tant que Gemini est dégradé
+- Requête doublée (hedging) optionnelle si la réponse tarde au-delà du p95 observé
+- Échéance propagée par requête (contextvars) au lieu d'un timeout fixe de 30 s
+"""
+import asyncio
+import contextvars
+import logging
+import random
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import httpx
+from google.genai import errors as genai_errors
+
+from config import Config
+from metrics import record_upstream
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+# Échéance absolue (time.monotonic) de la requête en cours, None = pas d'échéance
+_deadline = contextvars.ContextVar("upstream_deadline", default=None)
+
+
+class UpstreamError(ValueError):
+    """Échec d'un appel à Gemini (ValueError : traité comme un service indisponible)"""
+
+    def __init__(self, message, status=None, retryable=False, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(UpstreamError):
+    """Levée sans appel réseau tant que le disjoncteur est ouvert"""
+
+
+class DeadlineExceededError(UpstreamError):
+    """Levée quand l'échéance de la requête est atteinte avant la réponse"""
+
+
+@contextmanager
+def deadline(seconds, inherit=True):
+    """
+    Fixe l'échéance des appels faits dans ce bloc
+
+    Args:
+        seconds (float): Temps accordé à partir de maintenant
+        inherit (bool): Garder l'échéance englobante si elle est plus proche
+            (False pour une tâche de fond qui survit à la requête)
+    """
+    expires = time.monotonic() + seconds
+    current = _deadline.get()
+    if inherit and current is not None:
+        expires = min(expires, current)
+    token = _deadline.set(expires)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def time_remaining():
+    """Secondes restantes avant l'échéance courante (None si aucune)"""
+    current = _deadline.get()
+    return None if current is None else current - time.monotonic()
+
+
+def classify_error(e):
+    """Convertit une exception réseau/API en UpstreamError (avec le caractère réessayable)"""
+    if isinstance(e, UpstreamError):
+        return e
+    if isinstance(e, (httpx.TimeoutException, asyncio.TimeoutError)):
+        return UpstreamError("API request timed out", retryable=True)
+    if isinstance(e, httpx.ConnectError):
+        return UpstreamError("Failed to connect to API", retryable=True)
+    if isinstance(e, httpx.HTTPStatusError):
+        response = e.response
+        retry_after = response.headers.get("retry-after")
+        return UpstreamError(
+            describe_http_error(response),
+            status=response.status_code,
+            retryable=response.status_code in RETRYABLE_STATUS,
+            retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None
+        )
+    if isinstance(e, httpx.TransportError):
+        return UpstreamError(f"API request failed: {str(e)}", retryable=True)
+    if isinstance(e, genai_errors.APIError):
+        return UpstreamError(str(e), status=e.code, retryable=e.code in RETRYABLE_STATUS)
+    return UpstreamError(f"API request failed: {str(e)}")
+
+
+def describe_http_error(response):
+    """Message d'erreur HTTP de l'API (réponse httpx)"""
+    error_detail = ""
+    try:
+        error_json = response.json()
+        if 'error' in error_json:
+            error_detail = f": {error_json['error'].get('message', 'Unknown error')}"
+    except Exception:
+        error_detail = f": {response.text}"
+    return f"API request failed with status {response.status_code}{error_detail}"
+
+
+class CircuitBreaker:
+    """Disjoncteur : ouvert après N échecs consécutifs, une requête d'essai après le délai"""
+
+    def __init__(self, failure_threshold, reset_seconds):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self.rejected = 0
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        """Lève CircuitOpenError si l'appel doit échouer immédiatement ; retourne True pour la requête d'essai"""
+        state = self.state
+        if state == "closed":
+            return False
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        self.rejected += 1
+        retry_after = max(1, int(self.reset_seconds - (time.monotonic() - self.opened_at)))
+        raise CircuitOpenError("Gemini API temporarily unavailable (circuit open)", retryable=False, retry_after=retry_after)
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def release_probe(self):
+        """Libère la requête d'essai sans conclure (appel annulé) : la suivante pourra sonder"""
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probing or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+
+class Upstream:
+    """Politique d'appel d'un point d'accès Gemini"""
+
+    def __init__(self, name, timeout=None, max_retries=None, hedge=None):
+        self.name = name
+        self.timeout = Config.HTTP_TIMEOUT if timeout is None else timeout
+        self.max_retries = Config.UPSTREAM_MAX_RETRIES if max_retries is None else max_retries
+        self.hedge_enabled = Config.HEDGE_ENABLED if hedge is None else hedge
+        self.breaker = CircuitBreaker(Config.BREAKER_FAILURE_THRESHOLD, Config.BREAKER_RESET_SECONDS)
+        self.latencies = deque(maxlen=200)
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.hedges = 0
+        self.hedges_won = 0
+
+    def _attempt_timeout(self):
+        remaining = time_remaining()
+        if remaining is None:
+            return self.timeout
+        if remaining <= 0:
+            raise DeadlineExceededError("Request deadline exceeded before calling Gemini")
+        return min(self.timeout, remaining)
+
+    def _backoff(self, attempt, error):
+        """Attente avant la tentative suivante (jitter complet, Retry-After respecté)"""
+        delay = random.uniform(0, min(Config.UPSTREAM_BACKOFF_MAX, Config.UPSTREAM_BACKOFF_BASE * 2 ** attempt))
+        if error.retry_after:
+            delay = max(delay, min(error.retry_after, Config.UPSTREAM_BACKOFF_MAX))
+        return delay
+
+    def hedge_delay(self):
+        """p95 des latences récentes, ou None tant qu'il n'y a pas assez de mesures"""
+        if len(self.latencies) < Config.HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return max(Config.HEDGE_MIN_DELAY, ordered[round(0.95 * (len(ordered) - 1))])
+
+    async def call(self, attempt, hedge=True, retry=True):
+        """
+        Exécute attempt(timeout) avec nouvelles tentatives, disjoncteur et hedging
+
+        Args:
+            attempt (callable): Coroutine effectuant un seul appel, avec le timeout donné
+            hedge (bool): False pour un appel non idempotent ou en streaming
+            retry (bool): False pour échouer dès la première erreur
+                (le routeur de modèles préfère alors basculer sur un modèle de repli)
+
+        Raises:
+            UpstreamError: après épuisement des tentatives (ou disjoncteur ouvert)
+        """
+        self.calls += 1
+        max_retries = self.max_retries if retry else 0
+        for number in range(max_retries + 1):
+            # Échéance vérifiée avant le disjoncteur : un échec ici ne doit pas retenir la requête d'essai
+            timeout = self._attempt_timeout()
+            try:
+                probing = self.breaker.allow()
+            except CircuitOpenError:
+                record_upstream(self.name, 0.0, status="circuit_open")
+                raise
+            start = time.monotonic()
+            try:
+                if hedge and self.hedge_enabled:
+                    result = await self._hedged(attempt, timeout)
+                else:
+                    result = await asyncio.wait_for(attempt(timeout), timeout)
+            except asyncio.CancelledError:
+                # Client parti pendant la requête d'essai : sans cela le disjoncteur resterait demi-ouvert
+                if probing:
+                    self.breaker.release_probe()
+                raise
+            except Exception as e:
+                error = classify_error(e)
+                record_upstream(self.name, time.monotonic() - start, status=error.status or type(e).__name__)
+                if not error.retryable:
+                    # Gemini a répondu (requête invalide, etc.) : le service n'est pas en panne
+                    self.breaker.record_success()
+                    raise error from e
+                self.breaker.record_failure()
+                delay = self._backoff(number, error)
+                remaining = time_remaining()
+                if remaining is not None and remaining <= 0:
+                    self.failures += 1
+                    raise DeadlineExceededError(f"Request deadline exceeded ({error})", status=error.status) from e
+                if number == max_retries or (remaining is not None and remaining <= delay):
+                    self.failures += 1
+                    raise error from e
+                self.retries += 1
+                logger.warning(f"{self.name} call failed ({error}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                continue
+
+            self.breaker.record_success()
+            self.latencies.append(time.monotonic() - start)
+            record_upstream(self.name, self.latencies[-1])
+            return result
+
+    async def _hedged(self, attempt, timeout):
+        """Lance une seconde requête si la première dépasse le p95 ; la première réponse gagne"""
+        delay = self.hedge_delay()
+        primary = asyncio.ensure_future(asyncio.wait_for(attempt(timeout), timeout))
+        if delay is None or delay >= timeout:
+            return await primary
+
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+
+        self.hedges += 1
+        secondary = asyncio.ensure_future(asyncio.wait_for(attempt(timeout - delay), timeout - delay))
+        pending = {primary, secondary}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is secondary:
+                            self.hedges_won += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self):
+        ordered = sorted(self.latencies)
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "failures": self.failures,
+            "circuit": self.breaker.state,
+            "rejected": self.breaker.rejected,
+            "hedges": self.hedges,
+            "hedges_won": self.hedges_won,
+            "p50_ms": round(ordered[len(ordered) // 2] * 1000, 1) if ordered else None,
+            "p95_ms": round(ordered[round(0.95 * (len(ordered) - 1))] * 1000, 1) if ordered else None,
+        }
+
+
+# Un point d'accès par usage : une panne du TTS n'ouvre pas le disjoncteur du LLM
+upstreams = {}
+
+def get_upstream(name):
+    """Retourne la politique d'appel du point d'accès (créée au premier usage)"""
+    if name not in upstreams:
+        upstreams[name] = Upstream(name)
+    return upstreams[name]
+
+def get_upstreams_stats():
+    return {name: upstream.stats() for name, upstream in upstreams.items()}
@@ -0,0 +1,112 @@
+"""
+Détection d'activité vocale (VAD) par énergie, pour la transcription en continu
+Le client envoie des trames PCM 16 bits mono au fil de l'enregistrement ;
+l'énergie de chaque trame de 20 ms est comparée à un plancher de bruit adaptatif
+et la fin de l'énoncé est détectée après un silence prolongé, ce qui permet
+de lancer la transcription sans attendre que le client arrête l'enregistrement
+"""
+from collections import deque
+
+import numpy as np
+
+from audio_processing import frame_levels
+from config import Config
+
+
+class EnergyVAD:
+    """Segmente un flux PCM 16 bits mono en énoncés"""
+
+    def __init__(self, sample_rate=16000, frame_ms=20, margin_db=None, min_db=-50.0,
+                 silence_ms=None, min_speech_ms=200, preroll_ms=300, max_utterance_ms=None):
+        self.sample_rate = sample_rate
+        self.frame_samples = sample_rate * frame_ms // 1000
+        self.frame_bytes = self.frame_samples * 2
+        self.margin_db = Config.VAD_MARGIN_DB if margin_db is None else margin_db
+        self.min_db = min_db
+        silence_ms = Config.VAD_SILENCE_MS if silence_ms is None else silence_ms
+        max_utterance_ms = Config.VAD_MAX_UTTERANCE_MS if max_utterance_ms is None else max_utterance_ms
+        self.silence_frames = max(1, silence_ms // frame_ms)
+        self.min_speech_frames = max(1, min_speech_ms // frame_ms)
+        self.max_frames = max_utterance_ms // frame_ms
+
+        # Les trames qui précèdent la détection sont gardées pour ne pas couper le début du mot
+        self._preroll = deque(maxlen=max(self.min_speech_frames, preroll_ms // frame_ms))
+        self._pending = b""
+        self._utterance = []
+        self._speaking = False
+        self._voiced_run = 0
+        self._silence_run = 0
+        self.noise_floor_db = None
+
+    def _frame_levels(self, data):
+        """Niveau (dBFS) de chaque trame complète, calculé en une seule passe NumPy"""
+        return frame_levels(np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768.0, self.frame_samples)
+
+    def _is_voiced(self, level):
+        floor = self.noise_floor_db if self.noise_floor_db is not None else self.min_db - self.margin_db
+        return level > max(floor + self.margin_db, self.min_db)
+
+    def _update_noise_floor(self, level):
+        if self.noise_floor_db is None:
+            self.noise_floor_db = level
+        elif level < self.noise_floor_db:
+            # Descend vite, remonte lentement (un bruit de fond qui augmente reste du bruit)
+            self.noise_floor_db = 0.7 * self.noise_floor_db + 0.3 * level
+        else:
+            self.noise_floor_db = 0.98 * self.noise_floor_db + 0.02 * level
+
+    def feed(self, pcm):
+        """
+        Ajoute des échantillons PCM
+
+        Returns:
+            list: événements ("speech_start",) et ("speech_end", pcm de l'énoncé)
+        """
+        data = self._pending + pcm
+        usable = len(data) - len(data) % self.frame_bytes
+        self._pending = data[usable:]
+        if not usable:
+            return []
+
+        events = []
+        levels = self._frame_levels(data[:usable])
+        for index, level in enumerate(levels):
+            frame = data[index * self.frame_bytes:(index + 1) * self.frame_bytes]
+            voiced = self._is_voiced(level)
+
+            if not self._speaking:
+                self._preroll.append(frame)
+                if not voiced:
+                    self._voiced_run = 0
+                    self._update_noise_floor(level)
+                    continue
+                self._voiced_run += 1
+                if self._voiced_run >= self.min_speech_frames:
+                    self._speaking = True
+                    self._silence_run = 0
+                    self._utterance = list(self._preroll)
+                    self._preroll.clear()
+                    events.append(("speech_start",))
+                continue
+
+            self._utterance.append(frame)
+            self._silence_run = 0 if voiced else self._silence_run + 1
+            if self._silence_run >= self.silence_frames or len(self._utterance) >= self.max_frames:
+                events.append(("speech_end", self._end_utterance()))
+        return events
+
+    def flush(self):
+        """Termine le flux : retourne l'énoncé en cours (ou None)"""
+        if not self._speaking:
+            return None
+        self._utterance.append(self._pending)
+        self._pending = b""
+        return self._end_utterance()
+
+    def _end_utterance(self):
+        utterance = b"".join(self._utterance)
+        self._utterance = []
+        self._speaking = False
+        self._voiced_run = 0
+        self._silence_run = 0
+        return utterance
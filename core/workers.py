@@ -0,0 +1,133 @@
+"""
+Pools de workers bornés pour la transcription et la synthèse (STT, TTS)
+Chaque pool a sa propre taille et une file d'attente limitée : quand elle est
+pleine, l'appel est refusé immédiatement au lieu d'attendre un timeout.
+Les appels à Gemini sont asynchrones : une place (slot) limite les requêtes simultanées,
+et leurs étapes bloquantes (décodage, encodage, écriture audio) passent par les threads
+du pool, autant que de places, au lieu de l'exécuteur par défaut
+"""
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from config import Config
+
+
+def _in_context(fn, *args, **kwargs):
+    """fn exécutée dans le contexte de l'appelant (trace, étapes mesurées), comme asyncio.to_thread"""
+    return functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+class PoolSaturatedError(Exception):
+    """Levée quand un pool a atteint sa capacité (workers + file d'attente)"""
+
+    def __init__(self, pool_name, retry_after=1):
+        super().__init__(f"{pool_name} pool is saturated, retry later")
+        self.pool_name = pool_name
+        self.retry_after = retry_after
+
+
+class WorkerPool:
+    """Exécuteur borné avec contrôle d'admission et compteurs de charge"""
+
+    def __init__(self, name, max_workers, max_queue):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix=f"{name}-worker"
+        )
+        self._slots = asyncio.Semaphore(max_workers)
+        self.in_flight = 0
+        self.queued = 0
+        self.completed = 0
+        self.rejected = 0
+
+    async def _acquire(self):
+        if self.in_flight + self.queued >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise PoolSaturatedError(self.name)
+        self.queued += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.queued -= 1
+        self.in_flight += 1
+
+    def _release(self, *_):
+        self.in_flight -= 1
+        self.completed += 1
+        self._slots.release()
+
+    @asynccontextmanager
+    async def slot(self):
+        """Réserve une place dans le pool pour un travail déjà asynchrone"""
+        await self._acquire()
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def offload(self, fn, *args, **kwargs):
+        """Exécute une étape bloquante sur les threads du pool, pour un appelant qui tient
+        déjà une place (slot) : pas de second contrôle d'admission"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, _in_context(fn, *args, **kwargs))
+
+    async def run(self, fn, *args, **kwargs):
+        """Exécute une fonction bloquante dans le pool sans bloquer la boucle (avec contrôle d'admission)"""
+        await self._acquire()
+        loop = asyncio.get_running_loop()
+        try:
+            future = loop.run_in_executor(self._executor, _in_context(fn, *args, **kwargs))
+        except BaseException:
+            self._release()
+            raise
+        # La place n'est libérée qu'à la fin réelle du thread, même si l'appelant est annulé
+        future.add_done_callback(self._release)
+        return await future
+
+    def stats(self):
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Instances globales, créées à la demande
+_pools = {}
+
+def _get_pool(name, max_workers, max_queue):
+    pool = _pools.get(name)
+    if pool is None:
+        pool = WorkerPool(name, max_workers, max_queue)
+        _pools[name] = pool
+    return pool
+
+def get_stt_pool():
+    """Pool dédié à la transcription"""
+    return _get_pool("stt", Config.STT_WORKERS, Config.STT_MAX_QUEUE)
+
+def get_tts_pool():
+    """Pool dédié à la synthèse vocale"""
+    return _get_pool("tts", Config.TTS_WORKERS, Config.TTS_MAX_QUEUE)
+
+def get_pools_stats():
+    """Compteurs en cours / en attente de chaque pool"""
+    return {name: pool.stats() for name, pool in _pools.items()}
+
+def shutdown_pools():
+    """Arrête tous les pools (appelé à l'arrêt de l'application)"""
+    for pool in _pools.values():
+        pool.shutdown()
+    _pools.clear()
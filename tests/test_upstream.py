@@ -0,0 +1,74 @@
+"""
+Disjoncteur de core/upstream.py : une requête d'essai annulée ne bloque pas le point d'accès
+
+Usage :
+    python -m pytest tests
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "core"))
+
+from upstream import CircuitOpenError, Upstream
+
+
+def _half_open_upstream():
+    upstream = Upstream("test:model", timeout=5, max_retries=0, hedge=False)
+    upstream.breaker.reset_seconds = 0
+    upstream.breaker.opened_at = 0.0
+    assert upstream.breaker.state == "half_open"
+    return upstream
+
+
+def test_cancelled_probe_releases_half_open_breaker():
+    async def scenario():
+        upstream = _half_open_upstream()
+        started = asyncio.Event()
+
+        async def hanging(timeout):
+            started.set()
+            await asyncio.sleep(60)
+
+        probe = asyncio.ensure_future(upstream.call(hanging))
+        await started.wait()
+        probe.cancel()
+        try:
+            await probe
+        except asyncio.CancelledError:
+            pass
+
+        async def ok(timeout):
+            return "ok"
+
+        # La requête suivante sonde à nouveau et referme le disjoncteur
+        assert await upstream.call(ok) == "ok"
+        assert upstream.breaker.state == "closed"
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_call_rejected_while_probing():
+    async def scenario():
+        upstream = _half_open_upstream()
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def slow(timeout):
+            started.set()
+            await release.wait()
+            return "probe"
+
+        probe = asyncio.ensure_future(upstream.call(slow))
+        await started.wait()
+        try:
+            await upstream.call(slow)
+        except CircuitOpenError:
+            pass
+        else:
+            raise AssertionError("a second call must not pass while the probe is running")
+        release.set()
+        assert await probe == "probe"
+        assert upstream.breaker.state == "closed"
+
+    asyncio.run(scenario())